@@ -0,0 +1,458 @@
+"""A content-addressed store for the benchmark files.
+
+Each benchmark file is hashed, and every unique content is kept once,
+as a read-only blob under <bench_dir>/.store/objects/.  The benchmarks
+themselves stay ordinary plotfile directories (so the comparison tools
+read them as before), but their files are hardlinks to the blobs, and
+a manifest per version records which blob each file is.  Updating a
+benchmark then only writes the files whose contents changed, and files
+that are the same across tests are stored once.
+
+Adding a file to the store doesn't copy its data when that can be
+avoided: a blob is a reflink of the file where the filesystem allows,
+or else an in-kernel copy of it.  Blobs are never hardlinks to the file
+they came from, which belongs to the test run and may change later;
+only the benchmarks themselves are hardlinks to the blobs.  Archived
+(.tgz or .zip) output is streamed straight into the store, so it never
+has to be extracted first.
+
+Every update of a benchmark is kept as a version, named by its date and
+the source hash it was made with, under .store/versions/<name>/.  The
+benchmark in bench_dir is a symlink to the current version, so rolling
+back or pinning an older version just repoints it"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from urllib.parse import quote, unquote
+
+HASH_BLOCK = 1024 * 1024
+
+# the Linux ioctl that makes dest share the extents of source (a reflink)
+FICLONE = 0x40049409
+
+def hash_file(path):
+    """ return the sha256 hex digest of the contents of path """
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def clone_file(source, dest):
+    """ copy source to dest the cheapest way the filesystem allows: a
+        reflink, then an in-kernel copy_file_range, then a plain copy.
+        Returns whether dest is a reflink, sharing the data of source """
+
+    with open(source, "rb") as fsrc, open(dest, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError:
+            pass
+
+        try:
+            size = os.fstat(fsrc.fileno()).st_size
+            while size > 0:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size)
+                if n == 0:
+                    break
+                size -= n
+            if size == 0:
+                return False
+        except (AttributeError, OSError):
+            # no copy_file_range (before Python 3.8), or not across
+            # these filesystems
+            pass
+
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, HASH_BLOCK)
+        return False
+
+class BenchmarkStore:
+    """ the blobs and manifests of the benchmarks in bench_dir """
+
+    def __init__(self, bench_dir, log=None):
+
+        self.bench_dir = os.path.normpath(bench_dir)
+        self.log = log
+
+        self.root = os.path.join(self.bench_dir, ".store")
+        self.objects = os.path.join(self.root, "objects")
+        self.versions = os.path.join(self.root, "versions")
+
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.versions, exist_ok=True)
+
+        # what this run copied into the store, what it only had to
+        # reflink, and what was there already
+        self.bytes_written = 0
+        self.bytes_reflinked = 0
+        self.bytes_reused = 0
+
+    def blob_path(self, digest):
+        """ where the blob with this digest is kept """
+
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def version_dir(self, name):
+        """ where the versions of the benchmark name are kept """
+
+        return os.path.join(self.versions, quote(name, safe=""))
+
+    def get_index(self, name):
+        """ return the index of the versions of the benchmark name -- the
+            manifest of each version, oldest first, and which one is
+            current -- or None if the store doesn't have it """
+
+        try:
+            with open(os.path.join(self.version_dir(name), "index.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_index(self, index):
+        """ store the index of a benchmark, atomically """
+
+        vdir = self.version_dir(index["name"])
+        fd, tmp = tempfile.mkstemp(dir=vdir, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, os.path.join(vdir, "index.json"))
+
+    def names(self, test=None):
+        """ the names of the benchmarks in the store, or only those
+            written for test """
+
+        names = []
+        for d in sorted(os.listdir(self.versions)):
+            index = self.get_index(unquote(d))
+            if index is not None and (test is None or index.get("test") == test):
+                names.append(index["name"])
+        return names
+
+    def add_file(self, path):
+        """ add the contents of path to the store, if they aren't there
+            already, and return their digest.  The blob is a reflink or a
+            copy of path, so path is left as it was and may change later """
+
+        digest = hash_file(path)
+        blob = self.blob_path(digest)
+        size = os.path.getsize(path)
+
+        if os.path.isfile(blob):
+            self.bytes_reused += size
+            return digest
+
+        blob_dir = os.path.dirname(blob)
+        os.makedirs(blob_dir, exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=blob_dir, prefix=".tmp-")
+        os.close(fd)
+        try:
+            if clone_file(path, tmp):
+                self.bytes_reflinked += size
+            else:
+                self.bytes_written += size
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, blob)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        return digest
+
+    def add_stream(self, fileobj):
+        """ add the contents read from fileobj to the store, hashing them
+            as they are written, and return their digest """
+
+        h = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.objects, prefix=".tmp-")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for block in iter(lambda: fileobj.read(HASH_BLOCK), b""):
+                    h.update(block)
+                    f.write(block)
+                    size += len(block)
+
+            digest = h.hexdigest()
+            blob = self.blob_path(digest)
+            if os.path.isfile(blob):
+                self.bytes_reused += size
+                os.remove(tmp)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.chmod(tmp, 0o444)
+                os.replace(tmp, blob)
+                self.bytes_written += size
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        return digest
+
+    def link(self, digest, dest):
+        """ make dest a hardlink to a blob, or a copy of it if the
+            filesystem can't link """
+
+        try:
+            os.link(self.blob_path(digest), dest)
+        except OSError:
+            shutil.copyfile(self.blob_path(digest), dest)
+
+    def put(self, source, name, test="", source_hash="", keep=0, protect=None):
+        """ store the file or directory source as a new version of the
+            benchmark name, and make it the current one.  Only the keep
+            most recent versions are kept (all if keep is 0), besides
+            the version protect.  Returns the new version's manifest """
+
+        manifest = {"dirs": [], "files": {}, "hash": source_hash}
+
+        if os.path.isdir(source):
+            manifest["type"] = "dir"
+            for dirpath, dirnames, filenames in os.walk(source):
+                rel = os.path.relpath(dirpath, source)
+                manifest["dirs"] += [os.path.normpath(os.path.join(rel, d)) for d in dirnames]
+                for f in filenames:
+                    manifest["files"][os.path.normpath(os.path.join(rel, f))] = \
+                        self.add_file(os.path.join(dirpath, f))
+        else:
+            manifest["type"] = "file"
+            manifest["files"][os.path.basename(name)] = self.add_file(source)
+
+        return self.add_version(manifest, name, test, keep, protect)
+
+    def put_archive(self, archive, name, test="", source_hash="", keep=0, protect=None):
+        """ like put, for a file or directory archived as a tarball or a
+            zip file (e.g. plt00100.tgz), which is read once, straight
+            into the store """
+
+        manifest = {"type": "file", "dirs": [], "files": {}, "hash": source_hash}
+        roots = set()
+
+        def add(member, isdir, fileobj=None):
+            top, _, rel = os.path.normpath(member).partition(os.sep)
+            roots.add(top)
+            if len(roots) > 1:
+                raise ValueError(f"{archive} holds more than one file or directory")
+
+            if isdir:
+                manifest["type"] = "dir"
+                if rel:
+                    manifest["dirs"].append(rel)
+            elif rel:
+                manifest["type"] = "dir"
+                manifest["files"][rel] = self.add_stream(fileobj)
+            else:
+                manifest["files"][os.path.basename(name)] = self.add_stream(fileobj)
+
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as zf:
+                for info in zf.infolist():
+                    if info.is_dir():
+                        add(info.filename, True)
+                    else:
+                        with zf.open(info) as f:
+                            add(info.filename, False, f)
+        else:
+            with tarfile.open(archive, "r|*") as tf:
+                for member in tf:
+                    if member.isdir():
+                        add(member.name, True)
+                    elif member.isfile():
+                        add(member.name, False, tf.extractfile(member))
+
+        if not roots:
+            raise ValueError(f"{archive} is empty")
+
+        return self.add_version(manifest, name, test, keep, protect)
+
+    def add_version(self, manifest, name, test="", keep=0, protect=None):
+        """ check the benchmark described by manifest out as a new version
+            of the benchmark name and make it the current one """
+
+        manifest["date"] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+        index = self.get_index(name) or {"name": name, "test": test,
+                                         "current": None, "versions": []}
+
+        version = time.strftime("%Y-%m-%d_%H%M%S")
+        if manifest["hash"]:
+            version += "_" + manifest["hash"][:12]
+        taken = {v["version"] for v in index["versions"]}
+        base, n = version, 2
+        while version in taken:
+            version = f"{base}-{n}"
+            n += 1
+        manifest["version"] = version
+
+        os.makedirs(self.version_dir(name), exist_ok=True)
+        self.checkout(manifest, os.path.join(self.version_dir(name), version))
+
+        index["versions"].append(manifest)
+        self.write_index(index)
+        self.set_current(name, version)
+
+        if keep > 0:
+            self.trim(name, keep, protect)
+
+        return manifest
+
+    def find_version(self, name, version):
+        """ return the id of the most recent version of the benchmark
+            name that matches version -- its full id, a prefix of it
+            (e.g. a date), or a prefix of the source hash it was made
+            with -- or None """
+
+        index = self.get_index(name)
+        if index is None or not version:
+            return None
+
+        for v in reversed(index["versions"]):
+            if (v["version"].startswith(version) or
+                    (v["hash"] and v["hash"].startswith(version))):
+                return v["version"]
+        return None
+
+    def resolve(self, name, version=None):
+        """ the path of the benchmark name: the current version, or the
+            given one.  None if there is no such version """
+
+        if not version:
+            return os.path.join(self.bench_dir, name)
+
+        version = self.find_version(name, version)
+        if version is None:
+            return None
+        return os.path.join(self.version_dir(name), version)
+
+    def set_current(self, name, version):
+        """ point the benchmark name in bench_dir at one of its versions.
+            This swaps a symlink, so it doesn't copy anything """
+
+        index = self.get_index(name)
+        dest = os.path.join(self.bench_dir, name)
+        target = os.path.relpath(os.path.join(self.version_dir(name), version),
+                                 os.path.dirname(dest))
+
+        # benchmarks written before the store are real directories
+        if os.path.exists(dest) and not os.path.islink(dest):
+            staging = tempfile.mkdtemp(dir=os.path.dirname(dest), prefix=".staging-")
+            os.rename(dest, os.path.join(staging, "old"))
+            shutil.rmtree(staging)
+
+        tmp = os.path.join(os.path.dirname(dest), f".link-{os.getpid()}")
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        os.symlink(target, tmp)
+        os.replace(tmp, dest)
+
+        index["current"] = version
+        self.write_index(index)
+
+    def previous_version(self, name):
+        """ the version before the current one of the benchmark name """
+
+        index = self.get_index(name)
+        ids = [v["version"] for v in index["versions"]]
+        n = ids.index(index["current"])
+        return ids[n-1] if n > 0 else None
+
+    def trim(self, name, keep, protect=None):
+        """ remove all but the keep most recent versions of the benchmark
+            name, never the current one or the version protect """
+
+        index = self.get_index(name)
+        protected = {index["current"], self.find_version(name, protect)}
+
+        kept = []
+        for n, v in enumerate(index["versions"]):
+            if n >= len(index["versions"]) - keep or v["version"] in protected:
+                kept.append(v)
+            else:
+                path = os.path.join(self.version_dir(name), v["version"])
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.lexists(path):
+                    os.remove(path)
+
+        index["versions"] = kept
+        self.write_index(index)
+
+    def checkout(self, manifest, dest):
+        """ build the benchmark described by manifest at dest out of
+            links to the blobs.  It is built next to dest and renamed
+            into place, so dest is never left half-written """
+
+        parent = os.path.dirname(os.path.normpath(dest))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent, prefix=".staging-")
+
+        try:
+            if manifest["type"] == "file":
+                (digest,) = manifest["files"].values()
+                new = os.path.join(staging, "file")
+                self.link(digest, new)
+            else:
+                new = os.path.join(staging, "dir")
+                os.mkdir(new)
+                for d in sorted(manifest["dirs"]):
+                    os.makedirs(os.path.join(new, d), exist_ok=True)
+                for rel, digest in manifest["files"].items():
+                    self.link(digest, os.path.join(new, rel))
+
+            # swap the new benchmark in -- the old one goes away with
+            # the staging directory
+            if os.path.lexists(dest):
+                os.rename(dest, os.path.join(staging, "old"))
+            os.rename(new, dest)
+
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def referenced(self):
+        """ the digests of the blobs used by any version of any benchmark """
+
+        digests = set()
+        for d in os.listdir(self.versions):
+            index = self.get_index(unquote(d))
+            if index is not None:
+                for v in index["versions"]:
+                    digests.update(v["files"].values())
+        return digests
+
+    def prune(self):
+        """ remove the blobs that neither a benchmark links to nor any
+            version lists.  Returns the number of bytes freed """
+
+        referenced = self.referenced()
+
+        freed = 0
+        for dirpath, _, filenames in os.walk(self.objects):
+            for f in filenames:
+                blob = os.path.join(dirpath, f)
+                st = os.stat(blob)
+                if st.st_nlink == 1 and os.path.basename(dirpath) + f not in referenced:
+                    os.remove(blob)
+                    freed += st.st_size
+        return freed
+
+    def summary(self):
+        """ a one-line account of what this run did to the store """
+
+        return ("benchmark store: {:.1f} MB written, {:.1f} MB reflinked, "
+                "{:.1f} MB already stored").format(self.bytes_written / 1024**2,
+                                                   self.bytes_reflinked / 1024**2,
+                                                   self.bytes_reused / 1024**2)
@@ -0,0 +1,761 @@
+"""In-suite comparison of AMReX plotfiles.  The FAB data of the two
+plotfiles is streamed through mmap in fixed-size chunks, so the memory
+needed doesn't grow with the size of the plotfiles.  (A plotfile read
+from an archive can't be mapped, so each of its data files is read into
+memory instead, and a bounded number of them are kept.)
+
+There are two modes: a first-mismatch mode that stops as soon as the
+comparison is known to fail, and a full mode that finds the largest
+error of every (level, variable, box), and where in the box it is"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import fnmatch
+import mmap
+import os
+import re
+
+import numpy as np
+
+import plotfile
+
+CHUNK_BYTES = 64 * 1024 * 1024
+
+_maps = {}
+
+# the contents of the files of archived plotfiles.  The most recently
+# used are kept, up to MEMBER_CACHE_BYTES in each process, so the other
+# variables of a level don't read (and decompress) them again
+MEMBER_CACHE_BYTES = 4 * CHUNK_BYTES
+
+_members = OrderedDict()
+_members_bytes = 0
+
+def get_map(filename):
+    """ return a read-only mmap of filename, opening it only once.  For
+        a file in an archived plotfile, this is its contents instead """
+
+    if filename in _maps:
+        return _maps[filename]
+
+    if os.path.isfile(filename):
+        with open(filename, "rb") as f:
+            _maps[filename] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return _maps[filename]
+
+    data = _members.get(filename)
+    if data is None:
+        data = plotfile.read_file(filename)
+        keep_member(filename, data)
+    else:
+        _members.move_to_end(filename)
+    return data
+
+def close_maps():
+    """ close all of the mmaps opened by get_map.  The archive members
+        read stay, see keep_member """
+
+    for mm in _maps.values():
+        mm.close()
+    _maps.clear()
+
+def keep_member(filename, data):
+    """ keep the contents of an archive member for the next get_map,
+        dropping the least recently used ones to stay within
+        MEMBER_CACHE_BYTES.  A member larger than that isn't kept """
+
+    global _members_bytes
+
+    while _members and _members_bytes + len(data) > MEMBER_CACHE_BYTES:
+        _members_bytes -= len(_members.popitem(last=False)[1])
+
+    if len(data) <= MEMBER_CACHE_BYTES:
+        _members[filename] = data
+        _members_bytes += len(data)
+
+def drop_members():
+    """ drop all of the archive members kept """
+
+    global _members_bytes
+
+    _members.clear()
+    _members_bytes = 0
+
+def release_pages(mm, start, end):
+    """ tell the kernel we're done with the pages of mm in [start, end),
+        so a scan of a large file doesn't keep it all resident """
+
+    if not hasattr(mm, "madvise"):
+        return
+
+    start -= start % mmap.PAGESIZE
+    if end > start:
+        mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+def compare_component(fab_a, comp_a, fab_b, comp_b,
+                      chunk_bytes=CHUNK_BYTES, threshold=None):
+    """ compare component comp_a of fab_a to component comp_b of fab_b,
+        chunk_bytes at a time.  Returns the maximum absolute error, the
+        flat (Fortran-ordered) index where it occurs, the maximum of
+        |a|, and whether b has NaNs.  If threshold is set, we stop at
+        the first chunk with an error above it or a NaN """
+
+    map_a = get_map(fab_a.filename)
+    map_b = get_map(fab_b.filename)
+
+    ncells = fab_a.ncells
+    size_a = fab_a.itemsize
+    size_b = fab_b.itemsize
+    chunk = max(chunk_bytes // max(size_a, size_b), 1)
+
+    off_a = fab_a.component_offset(comp_a)
+    off_b = fab_b.component_offset(comp_b)
+
+    max_err = 0.0
+    max_index = 0
+    max_a = 0.0
+    has_nan = False
+
+    for start in range(0, ncells, chunk):
+        count = min(chunk, ncells - start)
+
+        a = np.frombuffer(map_a, dtype=fab_a.dtype, count=count,
+                          offset=off_a + start*size_a)
+        b = np.frombuffer(map_b, dtype=fab_b.dtype, count=count,
+                          offset=off_b + start*size_b)
+
+        err = np.abs(a - b)
+        nans = np.isnan(err)
+        if nans.any():
+            has_nan = has_nan or bool(np.isnan(b).any())
+            err[nans] = 0.0
+
+        i = int(err.argmax())
+        if err[i] > max_err:
+            max_err = float(err[i])
+            max_index = start + i
+
+        abs_a = np.abs(a)
+        if not np.isnan(abs_a).all():
+            max_a = max(max_a, float(np.nanmax(abs_a)))
+
+        del a, b, err, nans, abs_a
+        release_pages(map_a, off_a + start*size_a, off_a + (start + count)*size_a)
+        release_pages(map_b, off_b + start*size_b, off_b + (start + count)*size_b)
+
+        if threshold is not None and (has_nan or max_err > threshold):
+            break
+
+    return max_err, max_index, max_a, has_nan
+
+def level_norm(layout, comp):
+    """ the maximum of |value| of component comp over a level, from the
+        per-FAB min / max stored in its VisMF header, or None if the
+        header doesn't have them """
+
+    if layout.min_vals is None or layout.max_vals is None:
+        return None
+
+    return max(max(abs(lo[comp]), abs(hi[comp]))
+               for lo, hi in zip(layout.min_vals, layout.max_vals))
+
+class ToleranceMap:
+    """ per-variable, and optionally per-level, tolerances.  The map is
+        given as entries like
+
+            rho_* rel=1.e-10 abs=1.e-12
+            Temp@1 rel=1.e-6
+
+        separated by newlines or semicolons.  Variables are matched with
+        shell-style globs, a @level suffix restricts an entry to one
+        level, and later entries take precedence over earlier ones """
+
+    def __init__(self, spec):
+
+        self.spec = spec
+        self.rules = []
+
+        for entry in re.split(r"[\n;]", spec):
+            words = entry.split()
+            if not words:
+                continue
+
+            pattern, _, level = words[0].partition("@")
+            tols = {}
+            for word in words[1:]:
+                key, sep, value = word.partition("=")
+                if not sep or key not in ("rel", "abs"):
+                    raise ValueError(f"invalid tolerance '{word}' for {words[0]}")
+                tols[key] = float(value)
+
+            if not tols:
+                raise ValueError(f"no tolerance given for {words[0]}")
+
+            self.rules.append((re.compile(fnmatch.translate(pattern)),
+                               int(level) if level else None,
+                               tols.get("rel"), tols.get("abs")))
+
+        self._arrays = {}
+
+    def lookup(self, variables, nlevels, rel_tol=None, abs_tol=None):
+        """ return variable x level arrays of the relative and absolute
+            tolerances, using rel_tol / abs_tol where no entry applies.
+            The arrays are only built once for a set of variables """
+
+        key = (tuple(variables), nlevels, rel_tol, abs_tol)
+
+        if key not in self._arrays:
+            rel = np.full((len(variables), nlevels), rel_tol or 0.0)
+            abs_ = np.full((len(variables), nlevels), abs_tol or 0.0)
+
+            for pattern, level, rule_rel, rule_abs in self.rules:
+                match = np.array([pattern.match(v) is not None for v in variables], dtype=bool)
+                levels = slice(None) if level is None else slice(level, level + 1)
+
+                if rule_rel is not None:
+                    rel[match, levels] = rule_rel
+                if rule_abs is not None:
+                    abs_[match, levels] = rule_abs
+
+            self._arrays[key] = rel, abs_
+
+        return self._arrays[key]
+
+class PlotfileDiff:
+    """ the result of comparing plotfile A (the benchmark) to plotfile B.
+        Errors are stored as variable x level arrays, and the relative
+        error is normalized by the maximum of |A| on the level, as
+        fcompare does """
+
+    def __init__(self, variables, nlevels):
+
+        self.variables = variables
+        self.nlevels = nlevels
+
+        self.abs_err = np.zeros((len(variables), nlevels))
+        self.norm = np.zeros((len(variables), nlevels))
+        self.has_nan = np.zeros((len(variables), nlevels), dtype=bool)
+
+        # variables found in only one of the plotfiles
+        self.missing = []
+
+        # structural differences, e.g. different grids
+        self.errors = []
+
+        # (level, box, variable, lo, hi, abs error, cell) for each
+        # box with a difference
+        self.box_errors = []
+
+        # False if a first-mismatch comparison stopped early
+        self.complete = True
+
+        # True once box_errors holds every box with a difference
+        self.located = False
+
+    @classmethod
+    def from_fcompare(cls, output, returncode=0):
+        """ build the result from the table printed by fcompare.  The
+            output is only ever parsed here """
+
+        levels = []
+        values = {}
+        nans = set()
+        missing = []
+        errors = []
+
+        for line in output.splitlines():
+            words = line.split()
+            if not words:
+                continue
+
+            if "do not match" in line:
+                errors.append(line.strip())
+            elif line.strip().startswith("level ") and words[-1].isdigit():
+                levels.append(int(words[-1]))
+            elif not levels:
+                continue
+            elif "NaN present" in line:
+                values.setdefault(words[0], {})
+                nans.add((words[0], levels[-1]))
+            elif "variable not present" in line:
+                if words[0] not in missing:
+                    missing.append(words[0])
+            elif len(words) == 3:
+                try:
+                    errs = float(words[1]), float(words[2])
+                except ValueError:
+                    continue
+                values.setdefault(words[0], {})[levels[-1]] = errs
+
+        variables = list(values)
+        diff = cls(variables, max(levels, default=-1) + 1)
+        diff.missing = missing
+        diff.errors = errors
+
+        rel_err = np.zeros_like(diff.abs_err)
+        for iv, var in enumerate(variables):
+            for lev, (abs_err, rel) in values[var].items():
+                diff.abs_err[iv, lev] = abs_err
+                rel_err[iv, lev] = rel
+            for lev in range(diff.nlevels):
+                diff.has_nan[iv, lev] = (var, lev) in nans
+        diff.set_rel_err(rel_err)
+
+        # fcompare failed without telling us why in its table
+        if returncode != 0 and diff.passed():
+            diff.errors.append(f"fcompare failed with return code {returncode}")
+
+        return diff
+
+    @classmethod
+    def from_dict(cls, data):
+        """ rebuild a result stored with to_dict """
+
+        diff = cls(data["variables"], len(data["levels"]))
+        if diff.variables:
+            diff.abs_err = np.array(data["abs_err"], dtype=float)
+            diff.has_nan = np.array(data["has_nan"], dtype=bool)
+            diff.set_rel_err(np.array(data["rel_err"], dtype=float))
+        diff.missing = data["missing"]
+        diff.errors = data["errors"]
+        diff.complete = data["complete"]
+        return diff
+
+    def to_dict(self):
+        """ the errors as plain lists, for storing as JSON """
+
+        return {"variables": self.variables,
+                "levels": list(range(self.nlevels)),
+                "abs_err": self.abs_err.tolist(),
+                "rel_err": self.rel_err.tolist(),
+                "has_nan": self.has_nan.tolist(),
+                "missing": self.missing,
+                "errors": self.errors,
+                "complete": self.complete}
+
+    @property
+    def rel_err(self):
+        """ the relative errors, variable x level """
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.norm != 0.0, self.abs_err / self.norm, self.abs_err)
+
+    def set_rel_err(self, rel_err):
+        """ set the norms from known relative errors, for results that
+            weren't computed here """
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.norm = np.where(rel_err != 0.0, self.abs_err / rel_err, 0.0)
+
+    def failures(self, rel_tol=0.0, abs_tol=0.0):
+        """ a variable x level mask of the entries that fail: both the
+            absolute and relative errors exceed the tolerances, or the
+            output has NaNs """
+
+        # the tolerances are either scalars or variable x level arrays
+        rel_tol = 0.0 if rel_tol is None else rel_tol
+        abs_tol = 0.0 if abs_tol is None else abs_tol
+        return ((self.abs_err > abs_tol) & (self.rel_err > rel_tol)) | self.has_nan
+
+    def passed(self, rel_tol=0.0, abs_tol=0.0):
+        """ whether the whole comparison passes with these tolerances """
+
+        if self.errors or self.missing or not self.complete:
+            return False
+
+        return not self.failures(rel_tol, abs_tol).any()
+
+    def max_errors(self):
+        """ the largest absolute and relative errors over all variables
+            and levels """
+
+        if self.abs_err.size == 0:
+            return 0.0, 0.0
+        return float(self.abs_err.max()), float(self.rel_err.max())
+
+    def write_table(self, f):
+        """ write the error table in the same layout fcompare uses """
+
+        for msg in self.errors:
+            f.write(f" {msg}\n")
+
+        f.write(f"\n {'variable name':>24}{'absolute error':>26}{'relative error':>26}\n")
+        f.write(f" {'':24}{'(||A - B||)':>26}{'(||A - B||/||A||)':>26}\n")
+        f.write(" " + 76*"-" + "\n")
+
+        rel_err = self.rel_err
+        for lev in range(self.nlevels):
+            f.write(f" level = {lev}\n")
+            for iv, var in enumerate(self.variables):
+                if self.has_nan[iv, lev]:
+                    f.write(f" {var:<24}  < NaN present >\n")
+                else:
+                    f.write(f" {var:<24} {self.abs_err[iv, lev]:>25.10g} {rel_err[iv, lev]:>25.10g}\n")
+
+            for var in self.missing:
+                f.write(f" {var:<24}  < variable not present >\n")
+
+        f.write("\n")
+
+    def locations(self):
+        """ for each variable and level with a difference, the box and
+            cell where the error is largest """
+
+        worst = {}
+        for lev, ibox, var, lo, hi, err, cell in self.box_errors:
+            if (var, lev) not in worst or err > worst[var, lev][4]:
+                worst[var, lev] = (var, lev, (lo, hi), cell, err)
+
+        return [worst[k] for k in sorted(worst, key=lambda k: (k[1], self.variables.index(k[0])))]
+
+    def save(self, filename):
+        """ store the errors and the per-box error locations as a
+            compressed NumPy archive """
+
+        boxes = self.box_errors
+        dim = len(boxes[0][3]) if boxes else 1
+
+        np.savez_compressed(filename,
+                            variables=np.array(self.variables),
+                            abs_err=self.abs_err,
+                            rel_err=self.rel_err,
+                            has_nan=self.has_nan,
+                            box_level=np.array([b[0] for b in boxes], dtype=int),
+                            box_index=np.array([b[1] for b in boxes], dtype=int),
+                            box_variable=np.array([b[2] for b in boxes], dtype=str),
+                            box_lo=np.array([b[3] for b in boxes], dtype=int).reshape(-1, dim),
+                            box_hi=np.array([b[4] for b in boxes], dtype=int).reshape(-1, dim),
+                            box_abs_err=np.array([b[5] for b in boxes], dtype=float),
+                            box_cell=np.array([b[6] for b in boxes], dtype=int).reshape(-1, dim))
+
+def load_locations(filename):
+    """ read back the worst error location of each variable and level
+        from a diff archive written by PlotfileDiff.save """
+
+    with np.load(filename) as npz:
+        data = {key: npz[key].tolist() for key in npz.files}
+
+    diff = PlotfileDiff(data["variables"], len(data["abs_err"][0]))
+    for i, lev in enumerate(data["box_level"]):
+        diff.box_errors.append((lev, data["box_index"][i], data["box_variable"][i],
+                                tuple(data["box_lo"][i]), tuple(data["box_hi"][i]),
+                                data["box_abs_err"][i], tuple(data["box_cell"][i])))
+
+    return diff.locations()
+
+def compare_boxes(task):
+    """ compare one variable on a range of the boxes of a level -- the
+        unit of work that is handed out to the process pool """
+
+    lev, iv, comp_a, comp_b, fabs, threshold, chunk_bytes = task
+
+    results = []
+    try:
+        for ibox, fab_a, fab_b in fabs:
+            err, index, max_a, has_nan = compare_component(
+                fab_a, comp_a, fab_b, comp_b, chunk_bytes, threshold)
+            results.append((ibox, fab_a.box, err, index, max_a, has_nan))
+
+            if threshold is not None and (has_nan or err > threshold):
+                break
+    finally:
+        close_maps()
+
+    return lev, iv, threshold, results
+
+def reduce_results(diff, result):
+    """ fold the output of compare_boxes into diff.  Returns True if a
+        first-mismatch comparison can stop """
+
+    lev, iv, threshold, results = result
+    failed = False
+
+    for ibox, (lo, hi), err, index, max_a, has_nan in results:
+        diff.abs_err[iv, lev] = max(diff.abs_err[iv, lev], err)
+        diff.norm[iv, lev] = max(diff.norm[iv, lev], max_a)
+        diff.has_nan[iv, lev] = diff.has_nan[iv, lev] or has_nan
+
+        if err > 0.0:
+            shape = tuple(h - l + 1 for l, h in zip(lo, hi))
+            cell = np.unravel_index(index, shape, order="F")
+            diff.box_errors.append((lev, ibox, diff.variables[iv], lo, hi, err,
+                                    tuple(int(l + c) for l, c in zip(lo, cell))))
+
+        if threshold is not None and (has_nan or err > threshold):
+            failed = True
+
+    return failed
+
+def compare_plotfiles(file_a, file_b, rel_tol=0.0, abs_tol=0.0, tolerance_map=None,
+                      first_mismatch=False, chunk_bytes=CHUNK_BYTES, jobs=1):
+    """ compare plotfile file_b to the benchmark file_a and return a
+        PlotfileDiff.  With first_mismatch, stop as soon as the
+        comparison is known to fail with the given tolerances (rel_tol
+        and abs_tol, overridden by a ToleranceMap if one is given).
+        With jobs > 1, the (level, variable, box range) pieces of the
+        comparison are spread over a pool of that many processes """
+
+    header_a = plotfile.get_header(file_a)
+    header_b = plotfile.get_header(file_b)
+
+    if header_a is None or header_b is None:
+        diff = PlotfileDiff([], 0)
+        diff.errors.append("unable to read the plotfile headers")
+        return diff
+
+    variables = [v for v in header_a.variables if v in header_b.variables]
+    diff = PlotfileDiff(variables, header_a.nlevels)
+    diff.missing = [v for v in header_a.variables + header_b.variables
+                    if v not in variables]
+
+    if header_a.nlevels != header_b.nlevels:
+        diff.errors.append("number of levels do not match")
+        return diff
+
+    if first_mismatch and diff.missing:
+        diff.complete = False
+        return diff
+
+    if tolerance_map is not None:
+        rel_tol, abs_tol = tolerance_map.lookup(variables, diff.nlevels, rel_tol, abs_tol)
+    else:
+        rel_tol = np.full(diff.abs_err.shape, rel_tol or 0.0)
+        abs_tol = np.full(diff.abs_err.shape, abs_tol or 0.0)
+
+    tasks = []
+    for lev in range(header_a.nlevels):
+
+        layout_a = plotfile.get_level_layout(file_a, lev)
+        layout_b = plotfile.get_level_layout(file_b, lev)
+
+        if layout_a is None or layout_b is None:
+            diff.errors.append(f"unable to read the data of level {lev}")
+            return diff
+
+        if layout_a.boxes != layout_b.boxes:
+            diff.errors.append("grids do not match")
+            return diff
+
+        fabs = list(zip(range(len(layout_a.fabs)), layout_a.fabs, layout_b.fabs))
+        nper = -(-len(fabs) // max(jobs, 1))
+
+        for iv, var in enumerate(variables):
+            comp_a = header_a.variables.index(var)
+            comp_b = header_b.variables.index(var)
+
+            # the error above which this variable fails, if we can
+            # know it before having seen all of the data
+            threshold = None
+            if first_mismatch:
+                norm = level_norm(layout_a, comp_a)
+                rel, abs_ = rel_tol[iv, lev], abs_tol[iv, lev]
+                if rel == 0.0:
+                    threshold = abs_
+                elif norm is not None:
+                    threshold = max(abs_, rel * (norm or 1.0))
+
+            for n in range(0, len(fabs), nper):
+                tasks.append((lev, iv, comp_a, comp_b, fabs[n:n+nper], threshold, chunk_bytes))
+
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(compare_boxes, task) for task in tasks]
+            for future in as_completed(futures):
+                if reduce_results(diff, future.result()):
+                    diff.complete = False
+                    for f in futures:
+                        f.cancel()
+                    break
+
+        # the pieces finish in any order
+        diff.box_errors.sort(key=lambda b: (b[0], variables.index(b[2]), b[1]))
+
+    else:
+        try:
+            for task in tasks:
+                if reduce_results(diff, compare_boxes(task)):
+                    diff.complete = False
+                    break
+        finally:
+            drop_members()
+
+    diff.located = diff.complete
+    return diff
+
+class ParticleData:
+    """ memory maps of the particle data of one particle type in a
+        plotfile, one (ints, reals) pair per grid.  Nothing is read
+        until a component is asked for """
+
+    def __init__(self, pfile, ptype, header):
+
+        self.header = header
+        nint = len(header.int_components)
+        nreal = len(header.real_components)
+
+        self.blocks = []
+        files = {}
+        for lev, which, count, offset in header.grids:
+            if count == 0:
+                continue
+
+            fname = os.path.join(pfile, ptype, f"Level_{lev}", f"DATA_{which:05d}")
+            if os.path.isfile(fname):
+                ints = np.memmap(fname, dtype="<i4", mode="r",
+                                 offset=offset, shape=(count, nint))
+                reals = np.memmap(fname, dtype=header.real_type, mode="r",
+                                  offset=offset + ints.nbytes, shape=(count, nreal))
+            else:
+                # in an archived plotfile
+                if fname not in files:
+                    files[fname] = plotfile.read_file(fname)
+                data = files[fname]
+                ints = np.frombuffer(data, dtype="<i4", count=count*nint,
+                                     offset=offset).reshape(count, nint)
+                reals = np.frombuffer(data, dtype=header.real_type, count=count*nreal,
+                                      offset=offset + ints.nbytes).reshape(count, nreal)
+            self.blocks.append((ints, reals))
+
+    def component(self, name):
+        """ one component of every particle, in the order they're stored """
+
+        if name in self.header.int_components:
+            i, which = self.header.int_components.index(name), 0
+        else:
+            i, which = self.header.real_components.index(name), 1
+
+        if not self.blocks:
+            return np.zeros(0)
+        return np.concatenate([block[which][:, i] for block in self.blocks])
+
+    def order(self):
+        """ the permutation that sorts the particles by (cpu, id), which
+            identifies a particle independently of where it's stored """
+
+        return np.lexsort((self.component("particle_id"), self.component("particle_cpu")))
+
+class ParticleDiff:
+    """ the result of comparing one particle type of plotfile A (the
+        benchmark) to plotfile B, as arrays over the particle components.
+        The relative error is normalized by the maximum of |A| """
+
+    def __init__(self, ptype, components):
+
+        self.ptype = ptype
+        self.components = components
+
+        self.abs_err = np.zeros(len(components))
+        self.norm = np.zeros(len(components))
+        self.has_nan = np.zeros(len(components), dtype=bool)
+
+        # e.g. different numbers of particles
+        self.errors = []
+
+    @classmethod
+    def from_dict(cls, data):
+        """ rebuild a result stored with to_dict """
+
+        pdiff = cls(data["ptype"], data["components"])
+        pdiff.abs_err = np.array(data["abs_err"], dtype=float)
+        pdiff.norm = np.array(data["norm"], dtype=float)
+        pdiff.has_nan = np.array(data["has_nan"], dtype=bool)
+        pdiff.errors = data["errors"]
+        return pdiff
+
+    def to_dict(self):
+        """ the errors as plain lists, for storing as JSON """
+
+        return {"ptype": self.ptype,
+                "components": self.components,
+                "abs_err": self.abs_err.tolist(),
+                "norm": self.norm.tolist(),
+                "has_nan": self.has_nan.tolist(),
+                "errors": self.errors}
+
+    @property
+    def rel_err(self):
+        """ the relative error of each component """
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.norm != 0.0, self.abs_err / self.norm, self.abs_err)
+
+    def failures(self, rel_tol=0.0, abs_tol=0.0):
+        """ a mask of the components that fail, with the same rule as
+            PlotfileDiff.failures """
+
+        rel_tol = 0.0 if rel_tol is None else rel_tol
+        abs_tol = 0.0 if abs_tol is None else abs_tol
+        return ((self.abs_err > abs_tol) & (self.rel_err > rel_tol)) | self.has_nan
+
+    def passed(self, rel_tol=0.0, abs_tol=0.0):
+        """ whether all of the components pass with these tolerances """
+
+        return not self.errors and not self.failures(rel_tol, abs_tol).any()
+
+    def write_table(self, f):
+        """ write the per-component errors as a text table """
+
+        f.write(f"\n particle type: {self.ptype}\n")
+        for msg in self.errors:
+            f.write(f" {msg}\n")
+
+        f.write(f" {'component':>24}{'absolute error':>26}{'relative error':>26}\n")
+        f.write(" " + 76*"-" + "\n")
+
+        rel_err = self.rel_err
+        for i, comp in enumerate(self.components):
+            if self.has_nan[i]:
+                f.write(f" {comp:<24}  < NaN present >\n")
+            else:
+                f.write(f" {comp:<24} {self.abs_err[i]:>25.10g} {rel_err[i]:>25.10g}\n")
+
+        f.write("\n")
+
+def compare_particles(file_a, file_b, ptype):
+    """ compare the particles of type ptype in plotfile file_b to those
+        in the benchmark file_a, matching particles by (cpu, id).
+        Returns a ParticleDiff, or raises ValueError if the particle
+        data is in a format we can't read """
+
+    header_a = plotfile.get_particle_header(file_a, ptype)
+    header_b = plotfile.get_particle_header(file_b, ptype)
+
+    if header_a is None or header_b is None:
+        pdiff = ParticleDiff(ptype, [])
+        pdiff.errors.append(f"no {ptype} particles found")
+        return pdiff
+
+    components = header_a.real_components + header_a.int_components[2:]
+    pdiff = ParticleDiff(ptype, components)
+
+    if (header_a.nparticles != header_b.nparticles or
+        header_a.real_components != header_b.real_components or
+        header_a.int_components != header_b.int_components):
+        pdiff.errors.append("Particle data headers do not agree")
+        return pdiff
+
+    data_a = ParticleData(file_a, ptype, header_a)
+    data_b = ParticleData(file_b, ptype, header_b)
+
+    order_a = data_a.order()
+    order_b = data_b.order()
+
+    for key in ("particle_cpu", "particle_id"):
+        if not np.array_equal(data_a.component(key)[order_a], data_b.component(key)[order_b]):
+            pdiff.errors.append("particle ids do not match")
+            return pdiff
+
+    # one component at a time, so only a couple of arrays of
+    # nparticles are ever in memory
+    for i, comp in enumerate(components):
+        a = data_a.component(comp)[order_a].astype(float)
+        b = data_b.component(comp)[order_b].astype(float)
+        if a.size == 0:
+            continue
+
+        err = np.abs(a - b)
+        pdiff.has_nan[i] = bool(np.isnan(b).any())
+        pdiff.abs_err[i] = float(np.nanmax(err)) if not np.isnan(err).all() else 0.0
+        pdiff.norm[i] = float(np.nanmax(np.abs(a))) if not np.isnan(a).all() else 0.0
+
+    return pdiff
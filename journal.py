@@ -0,0 +1,106 @@
+"""A journal of the progress of a test suite run, so that an interrupted
+run can be resumed.
+
+The journal is a file of JSON records in the run's test directory,
+appended to (and synced) as each test gets through a stage: built, ran,
+compared, archived and finally reported.  The first record describes
+the run itself -- the tests in it and the git hashes of the repos -- so
+that a resumed run tests the same code.  The reported record carries
+the state of the Test object, which is what the run report needs of a
+test that doesn't have to be run again.
+
+Tests processed in parallel append to the same file; every record is a
+single write to a file opened with O_APPEND, so they don't interleave."""
+
+import json
+import os
+
+JOURNAL_FILE = "journal.jsonl"
+
+STAGES = ("built", "ran", "compared", "archived", "reported")
+
+def json_state(obj):
+    """ the attributes of obj that can be stored as JSON """
+
+    state = {}
+    for key, value in obj.__dict__.items():
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        state[key] = value
+    return state
+
+class Journal:
+    """ the journal of the run in test_dir """
+
+    def __init__(self, test_dir):
+
+        self.path = os.path.join(test_dir, JOURNAL_FILE)
+
+    def exists(self):
+        """ is there a journal to resume from? """
+
+        return os.path.isfile(self.path)
+
+    def write(self, record):
+        """ append record, and make sure it is on disk """
+
+        data = (json.dumps(record) + "\n").encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def start(self, suite, tests, update_time):
+        """ record the run: its tests and what it is testing """
+
+        self.write({"run": suite.test_dir,
+                    "tests": [t.name for t in tests],
+                    "update_time": update_time,
+                    "repos": {k: str(r.hash_current).strip() for k, r in suite.repos.items()}})
+
+    def record(self, test, stage):
+        """ record that test got through stage -- with its state, once it
+            is reported """
+
+        record = {"test": test.name, "stage": stage}
+        if stage == "reported":
+            record["state"] = json_state(test)
+        self.write(record)
+
+    def read(self):
+        """ return the run record and, by test name, the last stage each
+            test reached and its stored state.  A record cut short by
+            the crash is ignored, and ended, so that the next record
+            starts on a line of its own """
+
+        run = None
+        progress = {}
+
+        with open(self.path) as jf:
+            lines = jf.readlines()
+
+        if lines and not lines[-1].endswith("\n"):
+            with open(self.path, "a") as jf:
+                jf.write("\n")
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            if "run" in record:
+                if run is None:
+                    run = record
+                continue
+
+            entry = progress.setdefault(record["test"], {"stage": None, "state": None})
+            entry["stage"] = record["stage"]
+            if "state" in record:
+                entry["state"] = record["state"]
+
+        return run, progress
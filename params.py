@@ -249,6 +249,17 @@ def load_params(args):
                 if opt == "keyword":
                     mytest.keywords = [k.strip() for k in value.split(",")]
 
+                elif opt == "tolerance_map":
+                    try:
+                        mytest.tolerance_map = str(value)
+                    except ValueError as err:
+                        mysuite.log.warn(f"invalid tolerance_map for test {sec}: {err}")
+                        invalid = 1
+
+                elif opt == "benchmark_version":
+                    # a hash prefix may look like a number
+                    mytest.benchmark_version = cp.get(sec, opt).strip()
+
                 else:
                     # generic setting of the object attribute
                     setattr(mytest, opt, value)
@@ -0,0 +1,482 @@
+"""This module reads the metadata of AMReX plotfiles directly from their
+Header files, so the suite doesn't have to spawn the fboxinfo / fvarnames
+tools for it.
+
+A plotfile can also be an archive of one (e.g. plt00100.tgz), whose files
+are read straight out of the archive when they're needed, instead of
+extracting it to disk.  A path inside the archive is written as if the
+archive were the plotfile directory, e.g. plt00100.tgz/Level_0/Cell_H.
+A .zip archive compresses each file separately and ends with an index of
+them, so any one file can be read without reading what comes before it"""
+
+import io
+import os
+import re
+import tarfile
+import zipfile
+
+ARCHIVE_EXTENSIONS = (".tgz", ".tar.gz", ".tar", ".zip")
+MAX_OPEN_ARCHIVES = 16
+
+def archive_plotfile(pfile, archive_format="tgz"):
+    """ archive the plotfile directory pfile as pfile.tgz (a gzipped
+        tarball) or pfile.zip (an indexed archive).  Returns the name
+        of the archive """
+
+    if archive_format == "zip":
+        archive = f"{pfile}.zip"
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for dirpath, dirnames, filenames in os.walk(pfile):
+                for name in sorted(dirnames) + sorted(filenames):
+                    zf.write(os.path.join(dirpath, name))
+    else:
+        archive = f"{pfile}.tgz"
+        with tarfile.open(archive, "w:gz") as tar:
+            tar.add(pfile)
+
+    return archive
+
+def strip_archive_extension(path):
+    """ the name of the plotfile archived as path """
+
+    for ext in ARCHIVE_EXTENSIONS:
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return path
+
+def member_path(name):
+    """ the path of an archive member relative to the plotfile, which is
+        the first component of the name """
+
+    return os.path.normpath(name).partition(os.sep)[2]
+
+class PlotfileArchive:
+    """ a plotfile archived as a tarball or a zip file.  A tarball is
+        read forward only as far as needed to find a member, so looking
+        up the Header or job_info doesn't decompress the whole thing.
+        A zip file is looked up in its index """
+
+    def __init__(self, archive):
+
+        self.archive = archive
+        self.members = {}
+
+        if zipfile.is_zipfile(archive):
+            self.zip = zipfile.ZipFile(archive)
+            self.tar = None
+            for info in self.zip.infolist():
+                if not info.is_dir():
+                    self.members[member_path(info.filename)] = info
+            self.scanned = True
+        else:
+            self.zip = None
+            self.tar = tarfile.open(archive)
+            self.scanned = False
+
+    def find(self, member):
+        """ the TarInfo / ZipInfo of member, a path relative to the
+            plotfile, or None if the archive doesn't have it """
+
+        member = os.path.normpath(member)
+        while member not in self.members and not self.scanned:
+            info = self.tar.next()
+            if info is None:
+                self.scanned = True
+            elif info.isfile():
+                self.members[member_path(info.name)] = info
+        return self.members.get(member)
+
+    def open(self, member):
+        """ a binary file object reading member """
+
+        info = self.find(member)
+        if info is None:
+            raise FileNotFoundError(f"{member} not found in {self.archive}")
+        if self.zip is not None:
+            return self.zip.open(info)
+        return self.tar.extractfile(info)
+
+    def close(self):
+        """ close the archive """
+
+        if self.zip is not None:
+            self.zip.close()
+        else:
+            self.tar.close()
+
+_archive_cache = {}
+
+def split_archive_path(path):
+    """ split path into the archive it lies in and the path of the file
+        within the plotfile, or return (None, path) for a plain file """
+
+    path = os.path.normpath(path)
+    if os.path.exists(path):
+        return None, path
+
+    head, member = path, ""
+    while head and os.path.dirname(head) != head:
+        if head.endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(head):
+            return head, member
+        head, base = os.path.split(head)
+        member = os.path.join(base, member) if member else base
+    return None, path
+
+def get_archive(archive):
+    """ the PlotfileArchive of archive, opened only once per modification.
+        A forked process opens its own, as they'd share the file offset """
+
+    archive = os.path.abspath(archive)
+    key = (os.getpid(), os.path.getmtime(archive))
+
+    cached = _archive_cache.get(archive)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    if cached is not None:
+        cached[1].close()
+        del _archive_cache[archive]
+
+    # don't keep every archive of a coverage scan open
+    while len(_archive_cache) >= MAX_OPEN_ARCHIVES:
+        oldest = next(iter(_archive_cache))
+        _archive_cache.pop(oldest)[1].close()
+    pa = PlotfileArchive(archive)
+    _archive_cache[archive] = (key, pa)
+    return pa
+
+def open_file(path, binary=False):
+    """ open path for reading -- a plain file, or a file in an archived
+        plotfile """
+
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return open(path, "rb" if binary else "r")
+
+    try:
+        f = get_archive(archive).open(member)
+    except (tarfile.TarError, zipfile.BadZipFile) as err:
+        raise OSError(f"unable to read {archive}: {err}") from None
+    return f if binary else io.TextIOWrapper(f)
+
+def read_file(path):
+    """ the contents of path, which may be a file in an archived plotfile """
+
+    with open_file(path, binary=True) as f:
+        return f.read()
+
+def get_mtime(path):
+    """ the modification time of path, or of the archive it lies in """
+
+    archive, path = split_archive_path(path)
+    return os.path.getmtime(archive or path)
+
+def is_plotfile(path):
+    """ is path a plotfile directory or an archived plotfile? """
+
+    return os.path.isdir(path) or (path.endswith(ARCHIVE_EXTENSIONS) and
+                                   os.path.isfile(path))
+
+BOX_PAT = re.compile(r"\(\(([-\d,\s]+)\)\s*\(([-\d,\s]+)\)\s*\(([-\d,\s]+)\)\)")
+
+def parse_boxes(line):
+    """ return the list of (lo, hi) index tuples of the boxes written as
+        ((lo) (hi) (type)) in line """
+
+    boxes = []
+    for lo, hi, _ in BOX_PAT.findall(line):
+        boxes.append((tuple(int(v) for v in lo.split(",")),
+                      tuple(int(v) for v in hi.split(","))))
+    return boxes
+
+class PlotfileHeader:
+    """ the contents of a plotfile's Header """
+
+    def __init__(self, lines):
+
+        self.version = lines[0].strip()
+
+        nvars = int(lines[1])
+        self.variables = [v.strip() for v in lines[2:2+nvars]]
+
+        n = 2 + nvars
+        self.dim = int(lines[n])
+        self.time = float(lines[n+1])
+        self.finest_level = int(lines[n+2])
+        self.prob_lo = [float(v) for v in lines[n+3].split()]
+        self.prob_hi = [float(v) for v in lines[n+4].split()]
+        self.ref_ratio = [int(v) for v in lines[n+5].split()]
+        self.domains = parse_boxes(lines[n+6])
+        self.level_steps = [int(v) for v in lines[n+7].split()]
+
+        n += 8
+        self.dx = []
+        for _ in range(self.nlevels):
+            self.dx.append([float(v) for v in lines[n].split()])
+            n += 1
+
+        self.coord_sys = int(lines[n])
+        n += 2   # skip the boundary width
+
+        # the per-level grid information
+        self.ngrids = []
+        self.level_dirs = []
+        for _ in range(self.nlevels):
+            ngrids = int(lines[n].split()[1])
+            self.ngrids.append(ngrids)
+            n += 2 + ngrids * self.dim
+            self.level_dirs.append(lines[n].strip())
+            n += 1
+
+    @property
+    def nlevels(self):
+        """ the number of AMR levels in the plotfile """
+
+        return self.finest_level + 1
+
+    @property
+    def nvars(self):
+        """ the number of variables in the plotfile """
+
+        return len(self.variables)
+
+FAB_PAT = re.compile(r"FAB \(\((\d+), \(([\d ]+)\)\),\((\d+), \(([\d ]+)\)\)\)")
+FAB_ON_DISK_PAT = re.compile(r"FabOnDisk:\s+(\S+)\s+(\d+)")
+
+class Fab:
+    """ where the data of one FAB lives on disk.  Each component is
+        stored contiguously, in Fortran order over the box """
+
+    def __init__(self, filename, offset):
+
+        self.filename = filename
+        self.offset = offset     # of the FAB header
+
+        # filled by read_fab_header
+        self.data_offset = 0
+        self.dtype = ""
+        self.itemsize = 0
+        self.box = ((), ())
+        self.ncomp = 0
+
+    @property
+    def ncells(self):
+        """ the number of cells in the FAB's box """
+
+        n = 1
+        for lo, hi in zip(*self.box):
+            n *= hi - lo + 1
+        return n
+
+    def component_offset(self, comp):
+        """ the file offset of the start of component comp """
+
+        return self.data_offset + comp * self.ncells * self.itemsize
+
+def read_fab_header(fab):
+    """ fill in the data layout of fab from the header line that
+        precedes its data, e.g.
+        FAB ((8, (64 11 52 0 1 12 0 1023)),(8, (8 7 6 5 4 3 2 1)))((0,0) (7,7) (0,0)) 3 """
+
+    with open_file(fab.filename, binary=True) as ff:
+        ff.seek(fab.offset)
+        line = ff.readline(4096).decode("ascii")
+
+    match = FAB_PAT.match(line)
+    if match is None:
+        raise ValueError(f"unrecognized FAB header in {fab.filename}")
+
+    nbytes = int(match.group(3))
+    order = match.group(4).split()
+    fab.itemsize = nbytes
+
+    # the byte order is given as the position of each byte, so "8 7 ... 1"
+    # is little endian
+    if order[0] == "1" and nbytes > 1:
+        fab.dtype = f">f{nbytes}"
+    else:
+        fab.dtype = f"<f{nbytes}"
+
+    rest = line[match.end():]
+    fab.box = parse_boxes(rest)[0]
+    fab.ncomp = int(rest.split()[-1])
+    fab.data_offset = fab.offset + len(line.encode("ascii"))
+
+class LevelLayout:
+    """ the boxes of one level and where their FABs are stored, read
+        from the level's VisMF header (e.g. Level_0/Cell_H) """
+
+    def __init__(self, plotfile, level_dir):
+
+        base = os.path.join(plotfile, level_dir)
+        with open_file(base + "_H") as hf:
+            text = hf.read()
+        lines = text.splitlines()
+
+        self.ncomp = int(lines[2])
+
+        # the BoxArray is written between "(nboxes 0" and ")"
+        start = text.index("(", text.index(lines[3]) + len(lines[3]))
+        end = text.index("\n)", start)
+        self.boxes = parse_boxes(text[start:end])
+
+        level_path = os.path.dirname(base)
+        self.fabs = [Fab(os.path.join(level_path, fname), int(offset))
+                     for fname, offset in FAB_ON_DISK_PAT.findall(text)]
+
+        # the per-FAB min / max of each component follow the FAB list
+        self.min_vals = None
+        self.max_vals = None
+        tail = text[text.rindex("FabOnDisk:"):].splitlines()[1:]
+        blocks = [t for t in "\n".join(tail).split("\n\n") if t.strip()]
+        try:
+            self.min_vals, self.max_vals = [parse_min_max(b, len(self.fabs), self.ncomp)
+                                            for b in blocks[:2]]
+        except ValueError:
+            pass
+
+        for fab in self.fabs:
+            read_fab_header(fab)
+
+def parse_min_max(block, nfabs, ncomp):
+    """ parse a "nfabs,ncomp" block of per-FAB values from a VisMF header """
+
+    lines = block.strip().splitlines()
+    if [int(v) for v in lines[0].split(",")] != [nfabs, ncomp]:
+        raise ValueError("unexpected min / max block")
+
+    vals = []
+    for line in lines[1:1+nfabs]:
+        vals.append([float(v) for v in line.split(",") if v.strip()])
+    return vals
+
+class ParticleHeader:
+    """ the contents of the Header of one particle type in a plotfile,
+        e.g. plt00010/particles/Header """
+
+    def __init__(self, lines):
+
+        # only these formats are known to store the positions apart from
+        # the real components named in the header -- anything else is left
+        # to the external particle_compare
+        self.version = lines[0].strip()
+        if not self.version.startswith(("Version_Two_Dot_Zero_", "Version_Two_Dot_One_")):
+            raise ValueError(f"unsupported particle format {self.version}")
+
+        if self.version.endswith("_single"):
+            self.real_type = "<f4"
+        else:
+            self.real_type = "<f8"
+
+        self.dim = int(lines[1])
+
+        nreal = int(lines[2])
+        self.real_names = [v.strip() for v in lines[3:3+nreal]]
+        n = 3 + nreal
+
+        nint = int(lines[n])
+        self.int_names = [v.strip() for v in lines[n+1:n+1+nint]]
+        n += 1 + nint
+
+        self.is_checkpoint = int(lines[n])
+        self.nparticles = int(lines[n+1])
+        self.next_id = int(lines[n+2])
+        self.finest_level = int(lines[n+3])
+        n += 4
+
+        ngrids = [int(lines[n+lev]) for lev in range(self.finest_level + 1)]
+        n += self.finest_level + 1
+
+        # (level, data file number, particle count, offset) of each grid
+        self.grids = []
+        for lev, ng in enumerate(ngrids):
+            for _ in range(ng):
+                which, count, offset = (int(v) for v in lines[n].split())
+                self.grids.append((lev, which, count, offset))
+                n += 1
+
+    @property
+    def real_components(self):
+        """ the names of the real data of each particle, positions first """
+
+        return ["particle_position_" + "xyz"[i] for i in range(self.dim)] + self.real_names
+
+    @property
+    def int_components(self):
+        """ the names of the integer data of each particle, id and cpu first """
+
+        return ["particle_id", "particle_cpu"] + self.int_names
+
+_header_cache = {}
+_layout_cache = {}
+
+def get_header(plotfile):
+    """ return the PlotfileHeader for plotfile, or None if it can't be
+        read.  Headers are cached by path and modification time, so a
+        plotfile is only ever parsed once """
+
+    header_file = os.path.join(os.path.abspath(plotfile), "Header")
+
+    try:
+        mtime = get_mtime(header_file)
+    except OSError:
+        return None
+
+    cached = _header_cache.get(header_file)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open_file(header_file) as hf:
+            header = PlotfileHeader(hf.readlines())
+    except (OSError, ValueError, IndexError):
+        return None
+
+    _header_cache[header_file] = (mtime, header)
+    return header
+
+def get_level_layout(plotfile, level):
+    """ return the LevelLayout of level in plotfile, or None if it can't
+        be read.  Like the headers, layouts are cached by path and
+        modification time """
+
+    header = get_header(plotfile)
+    if header is None or level >= header.nlevels:
+        return None
+
+    vismf_header = os.path.join(os.path.abspath(plotfile), header.level_dirs[level] + "_H")
+
+    try:
+        mtime = get_mtime(vismf_header)
+    except OSError:
+        return None
+
+    cached = _layout_cache.get(vismf_header)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        layout = LevelLayout(os.path.abspath(plotfile), header.level_dirs[level])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    _layout_cache[vismf_header] = (mtime, layout)
+    return layout
+
+def get_particle_header(plotfile, ptype):
+    """ return the ParticleHeader of particle type ptype in plotfile, or
+        None if there isn't one.  Raises ValueError if the particles
+        are stored in a format we can't read """
+
+    header_file = os.path.join(plotfile, ptype, "Header")
+
+    try:
+        with open_file(header_file) as hf:
+            lines = hf.readlines()
+    except OSError:
+        return None
+
+    try:
+        return ParticleHeader(lines)
+    except IndexError:
+        raise ValueError(f"unable to parse {header_file}") from None
@@ -78,7 +78,7 @@ def reg_test_gc(argv):
     os.chdir(suite.webTopDir)
     validDirs = []
     for d in os.listdir(suite.webTopDir):
-        if (d.startswith("20") and os.path.isdir(d)):
+        if (test_util.is_run_dir(d) and os.path.isdir(d)):
             statusFile = d + '/' + d + '.status'
             if (os.path.isfile(statusFile)):
                 validDirs.append(d)
@@ -116,7 +116,7 @@ def reg_test_gc(argv):
     os.chdir(testDirs)
     validDirs = []
     for d in os.listdir(testDirs):
-        if (d.startswith("20") and os.path.isdir(d)):
+        if (test_util.is_run_dir(d) and os.path.isdir(d)):
             validDirs.append(d)
     validDirs.sort()
     validDirs.reverse()
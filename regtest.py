@@ -13,6 +13,7 @@ This test framework understands source based out of the AMReX framework.
 
 
 import email
+import hashlib
 import os
 import shutil
 import smtplib
@@ -21,52 +22,32 @@ import tarfile
 import time
 import re
 import json
+import zipfile
 
+import benchmark_store
+import comparison
+import journal
 import params
+import plotfile
+import scheduler
 import test_util
 import test_report as report
 import test_coverage as coverage
 
-safe_flags = ['TEST', 'USE_CUDA', 'USE_ACC', 'USE_MPI', 'USE_OMP', 'DEBUG', 'USE_GPU']
-
-def _check_safety(cs):
-    try:
-        flag = cs.split("=")[0]
-        return flag in safe_flags
-    except:
-        return False
-
-def check_realclean_safety(compile_strings):
-    split_strings = compile_strings.strip().split()
-    return all([_check_safety(cs) for cs in split_strings])
-
 def find_build_dirs(tests):
     """ given the list of test objects, find the set of UNIQUE build
         directories.  Note if we have the useExtraBuildDir flag set """
 
     build_dirs = []
-    last_safe = False
 
     for obj in tests:
 
         # keep track of the build directory and which source tree it is
         # in (e.g. the extra build dir)
-
-        # first find the list of unique build directories
         dir_pair = (obj.buildDir, obj.extra_build_dir)
         if build_dirs.count(dir_pair) == 0:
             build_dirs.append(dir_pair)
 
-        # re-make all problems that specify an extra compile argument,
-        # and the test that comes after, just to make sure that any
-        # unique build commands are seen.
-        obj.reClean = 1
-        if check_realclean_safety(obj.addToCompileString):
-            if last_safe:
-                obj.reClean = 0
-            else:
-                last_safe = True
-
     return build_dirs
 
 def cmake_setup(suite):
@@ -123,10 +104,10 @@ def cmake_setup(suite):
 
 
 
-def copy_benchmarks(old_full_test_dir, full_web_dir, test_list, bench_dir, log):
+def copy_benchmarks(old_full_test_dir, full_web_dir, test_list, store, keep, log):
     """ copy the last plotfile output from each test in test_list
-        into the benchmark directory.  Also copy the diffDir, if
-        it exists """
+        into the benchmark store as a new version, keeping the keep
+        most recent ones.  Also copy the diffDir, if it exists """
     td = os.getcwd()
 
     for t in test_list:
@@ -137,36 +118,34 @@ def copy_benchmarks(old_full_test_dir, full_web_dir, test_list, bench_dir, log):
             p = t.get_compare_file(output_dir=wd)
         elif not t.outputFile == "":
             if not os.path.exists(t.outputFile):
-                p = test_util.get_recent_filename(wd, t.outputFile, ".tgz")
+                p = test_util.get_recent_filename(wd, t.outputFile, plotfile.ARCHIVE_EXTENSIONS)
             else:
                 p = t.outputFile
         else:
             if not os.path.exists(t.compareFile):
-                p = test_util.get_recent_filename(wd, t.compareFile, ".tgz")
+                p = test_util.get_recent_filename(wd, t.compareFile, plotfile.ARCHIVE_EXTENSIONS)
             else:
                 p = t.compareFile
 
         if p != "" and p is not None:
-            if p.endswith(".tgz"):
-                try:
-                    tg = tarfile.open(name=p, mode="r:gz")
-                    tg.extractall()
-                except:
-                    log.fail("ERROR extracting tarfile")
-                else:
-                    tg.close()
-                idx = p.rfind(".tgz")
-                p = p[:idx]
+            archive = None
+            if p.endswith(plotfile.ARCHIVE_EXTENSIONS):
+                archive = p
+                p = plotfile.strip_archive_extension(p)
 
             store_file = p
             if not t.outputFile == "":
                 store_file = f"{t.name}_{p}"
 
-            try:
-                shutil.rmtree(f"{bench_dir}/{store_file}")
-            except:
-                pass
-            shutil.copytree(p, f"{bench_dir}/{store_file}")
+            if archive is not None:
+                # stream it into the store rather than extracting it here
+                try:
+                    store.put_archive(archive, store_file, test=t.name,
+                                      keep=keep, protect=t.benchmark_version)
+                except (OSError, ValueError, tarfile.TarError, zipfile.BadZipFile):
+                    log.fail(f"ERROR reading archive {archive}")
+            else:
+                store.put(p, store_file, test=t.name, keep=keep, protect=t.benchmark_version)
 
             with open(f"{full_web_dir}/{t.name}.status", 'w') as cf:
                 cf.write(f"benchmarks updated.  New file:  {store_file}\n")
@@ -177,66 +156,167 @@ def copy_benchmarks(old_full_test_dir, full_web_dir, test_list, bench_dir, log):
 
         # is there a diffDir to copy too?
         if not t.diffDir == "":
-            diff_dir_bench = f"{bench_dir}/{t.name}_{t.diffDir}"
-            if os.path.isdir(diff_dir_bench):
-                shutil.rmtree(diff_dir_bench)
-                shutil.copytree(t.diffDir, diff_dir_bench)
+            try:
+                store.put(t.diffDir, f"{t.name}_{t.diffDir}", test=t.name,
+                          keep=keep, protect=t.benchmark_version)
+            except OSError:
+                log.warn(f"file {t.diffDir} not found")
             else:
-                if os.path.isdir(t.diffDir):
-                    try:
-                        shutil.copytree(t.diffDir, diff_dir_bench)
-                    except OSError:
-                        log.warn(f"file {t.diffDir} not found")
-                    else:
-                        log.log(f"new diffDir: {t.name}_{t.diffDir}")
-                else:
-                    try:
-                        shutil.copy(t.diffDir, diff_dir_bench)
-                    except OSError:
-                        log.warn(f"file {t.diffDir} not found")
-                    else:
-                        log.log(f"new diffDir: {t.name}_{t.diffDir}")
+                log.log(f"new diffDir: {t.name}_{t.diffDir}")
 
         os.chdir(td)
 
-def get_variable_names(suite, plotfile):
-    """ uses fvarnames to extract the names of variables
-        stored in a plotfile """
+    store.prune()
+    log.log(store.summary())
+
+def store_benchmark(suite, test, source, name):
+    """ store source as a new version of the benchmark name of test,
+        made with the current source hash """
+
+    source_hash = str(suite.repos["source"].hash_current or "").strip()
+    suite.get_benchmark_store().put(source, name, test=test.name, source_hash=source_hash,
+                                    keep=suite.benchmarkVersionsKept,
+                                    protect=test.benchmark_version)
+
+def benchmark_versions(suite, test_list, rollback=None):
+    """ list the stored versions of the benchmarks of the tests in
+        test_list, or, if rollback is given, make that version (or the
+        one before the current, for "previous") the current one """
+
+    store = suite.get_benchmark_store()
+
+    for t in test_list:
+        names = store.names(test=t.name)
+        if not names:
+            suite.log.warn(f"no stored benchmarks for {t.name}")
+            continue
+
+        for name in names:
+            if rollback is None:
+                index = store.get_index(name)
+                suite.log.log(f"{name}:")
+                suite.log.indent()
+                for v in reversed(index["versions"]):
+                    current = "*" if v["version"] == index["current"] else " "
+                    suite.log.log(f"{current} {v['version']}  ({v['date']}, {len(v['files'])} files)")
+                suite.log.outdent()
+                continue
+
+            if rollback == "previous":
+                version = store.previous_version(name)
+            else:
+                version = store.find_version(name, rollback)
+
+            if version is None:
+                suite.log.warn(f"no version {rollback} of {name}")
+            else:
+                store.set_current(name, version)
+                suite.log.log(f"{name} is now version {version}")
+
+def get_variable_names(suite, pfile):
+    """ return the names of the variables stored in a plotfile, read
+        from its Header """
+
+    header = plotfile.get_header(pfile)
+    if header is None:
+        suite.log.warn(f"unable to read the Header of {pfile}")
+        return set()
+
+    return set(header.variables)
+
+def compare_builtin(suite, test, bench_file, output_file):
+    """ compare output_file to bench_file with the suite's own plotfile
+        differ and append an fcompare-style table to the test's
+        comparison file.  Returns the PlotfileDiff """
+
+    chunk_bytes = int(suite.compare_chunk_size * 1024 * 1024)
+
+    # stop at the first difference beyond the tolerances -- that is the
+    # verdict.  The data is only scanned in full when the differences
+    # are to be located, which needs every box anyway
+    diff = comparison.compare_plotfiles(bench_file, output_file,
+                                        rel_tol=test.tolerance, abs_tol=test.abs_tolerance,
+                                        tolerance_map=test.tolerance_map,
+                                        first_mismatch=True, chunk_bytes=chunk_bytes,
+                                        jobs=suite.compare_jobs)
+    if not diff.complete and suite.locate_differences:
+        diff = comparison.compare_plotfiles(bench_file, output_file,
+                                            rel_tol=test.tolerance, abs_tol=test.abs_tolerance,
+                                            tolerance_map=test.tolerance_map,
+                                            chunk_bytes=chunk_bytes, jobs=suite.compare_jobs)
+
+    with open(test.comparison_outfile, "a") as cf:
+        cf.write(f"plotfile comparison: {bench_file} {output_file}\n")
+        diff.write_table(cf)
+        if not diff.complete:
+            cf.write(" the comparison stopped at the first difference beyond the tolerances\n\n")
+
+    return diff
+
+def locate_differences(suite, test, bench_file, output_file, diff=None):
+    """ store where output_file differs from bench_file, box by box, as
+        a NumPy archive for the test's web page """
 
-    # Run fvarnames
-    command = "{} {}".format(suite.tools["fvarnames"], plotfile)
-    sout, serr, ierr = test_util.run(command)
+    suite.log.log("locating the differences...")
 
-    if ierr != 0:
-        return serr
+    if diff is None or not diff.located:
+        diff = comparison.compare_plotfiles(
+            bench_file, output_file, chunk_bytes=int(suite.compare_chunk_size * 1024 * 1024),
+            jobs=suite.compare_jobs)
 
-    # Split on whitespace
-    tvars = re.split(r"\s+", sout)[2:-1:2]
+    if diff.box_errors:
+        diff.save(f"{test.name}.diff.npz")
+        test.has_diff_locations = True
 
-    return set(tvars)
+def compare_particles(suite, test, bench_file, output_file):
+    """ compare each of the test's particle types in-process, falling
+        back to particle_compare for data we can't read.  Returns True
+        if they all pass """
 
-def process_comparison_results(stdout, tvars, test):
-    """ checks the output of fcompare (passed in as stdout)
-        to determine whether all relative errors fall within
-        the test's tolerance """
+    successful = True
 
-    # Alternative solution - just split on whitespace
-    # and iterate through resulting list, attempting
-    # to convert the next two items to floats. Assume
-    # the current item is a variable if successful.
+    for ptype in test.particleTypes.strip().split():
 
-    # Split on whitespace
-    regex = r"\s+"
-    words = re.split(regex, stdout)
+        try:
+            pdiff = comparison.compare_particles(bench_file, output_file, ptype)
 
-    indices = filter(lambda i: words[i] in tvars, range(len(words)))
+        except (OSError, ValueError) as err:
+            suite.log.warn(f"unable to read the {ptype} particles: {err}")
 
-    for i in indices:
-        _, abs_err, rel_err = words[i: i + 3]
-        if abs(test.tolerance) < abs(float(rel_err)) and test.abs_tolerance < abs(float(abs_err)):
-            return False
+            command = "{}".format(suite.tools["particle_compare"])
 
-    return True
+            if test.particle_tolerance is not None:
+                command += " --rel_tol {}".format(test.particle_tolerance)
+
+            if test.particle_abs_tolerance is not None:
+                command += " --abs_tol {}".format(test.particle_abs_tolerance)
+
+            command += " {} {} {}".format(bench_file, output_file, ptype)
+
+            _, _, ierr = test_util.run(command,
+                                       outfile=test.comparison_outfile, store_command=True)
+
+            successful = successful and not ierr
+            continue
+
+        with open(test.comparison_outfile, "a") as cf:
+            pdiff.write_table(cf)
+
+        test.particle_comparisons.append(pdiff)
+        successful = successful and pdiff.passed(test.particle_tolerance,
+                                                 test.particle_abs_tolerance)
+
+    return successful
+
+def save_comparison(test):
+    """ store the structured comparison results of a test as JSON """
+
+    results = {"mesh": None, "particles": [p.to_dict() for p in test.particle_comparisons]}
+    if test.comparison is not None:
+        results["mesh"] = test.comparison.to_dict()
+
+    with open(f"{test.name}.compare.json", "w") as cf:
+        json.dump(results, cf, indent=2)
 
 def test_performance(test, suite, runtimes):
     """ outputs a warning if the execution time of the test this run
@@ -271,10 +351,17 @@ def test_performance(test, suite, runtimes):
         warn_msg = warn_msg.format(percentage, compare_str, num_times)
         suite.log.warn(warn_msg)
 
-def determine_coverage(suite):
+def determine_coverage(suite, active_test_list):
+    """ update the coverage index with the tests that ran, and write the
+        coverage reports for the suite """
+
+    index_file = os.path.join(suite.webTopDir, coverage.INDEX_FILE)
 
     try:
-        results = coverage.main(suite.full_test_dir)
+        results = coverage.update_index(index_file, suite.test_dir.rstrip("/"),
+                                        cwd=suite.full_test_dir,
+                                        job_info_dir=suite.full_web_dir,
+                                        active_tests=active_test_list)
     except:
         suite.log.warn("error generating parameter coverage reports, check formatting")
         return
@@ -286,554 +373,690 @@ def determine_coverage(suite):
         suite.covered_nonspecific_frac = results[2]
         suite.total_nonspecific = results[3]
 
+        report.report_coverage_history(suite, coverage.load_index(index_file))
+
         spec_file = os.path.join(suite.full_test_dir, coverage.SPEC_FILE)
         nonspec_file = os.path.join(suite.full_test_dir, coverage.NONSPEC_FILE)
 
         shutil.copy(spec_file, suite.full_web_dir)
         shutil.copy(nonspec_file, suite.full_web_dir)
 
-def test_suite(argv):
-    """
-    the main test suite driver
-    """
+def get_build_dir(suite, test):
+    """ the directory test is built in """
 
-    # parse the commandline arguments
-    args = test_util.get_args(arg_string=argv)
+    if not test.extra_build_dir == "":
+        return suite.repos[test.extra_build_dir].dir + test.buildDir
+    return suite.source_dir + test.buildDir
 
-    # read in the test information
-    suite, test_list = params.load_params(args)
+def get_build_key(suite, test):
+    """ the directory that only one test at a time can build in """
 
-    active_test_list = [t.name for t in test_list]
+    if suite.useCmake:
+        return suite.source_build_dir
+    return get_build_dir(suite, test)
 
-    test_list = suite.get_tests_to_run(test_list)
+def plan_tests(suite, test_list, runtimes, args):
+    """ return the order to process the tests in, and log how long that
+        is expected to take.  With the lpt order, the tests expected to
+        take longest go first, with the tests sharing an executable
+        kept together """
+
+    run_time, build_time = suite.get_expected_times(test_list, runtimes)
+
+    def executable(test):
+        return (get_build_key(suite, test),) + suite.get_build_fingerprint(test)
+
+    test_order = args.test_order
+    if test_order is None:
+        test_order = "lpt" if args.jobs > 1 else "name"
+
+    run_order = test_list
+    if test_order == "lpt":
+        expected = {name: run_time[name] + build_time[name] for name in run_time}
+        run_order = scheduler.order_lpt(test_list, expected, executable)
+
+    makespan = scheduler.predict_makespan(run_order, run_time, build_time,
+                                          lambda t: get_build_key(suite, t), args.jobs)
 
     suite.log.skip()
-    suite.log.bold("running tests: ")
+    suite.log.bold(f"running {len(test_list)} tests in {test_order} order, {args.jobs} at a time")
     suite.log.indent()
-    for obj in test_list:
-        suite.log.log(obj.name)
+    suite.log.log(f"predicted time: {makespan/60:.1f} min, from past runs")
     suite.log.outdent()
 
-    if not args.complete_report_from_crash == "":
+    return run_order
 
-        # make sure the web directory from the crash run exists
-        suite.full_web_dir = "{}/{}/".format(
-            suite.webTopDir, args.complete_report_from_crash)
-        if not os.path.isdir(suite.full_web_dir):
-            suite.log.fail("Crash directory does not exist")
+def get_status(suite, test):
+    """ the first line of the status file of test in the web directory,
+        or "" if it has none yet """
 
-        suite.test_dir = args.complete_report_from_crash
+    try:
+        with open(f"{suite.full_web_dir}/{test.name}.status") as sf:
+            return sf.readline().strip()
+    except OSError:
+        return ""
 
-        # find all the tests that completed in that web directory
-        tests = []
-        test_file = ""
-        was_benchmark_run = 0
-        for sfile in os.listdir(suite.full_web_dir):
-            if os.path.isfile(sfile) and sfile.endswith(".status"):
-                index = sfile.rfind(".status")
-                tests.append(sfile[:index])
+def check_failure(suite, test, failed, broken_builds):
+    """ note whether test failed, in failed, and whether it failed to
+        compile, in broken_builds (build directory -> test name) """
 
-                with open(suite.full_web_dir + sfile) as f:
-                    for line in f:
-                        if line.find("benchmarks updated") > 0:
-                            was_benchmark_run = 1
+    status = get_status(suite, test)
+    if status.startswith("SKIPPED"):
+        return
 
-            if os.path.isfile(sfile) and sfile.endswith(".ini"):
-                test_file = sfile
+    if "FAILED" in status.upper() or "CRASHED" in status:
+        failed.append(test.name)
+        if status.startswith("COMPILE FAILED"):
+            broken_builds.setdefault(get_build_key(suite, test), test.name)
 
+def get_skip_reason(suite, args, test, failed, broken_builds):
+    """ why test should not be run, with --fail_fast or
+        --skip_broken_builds, or "" if it should """
 
-        # create the report for this test run
-        num_failed = report.report_this_test_run(suite, was_benchmark_run,
-                                                 "recreated report after crash of suite",
-                                                 "", tests, test_file)
+    if args.fail_fast > 0 and len(failed) >= args.fail_fast:
+        return f"the suite stopped after {len(failed)} failed tests"
 
-        # create the suite report
-        suite.log.bold("creating suite report...")
-        report.report_all_runs(suite, active_test_list)
-        suite.log.close_log()
-        sys.exit("done")
+    bdir = get_build_key(suite, test)
+    if args.skip_broken_builds and bdir in broken_builds:
+        return f"the build of {broken_builds[bdir]} in the same directory failed"
 
+    return ""
 
-    #--------------------------------------------------------------------------
-    # check bench dir and create output directories
-    #--------------------------------------------------------------------------
-    all_compile = all([t.compileTest == 1 for t in test_list])
+def skip_test(suite, test, reason):
+    """ record that test was not run, so the report can still list it """
 
-    if not all_compile:
-        bench_dir = suite.get_bench_dir()
+    suite.log.warn(f"skipping {test.name}: {reason}")
+    with open(f"{suite.full_web_dir}/{test.name}.status", 'w') as sf:
+        sf.write(f"SKIPPED: {reason}\n")
 
-    if not args.copy_benchmarks is None:
-        last_run = suite.get_last_run()
+def record_progress(suite, test, stage):
+    """ note in the journal of the run that test got through stage """
 
-    suite.make_test_dirs()
+    if suite.journal is not None:
+        suite.journal.record(test, stage)
 
-    if suite.slack_post:
-        if args.note == "" and suite.repos["source"].pr_wanted is not None:
-            note = "testing PR-{}".format(suite.repos["source"].pr_wanted)
-        else:
-            note = args.note
+def resume_run(suite, test_dir, test_list):
+    """ carry on with the interrupted run test_dir: use its directories
+        and test the same source.  Returns the tests of that run, its
+        git update time and the progress of its tests, from the journal """
 
-        msg = "> {} ({}) test suite started, id: {}\n> {}".format(
-            suite.suiteName, suite.sub_title, suite.test_dir, note)
-        suite.slack_post_it(msg)
+    suite.use_test_dirs(test_dir)
 
-    if not args.copy_benchmarks is None:
-        old_full_test_dir = suite.testTopDir + suite.suiteName + "-tests/" + last_run
-        copy_benchmarks(old_full_test_dir, suite.full_web_dir,
-                        test_list, bench_dir, suite.log)
+    suite.journal = journal.Journal(suite.full_test_dir)
+    if not suite.journal.exists():
+        suite.log.fail(f"ERROR: run {test_dir} has no journal to resume from")
 
-        # here, args.copy_benchmarks plays the role of make_benchmarks
-        num_failed = report.report_this_test_run(suite, args.copy_benchmarks,
-                                                 "copy_benchmarks used -- no new tests run",
-                                                 "",
-                                                 test_list, args.input_file[0])
-        report.report_all_runs(suite, active_test_list)
+    run, progress = suite.journal.read()
+    if run is None:
+        suite.log.fail(f"ERROR: the journal of run {test_dir} is incomplete")
 
-        if suite.slack_post:
-            msg = f"> copied benchmarks\n> {args.copy_benchmarks}"
-            suite.slack_post_it(msg)
+    for k, githash in run["repos"].items():
+        if k in suite.repos and githash not in ("", "None"):
+            suite.repos[k].hash_wanted = githash
+            suite.repos[k].update = False
 
-        sys.exit("done")
+    missing = set(run["tests"]) - {t.name for t in test_list}
+    if missing:
+        suite.log.warn("tests of the run not found now: {}".format(" ".join(sorted(missing))))
 
+    test_list = [t for t in test_list if t.name in run["tests"]]
 
-    #--------------------------------------------------------------------------
-    # figure out what needs updating and do the git updates, save the
-    # current hash / HEAD, and make a ChangeLog
-    # --------------------------------------------------------------------------
-    now = time.localtime(time.time())
-    update_time = time.strftime("%Y-%m-%d %H:%M:%S %Z", now)
+    finished = [t for t in test_list if progress.get(t.name, {}).get("stage") == "reported"]
+    suite.log.skip()
+    suite.log.bold(f"resuming run {test_dir}: {len(finished)} of {len(test_list)} tests done")
 
-    no_update = args.no_update.lower()
-    if not args.copy_benchmarks is None:
-        no_update = "all"
+    return test_list, run["update_time"], progress
 
-    # the default is to update everything, unless we specified a hash
-    # when constructing the Repo object
-    if no_update == "none":
-        pass
+def recover_crashed_run(suite, test_dir, defined_tests):
+    """ rebuild the tests of the crashed run test_dir, for its report,
+        from one scan of its web directory.  Where the run has a journal,
+        each test gets back the state it was reported with; otherwise
+        that is read back from the test's status, comparison and job_info
+        files.  Returns the tests, the test file, the git update time
+        and whether the run made benchmarks """
 
-    elif no_update == "all":
-        for k in suite.repos:
-            suite.repos[k].update = False
+    by_name = {t.name: t for t in defined_tests}
 
-    else:
-        nouplist = [k.strip() for k in no_update.split(",")]
+    files = {}
+    test_file = ""
+    for entry in os.scandir(suite.full_web_dir):
+        if not entry.is_file():
+            continue
+        if entry.name.endswith(".ini"):
+            test_file = entry.name
+        else:
+            files[entry.name] = entry.path
+
+    progress = {}
+    update_time = ""
+    run_journal = journal.Journal(suite.testTopDir + suite.suiteName + "-tests/" + test_dir)
+    if run_journal.exists():
+        run, progress = run_journal.read()
+        if run is not None:
+            update_time = run["update_time"]
+
+    tests = []
+    made_benchmarks = False
+
+    for fname in sorted(files):
+        name, ext = os.path.splitext(fname)
+        if ext != ".status" or test_util.is_run_dir(name) or name == "branch":
+            continue
 
-        for repo in suite.repos.keys():
-            if repo.lower() in nouplist:
-                suite.repos[repo].update = False
+        if name not in by_name:
+            suite.log.warn(f"test {name} is not in the test file anymore, leaving it out")
+            continue
 
-    os.chdir(suite.testTopDir)
+        test = by_name[name]
+        tests.append(test)
 
-    for k in suite.repos:
-        suite.log.skip()
-        suite.log.bold(f"repo: {suite.repos[k].name}")
-        suite.log.indent()
+        with open(files[fname]) as sf:
+            status = sf.readline().strip()
 
-        if suite.repos[k].update or suite.repos[k].hash_wanted:
-            suite.repos[k].git_update()
+        if status.startswith("benchmarks"):
+            made_benchmarks = True
 
-        suite.repos[k].save_head()
+        state = progress.get(name, {}).get("state")
+        if state is not None:
+            test.__dict__.update(state)
+            continue
 
-        if suite.repos[k].update:
-            suite.repos[k].make_changelog()
+        # not journaled: the status file has the verdict, and the
+        # comparison and job_info files the details -- the timings are
+        # only ever journaled
+        test.compile_successful = not status.startswith("COMPILE FAILED")
+        test.compare_successful = status.startswith("PASSED")
+        test.analysis_successful = test.compare_successful
+
+        if f"{name}.compare.json" in files:
+            with open(files[f"{name}.compare.json"]) as jf:
+                results = json.load(jf)
+            if results["mesh"] is not None:
+                test.comparison = comparison.PlotfileDiff.from_dict(results["mesh"])
+                test.nlevels = test.comparison.nlevels
+            test.particle_comparisons = [comparison.ParticleDiff.from_dict(p)
+                                         for p in results["particles"]]
+
+        if f"{name}.job_info" in files:
+            test.has_jobinfo = 1
+            with open(files[f"{name}.job_info"]) as jf:
+                job_file_lines = jf.readlines()
+            for n in (1, 2, 3):
+                field = getattr(suite, f"summary_job_info_field{n}").strip()
+                if field == "":
+                    continue
+                for l in job_file_lines:
+                    if l.startswith(field) and l.find(":") >= 0:
+                        _tmp = l.split(":")[1]
+                        setattr(test, f"job_info_field{n}", _tmp[_tmp.rfind("/")+1:])
+                        break
+
+    return tests, test_file, update_time, made_benchmarks
+
+def record_runtime(suite, test, runtimes):
+    """ if the test ran and passed, add its runtime to the dictionary """
+
+    if (test.ignore_return_code == 1 or test.return_code == 0) and test.record_runtime(suite):
+        test_dict = runtimes.setdefault(test.name, suite.timing_default)
+        test_dict["runtimes"].insert(0, test.wall_time)
+        test_dict["dates"].insert(0, suite.test_dir.rstrip("/"))
+        test_dict.setdefault("build_times", []).insert(0, test.build_time)
+
+        # keep the largest comparison errors too, to see them drift
+        if test.comparison is not None:
+            errors = test_dict.setdefault("max_errors", {})
+            errors[suite.test_dir.rstrip("/")] = test.comparison.max_errors()
+
+def get_executable_cache(suite, test):
+    """ the directory that keeps the executable of test, in throughput
+        mode, for the other tests of this run built the same way """
+
+    config, fingerprint = suite.get_build_fingerprint(test)
+    key = [get_build_key(suite, test), config, fingerprint]
+
+    # CMake tests all build in the one build tree: what they build is
+    # set by their target and configure options
+    if suite.useCmake:
+        key += [test.target, test.cmakeSetupOpts]
 
-        suite.log.outdent()
+    return "{}.executables/{}/".format(suite.full_test_dir,
+                                         hashlib.sha256("\n".join(key).encode()).hexdigest()[:16])
 
+def link_file(source, dest_dir):
+    """ hardlink source into dest_dir, or copy it if it can't be linked """
 
-    # keep track if we are running on any branch that is not the suite
-    # default
-    branches = [suite.repos[r].get_branch_name() for r in suite.repos]
-    if not all(suite.default_branch == b for b in branches):
-        suite.log.warn("some git repos are not on the default branch")
-        bf = open(f"{suite.full_web_dir}/branch.status", "w")
-        bf.write("branch different than suite default")
-        bf.close()
+    try:
+        os.link(source, os.path.join(dest_dir, os.path.basename(source)))
+    except OSError:
+        shutil.copy(source, dest_dir)
 
-    #--------------------------------------------------------------------------
-    # build the tools and do a make clean, only once per build directory
-    #--------------------------------------------------------------------------
-    suite.build_tools(test_list)
+def report_test(suite, test, test_list, args, failure_msg=None):
+    """ write the status of test, and its page -- in throughput mode,
+        the pages are written at the end, all together """
 
-    all_build_dirs = find_build_dirs(test_list)
+    test.failure_msg = failure_msg
+    test.page_pending = args.throughput
+    report.report_single_test(suite, test, test_list, failure_msg=failure_msg,
+                              page=not args.throughput)
 
-    suite.log.skip()
-    suite.log.bold("make clean in...")
+def write_test_pages(suite, test_list):
+    """ write the pages of the tests whose reports were put off """
 
-    for d, source_tree in all_build_dirs:
+    for test in test_list:
+        if test.page_pending:
+            report.report_single_test(suite, test, test_list, failure_msg=test.failure_msg,
+                                      status=False)
+            test.page_pending = False
 
-        if not source_tree == "":
-            suite.log.log(f"{d} in {source_tree}")
-            os.chdir(suite.repos[source_tree].dir + d)
-            suite.make_realclean(repo=source_tree)
-        else:
-            suite.log.log(f"{d}")
-            os.chdir(suite.source_dir + d)
-            if suite.sourceTree in ["AMReX", "amrex"]:
-                suite.make_realclean(repo="AMReX")
-            else:
-                suite.make_realclean()
+def process_test(suite, test, test_list, args, runtimes, bench_dir, built=None):
+    """ build, run, and compare test, and write its report.  This runs
+    in a process of its own when the suite runs tests in parallel, in
+    which case built is called once test no longer needs its build
+    directory """
 
-    os.chdir(suite.testTopDir)
 
+    suite.log.outdent()  # just to make sure we have no indentation
+    suite.log.skip()
+    suite.log.bold(f"working on test: {test.name}")
+    suite.log.indent()
 
-    #--------------------------------------------------------------------------
-    # Setup Cmake if needed
-    #--------------------------------------------------------------------------
-    if suite.useCmake and not suite.isSuperbuild:
-        cmake_setup(suite)
+    if not args.make_benchmarks is None and (test.restartTest or test.compileTest or
+                                             test.selfTest):
+        suite.log.warn(f"benchmarks not needed for test {test.name}")
+        return
 
+    output_dir = suite.full_test_dir + test.name + '/'
+    os.mkdir(output_dir)
+    test.output_dir = output_dir
 
-    #--------------------------------------------------------------------------
-    # Get execution times from previous runs
-    #--------------------------------------------------------------------------
-    runtimes = suite.get_wallclock_history()
 
-    #--------------------------------------------------------------------------
-    # main loop over tests
-    #--------------------------------------------------------------------------
-    for test in test_list:
+    #----------------------------------------------------------------------
+    # compile the code
+    #----------------------------------------------------------------------
+    bdir = get_build_dir(suite, test)
 
-        suite.log.outdent()  # just to make sure we have no indentation
-        suite.log.skip()
-        suite.log.bold(f"working on test: {test.name}")
-        suite.log.indent()
+    # # For cmake builds, there is only one build dir
+    # if ( suite.useCmake ): bdir = suite.source_build_dir
 
-        if not args.make_benchmarks is None and (test.restartTest or test.compileTest or
-                                                 test.selfTest):
-            suite.log.warn(f"benchmarks not needed for test {test.name}")
-            continue
+    os.chdir(bdir)
+
+    coutfile = f"{output_dir}/{test.name}.make.out"
 
-        output_dir = suite.full_test_dir + test.name + '/'
-        os.mkdir(output_dir)
-        test.output_dir = output_dir
+    # in throughput mode, a test uses the executable another test of
+    # this run built the same way, instead of running make again
+    exe_cache = None
+    cached = None
+    if args.throughput:
+        exe_cache = get_executable_cache(suite, test)
+        try:
+            with open(exe_cache + "build.json") as bf:
+                cached = json.load(bf)
+        except (OSError, ValueError):
+            cached = None
 
+    test.reClean = cached is None and suite.needs_realclean(test, bdir)
 
-        #----------------------------------------------------------------------
-        # compile the code
-        #----------------------------------------------------------------------
+    if test.reClean:
+        # the build configuration differs from what was last built
+        # in this directory, make clean to be safe
+        suite.log.log("re-making clean...")
         if not test.extra_build_dir == "":
-            bdir = suite.repos[test.extra_build_dir].dir + test.buildDir
+            suite.make_realclean(repo=test.extra_build_dir)
+        elif suite.sourceTree in ["AMReX", "amrex"]:
+            suite.make_realclean(repo="AMReX")
         else:
-            bdir = suite.source_dir + test.buildDir
+            suite.make_realclean()
 
-        # # For cmake builds, there is only one build dir
-        # if ( suite.useCmake ): bdir = suite.source_build_dir
+    # Register start time
+    test.build_time = time.time()
 
-        os.chdir(bdir)
+    comp_string, rc = "", 1
+    executable = None
+    if cached is not None:
+        suite.log.log(f"using the executable built for {cached['test']}")
+        comp_string, rc = cached["comp_string"], 0
+        executable = cached["executable"]
+        with open(coutfile, "w") as cf:
+            cf.write(f"using the executable built for {cached['test']}: {comp_string}\n")
 
-        if test.reClean == 1:
-            # for one reason or another, multiple tests use different
-            # build options, make clean again to be safe
-            suite.log.log("re-making clean...")
-            if not test.extra_build_dir == "":
-                suite.make_realclean(repo=test.extra_build_dir)
-            elif suite.sourceTree in ["AMReX", "amrex"]:
-                suite.make_realclean(repo="AMReX")
-            else:
-                suite.make_realclean()
+    elif suite.sourceTree == "C_Src" or test.testSrcTree == "C_Src":
+        suite.log.log("building...")
 
-        # Register start time
-        test.build_time = time.time()
+        if suite.useCmake:
+            comp_string, rc = suite.build_test_cmake(test=test, outfile=coutfile)
+        else:
+            comp_string, rc = suite.build_c(test=test, outfile=coutfile)
 
-        suite.log.log("building...")
+        executable = test_util.get_recent_filename(bdir, "", ".ex")
 
-        coutfile = f"{output_dir}/{test.name}.make.out"
+        if exe_cache is not None and rc == 0 and executable is not None:
+            os.makedirs(exe_cache, exist_ok=True)
+            link_file(executable, exe_cache)
+            with open(exe_cache + "build.json", "w") as bf:
+                json.dump({"test": test.name, "executable": executable,
+                           "comp_string": comp_string}, bf)
 
-        if suite.sourceTree == "C_Src" or test.testSrcTree == "C_Src":
-            if suite.useCmake:
-                comp_string, rc = suite.build_test_cmake(test=test, outfile=coutfile)
-            else:
-                comp_string, rc = suite.build_c(test=test, outfile=coutfile)
+    if cached is None:
+        suite.record_build(test, bdir, realcleaned=test.reClean)
 
-            executable = test_util.get_recent_filename(bdir, "", ".ex")
+    test.comp_string = comp_string
 
-        test.comp_string = comp_string
+    # make return code is 0 if build was successful
+    if rc == 0:
+        test.compile_successful = True
+    # Compute compile time
+    test.build_time = time.time() - test.build_time
+    suite.log.log(f"Compilation time: {test.build_time:.3f} s")
 
-        # make return code is 0 if build was successful
-        if rc == 0:
-            test.compile_successful = True
-        # Compute compile time
-        test.build_time = time.time() - test.build_time
-        suite.log.log(f"Compilation time: {test.build_time:.3f} s")
+    # copy the make.out into the web directory
+    shutil.copy(f"{output_dir}/{test.name}.make.out", suite.full_web_dir)
 
-        # copy the make.out into the web directory
-        shutil.copy(f"{output_dir}/{test.name}.make.out", suite.full_web_dir)
+    if not test.compile_successful:
+        error_msg = "ERROR: compilation failed"
+        report_test(suite, test, test_list, args, failure_msg=error_msg)
 
-        if not test.compile_successful:
-            error_msg = "ERROR: compilation failed"
-            report.report_single_test(suite, test, test_list, failure_msg=error_msg)
+        # Print compilation error message (useful for CI tests)
+        if suite.verbose > 0:
+            with open(f"{output_dir}/{test.name}.make.out") as f:
+                print(f.read())
 
-            # Print compilation error message (useful for CI tests)
-            if suite.verbose > 0:
-                with open(f"{output_dir}/{test.name}.make.out") as f:
-                    print(f.read())
+        return
 
-            continue
+    record_progress(suite, test, "built")
 
-        if test.compileTest:
-            suite.log.log("creating problem test report ...")
-            report.report_single_test(suite, test, test_list)
-            continue
+    if test.compileTest:
+        suite.log.log("creating problem test report ...")
+        report_test(suite, test, test_list, args)
+        return
 
 
-        #----------------------------------------------------------------------
-        # copy the necessary files over to the run directory
-        #----------------------------------------------------------------------
-        suite.log.log(f"run & test directory: {output_dir}")
-        suite.log.log("copying files to run directory...")
+    #----------------------------------------------------------------------
+    # copy the necessary files over to the run directory
+    #----------------------------------------------------------------------
+    suite.log.log(f"run & test directory: {output_dir}")
+    suite.log.log("copying files to run directory...")
+
+    needed_files = []
+    if cached is not None:
+        needed_files.append((exe_cache + executable, "link"))
+    elif executable is not None:
+        needed_files.append((executable, "move"))
+
+    if test.run_as_script:
+        needed_files.append((test.run_as_script, "copy"))
+
+    if test.inputFile:
+        suite.log.log("path to input file: {}".format(test.inputFile))
+        needed_files.append((test.inputFile, "copy"))
+        # strip out any sub-directory from the build dir
+        test.inputFile = os.path.basename(test.inputFile)
+
+    if test.probinFile != "":
+        needed_files.append((test.probinFile, "copy"))
+        # strip out any sub-directory from the build dir
+        test.probinFile = os.path.basename(test.probinFile)
+
+    for auxf in test.auxFiles:
+        needed_files.append((auxf, "copy"))
+
+    # if any copy/move fail, we move onto the next test
+    skip_to_next_test = 0
+    for nfile, action in needed_files:
+        if action == "copy":
+            act = shutil.copy
+        elif action == "move":
+            act = shutil.move
+        elif action == "link":
+            act = link_file
+        else:
+            suite.log.fail("invalid action")
 
-        needed_files = []
-        if executable is not None:
-            needed_files.append((executable, "move"))
+        try:
+            act(nfile, output_dir)
+        except OSError:
+            error_msg = f"ERROR: unable to {action} file {nfile}"
+            report_test(suite, test, test_list, args, failure_msg=error_msg)
+            skip_to_next_test = 1
+            break
 
-        if test.run_as_script:
-            needed_files.append((test.run_as_script, "copy"))
+    if skip_to_next_test:
+        return
 
-        if test.inputFile:
-            suite.log.log("path to input file: {}".format(test.inputFile))
-            needed_files.append((test.inputFile, "copy"))
-            # strip out any sub-directory from the build dir
-            test.inputFile = os.path.basename(test.inputFile)
-
-        if test.probinFile != "":
-            needed_files.append((test.probinFile, "copy"))
-            # strip out any sub-directory from the build dir
-            test.probinFile = os.path.basename(test.probinFile)
-
-        for auxf in test.auxFiles:
-            needed_files.append((auxf, "copy"))
-
-        # if any copy/move fail, we move onto the next test
-        skip_to_next_test = 0
-        for nfile, action in needed_files:
-            if action == "copy":
-                act = shutil.copy
-            elif action == "move":
-                act = shutil.move
-            else:
-                suite.log.fail("invalid action")
+    skip_to_next_test = 0
+    for lfile in test.linkFiles:
+        if not os.path.exists(lfile):
+            error_msg = f"ERROR: link file {lfile} does not exist"
+            report_test(suite, test, test_list, args, failure_msg=error_msg)
+            skip_to_next_test = 1
+            break
 
+        else:
+            link_source = os.path.abspath(lfile)
+            link_name = os.path.join(output_dir, os.path.basename(lfile))
             try:
-                act(nfile, output_dir)
+                os.symlink(link_source, link_name)
             except OSError:
-                error_msg = f"ERROR: unable to {action} file {nfile}"
-                report.report_single_test(suite, test, test_list, failure_msg=error_msg)
+                error_msg = f"ERROR: unable to symlink link file: {lfile}"
+                report_test(suite, test, test_list, args, failure_msg=error_msg)
                 skip_to_next_test = 1
                 break
 
-        if skip_to_next_test:
-            continue
+    if skip_to_next_test:
+        return
 
-        skip_to_next_test = 0
-        for lfile in test.linkFiles:
-            if not os.path.exists(lfile):
-                error_msg = f"ERROR: link file {lfile} does not exist"
-                report.report_single_test(suite, test, test_list, failure_msg=error_msg)
-                skip_to_next_test = 1
-                break
+    # the executable and inputs are in the run directory now, so another
+    # test can use the build directory
+    if built is not None:
+        built()
 
-            else:
-                link_source = os.path.abspath(lfile)
-                link_name = os.path.join(output_dir, os.path.basename(lfile))
-                try:
-                    os.symlink(link_source, link_name)
-                except OSError:
-                    error_msg = f"ERROR: unable to symlink link file: {lfile}"
-                    report.report_single_test(suite, test, test_list, failure_msg=error_msg)
-                    skip_to_next_test = 1
-                    break
-
-        if skip_to_next_test:
-            continue
 
+    #----------------------------------------------------------------------
+    # run the test
+    #----------------------------------------------------------------------
+    suite.log.log("running the test...")
 
-        #----------------------------------------------------------------------
-        # run the test
-        #----------------------------------------------------------------------
-        suite.log.log("running the test...")
+    os.chdir(output_dir)
 
-        os.chdir(output_dir)
+    test.wall_time = time.time()
 
-        test.wall_time = time.time()
+    if suite.sourceTree == "C_Src" or test.testSrcTree == "C_Src":
 
-        if suite.sourceTree == "C_Src" or test.testSrcTree == "C_Src":
+        base_cmd = f"./{executable} {test.inputFile} "
+        if suite.plot_file_name != "":
+            base_cmd += f" {suite.plot_file_name}={test.name}_plt "
+        if suite.check_file_name != "none":
+            base_cmd += f" {suite.check_file_name}={test.name}_chk "
 
-            base_cmd = f"./{executable} {test.inputFile} "
-            if suite.plot_file_name != "":
-                base_cmd += f" {suite.plot_file_name}={test.name}_plt "
+        # keep around the checkpoint files only for the restart runs
+        if test.restartTest:
+            if suite.check_file_name != "none":
+                base_cmd += " amr.checkpoint_files_output=1 amr.check_int=%d " % \
+                    (test.restartFileNum)
+        else:
             if suite.check_file_name != "none":
-                base_cmd += f" {suite.check_file_name}={test.name}_chk "
+                base_cmd += " amr.checkpoint_files_output=0"
 
-            # keep around the checkpoint files only for the restart runs
-            if test.restartTest:
-                if suite.check_file_name != "none":
-                    base_cmd += " amr.checkpoint_files_output=1 amr.check_int=%d " % \
-                        (test.restartFileNum)
-            else:
-                if suite.check_file_name != "none":
-                    base_cmd += " amr.checkpoint_files_output=0"
+        base_cmd += f" {suite.globalAddToExecString} {test.runtime_params}"
 
-            base_cmd += f" {suite.globalAddToExecString} {test.runtime_params}"
+    if test.run_as_script:
+        base_cmd = f"./{test.run_as_script} {test.script_args}"
 
-        if test.run_as_script:
-            base_cmd = f"./{test.run_as_script} {test.script_args}"
+    if test.customRunCmd is not None:
+        base_cmd = test.customRunCmd
 
-        if test.customRunCmd is not None:
-            base_cmd = test.customRunCmd
+    if args.with_valgrind:
+        base_cmd = "valgrind " + args.valgrind_options + " " + base_cmd
 
-        if args.with_valgrind:
-            base_cmd = "valgrind " + args.valgrind_options + " " + base_cmd
 
+    suite.run_test(test, base_cmd)
 
-        suite.run_test(test, base_cmd)
+    # if it is a restart test, then rename the final output file and
+    # restart the test
+    if (test.ignore_return_code == 1 or test.return_code == 0) and test.restartTest:
+        skip_restart = False
 
-        # if it is a restart test, then rename the final output file and
-        # restart the test
-        if (test.ignore_return_code == 1 or test.return_code == 0) and test.restartTest:
-            skip_restart = False
+        last_file = test.get_compare_file(output_dir=output_dir)
 
-            last_file = test.get_compare_file(output_dir=output_dir)
+        if last_file == "":
+            error_msg = "ERROR: test did not produce output.  Restart test not possible"
+            skip_restart = True
 
-            if last_file == "":
-                error_msg = "ERROR: test did not produce output.  Restart test not possible"
-                skip_restart = True
+        if len(test.find_backtrace()) > 0:
+            error_msg = "ERROR: test produced backtraces.  Restart test not possible"
+            skip_restart = True
 
-            if len(test.find_backtrace()) > 0:
-                error_msg = "ERROR: test produced backtraces.  Restart test not possible"
-                skip_restart = True
+        if skip_restart:
+            # copy what we can
+            test.wall_time = time.time() - test.wall_time
+            shutil.copy(test.outfile, suite.full_web_dir)
+            if os.path.isfile(test.errfile):
+                shutil.copy(test.errfile, suite.full_web_dir)
+                test.has_stderr = True
+            suite.copy_backtrace(test)
+            report_test(suite, test, test_list, args, failure_msg=error_msg)
+            return
+        orig_last_file = f"orig_{last_file}"
+        shutil.move(last_file, orig_last_file)
 
-            if skip_restart:
-                # copy what we can
-                test.wall_time = time.time() - test.wall_time
-                shutil.copy(test.outfile, suite.full_web_dir)
-                if os.path.isfile(test.errfile):
-                    shutil.copy(test.errfile, suite.full_web_dir)
-                    test.has_stderr = True
-                suite.copy_backtrace(test)
-                report.report_single_test(suite, test, test_list, failure_msg=error_msg)
-                continue
-            orig_last_file = f"orig_{last_file}"
-            shutil.move(last_file, orig_last_file)
+        if test.diffDir:
+            orig_diff_dir = f"orig_{test.diffDir}"
+            shutil.move(test.diffDir, orig_diff_dir)
 
-            if test.diffDir:
-                orig_diff_dir = f"orig_{test.diffDir}"
-                shutil.move(test.diffDir, orig_diff_dir)
+        # get the file number to restart from
+        restart_file = "%s_chk%5.5d" % (test.name, test.restartFileNum)
 
-            # get the file number to restart from
-            restart_file = "%s_chk%5.5d" % (test.name, test.restartFileNum)
+        suite.log.log(f"restarting from {restart_file} ... ")
 
-            suite.log.log(f"restarting from {restart_file} ... ")
+        if suite.sourceTree == "C_Src" or test.testSrcTree == "C_Src":
 
-            if suite.sourceTree == "C_Src" or test.testSrcTree == "C_Src":
+            base_cmd = "./{} {} {}={}_plt amr.restart={} ".format(
+                executable, test.inputFile, suite.plot_file_name, test.name, restart_file)
 
-                base_cmd = "./{} {} {}={}_plt amr.restart={} ".format(
-                    executable, test.inputFile, suite.plot_file_name, test.name, restart_file)
+            if suite.check_file_name != "none":
+                base_cmd += f" {suite.check_file_name}={test.name}_chk amr.checkpoint_files_output=0 "
 
-                if suite.check_file_name != "none":
-                    base_cmd += f" {suite.check_file_name}={test.name}_chk amr.checkpoint_files_output=0 "
+            base_cmd += f" {suite.globalAddToExecString} {test.runtime_params}"
 
-                base_cmd += f" {suite.globalAddToExecString} {test.runtime_params}"
+            if test.run_as_script:
+                base_cmd = f"./{test.run_as_script} {test.script_args}"
+                # base_cmd += " amr.restart={}".format(restart_file)
 
-                if test.run_as_script:
-                    base_cmd = f"./{test.run_as_script} {test.script_args}"
-                    # base_cmd += " amr.restart={}".format(restart_file)
+            if test.customRunCmd is not None:
+                base_cmd = test.customRunCmd
+                base_cmd += " amr.restart={}".format(restart_file)
 
-                if test.customRunCmd is not None:
-                    base_cmd = test.customRunCmd
-                    base_cmd += " amr.restart={}".format(restart_file)
+            if args.with_valgrind:
+                base_cmd = "valgrind " + args.valgrind_options + " " + base_cmd
 
-                if args.with_valgrind:
-                    base_cmd = "valgrind " + args.valgrind_options + " " + base_cmd
+        suite.run_test(test, base_cmd)
 
-            suite.run_test(test, base_cmd)
+    test.wall_time = time.time() - test.wall_time
+    suite.log.log(f"Execution time: {test.wall_time:.3f} s")
+    record_progress(suite, test, "ran")
 
-        test.wall_time = time.time() - test.wall_time
-        suite.log.log(f"Execution time: {test.wall_time:.3f} s")
+    # Check for performance drop
+    if (test.ignore_return_code == 1 or test.return_code == 0) and test.check_performance:
+        test_performance(test, suite, runtimes)
 
-        # Check for performance drop
-        if (test.ignore_return_code == 1 or test.return_code == 0) and test.check_performance:
-            test_performance(test, suite, runtimes)
+    #----------------------------------------------------------------------
+    # do the comparison
+    #----------------------------------------------------------------------
+    output_file = ""
+    if (test.ignore_return_code == 1 or test.return_code == 0) and not test.selfTest:
 
-        #----------------------------------------------------------------------
-        # do the comparison
-        #----------------------------------------------------------------------
-        output_file = ""
-        if (test.ignore_return_code == 1 or test.return_code == 0) and not test.selfTest:
+        if test.outputFile == "":
+            if test.compareFile == "":
+                compare_file = test.get_compare_file(output_dir=output_dir)
+            else:
+                # we specified the name of the file we want to
+                # compare to -- make sure it exists
+                compare_file = test.compareFile
+                if not os.path.exists(compare_file):
+                    compare_file = ""
+
+            output_file = compare_file
+        else:
+            output_file = test.outputFile
+            compare_file = test.name+'_'+output_file
 
-            if test.outputFile == "":
-                if test.compareFile == "":
-                    compare_file = test.get_compare_file(output_dir=output_dir)
-                else:
-                    # we specified the name of the file we want to
-                    # compare to -- make sure it exists
-                    compare_file = test.compareFile
-                    if not os.path.exists(compare_file):
-                        compare_file = ""
 
-                output_file = compare_file
+        # get the number of levels and other metadata for reporting
+        if not test.run_as_script:
+
+            test.plotfile_header = plotfile.get_header(output_file)
+            if test.plotfile_header is not None:
+                test.nlevels = test.plotfile_header.nlevels
             else:
-                output_file = test.outputFile
-                compare_file = test.name+'_'+output_file
+                test.nlevels = ""
 
+        if not test.doComparison:
+            test.compare_successful = not test.crashed
 
-            # get the number of levels for reporting
-            if not test.run_as_script and "fboxinfo" in suite.tools:
+        if args.make_benchmarks is None and test.doComparison:
 
-                prog = "{} -l {}".format(suite.tools["fboxinfo"], output_file)
-                stdout0, _, rc = test_util.run(prog)
-                test.nlevels = stdout0.rstrip('\n')
-                if not isinstance(params.convert_type(test.nlevels), int):
-                    test.nlevels = ""
+            suite.log.log("doing the comparison...")
+            suite.log.indent()
+            suite.log.log(f"comparison file: {output_file}")
 
-            if not test.doComparison:
-                test.compare_successful = not test.crashed
+            test.compare_file_used = output_file
 
-            if args.make_benchmarks is None and test.doComparison:
+            if not test.restartTest:
+                bench_file = bench_dir + compare_file
+                if test.benchmark_version:
+                    suite.log.log(f"using benchmark version {test.benchmark_version}")
+                    bench_file = suite.get_benchmark_store().resolve(
+                        compare_file, test.benchmark_version) or ""
+            else:
+                bench_file = orig_last_file
 
-                suite.log.log("doing the comparison...")
-                suite.log.indent()
-                suite.log.log(f"comparison file: {output_file}")
+            # see if it exists
+            # note, with AMReX, the plotfiles are actually directories
+            # switched to exists to handle the run_as_script case
 
-                test.compare_file_used = output_file
+            if not os.path.exists(bench_file):
+                suite.log.warn("no corresponding benchmark found")
+                bench_file = ""
 
-                if not test.restartTest:
-                    bench_file = bench_dir + compare_file
-                else:
-                    bench_file = orig_last_file
+                with open(test.comparison_outfile, 'w') as cf:
+                    cf.write("WARNING: no corresponding benchmark found\n")
+                    cf.write("         unable to do a comparison\n")
 
-                # see if it exists
-                # note, with AMReX, the plotfiles are actually directories
-                # switched to exists to handle the run_as_script case
+            else:
+                if not compare_file == "":
 
-                if not os.path.exists(bench_file):
-                    suite.log.warn("no corresponding benchmark found")
-                    bench_file = ""
+                    suite.log.log(f"benchmark file: {bench_file}")
 
-                    with open(test.comparison_outfile, 'w') as cf:
-                        cf.write("WARNING: no corresponding benchmark found\n")
-                        cf.write("         unable to do a comparison\n")
+                    diff = None
 
-                else:
-                    if not compare_file == "":
+                    if test.run_as_script:
 
-                        suite.log.log(f"benchmark file: {bench_file}")
+                        command = f"diff {bench_file} {output_file}"
 
-                        if test.run_as_script:
+                    elif (suite.compare_tool == "builtin" or
+                          bench_file.endswith(plotfile.ARCHIVE_EXTENSIONS) or
+                          output_file.endswith(plotfile.ARCHIVE_EXTENSIONS)):
 
-                            command = f"diff {bench_file} {output_file}"
+                        # fcompare can't read archived plotfiles
+                        command = None
 
-                        else:
+                    else:
+
+                        command = "{} --abort_if_not_all_found -n 0".format(suite.tools["fcompare"])
+
+                        if test.tolerance is not None:
+                            command += " --rel_tol {}".format(test.tolerance)
 
-                            command = "{} --abort_if_not_all_found -n 0".format(suite.tools["fcompare"])
+                        if test.abs_tolerance is not None:
+                            command += " --abs_tol {}".format(test.abs_tolerance)
 
-                            if test.tolerance is not None:
-                                command += " --rel_tol {}".format(test.tolerance)
+                        command += " {} {}".format(bench_file, output_file)
 
-                            if test.abs_tolerance is not None:
-                                command += " --abs_tol {}".format(test.abs_tolerance)
+                    if command is None:
 
-                            command += " {} {}".format(bench_file, output_file)
+                        diff = compare_builtin(suite, test, bench_file, output_file)
+                        test.compare_successful = diff.passed(*test.tolerances_for(diff.variables, diff.nlevels))
+
+                    else:
 
                         sout, _, ierr = test_util.run(command,
                                                       outfile=test.comparison_outfile,
@@ -845,418 +1068,720 @@ def test_suite(argv):
 
                         else:
 
-                            # fcompare still reports success even if there were NaNs, so let's double check for NaNs
-                            has_nan = 0
-                            for line in sout:
-                                if "< NaN present >" in line:
-                                    has_nan = 1
-                                    break
+                            # fcompare still reports success even if there
+                            # were NaNs, so we judge its results ourselves
+                            diff = comparison.PlotfileDiff.from_fcompare(sout, ierr)
+                            test.compare_successful = diff.passed(*test.tolerances_for(diff.variables, diff.nlevels))
 
-                            if has_nan == 0:
-                                test.compare_successful = ierr == 0
-                            else:
-                                test.compare_successful = 0
+                    test.comparison = diff
 
-                        if test.compareParticles:
-                            for ptype in test.particleTypes.strip().split():
-                                command = "{}".format(suite.tools["particle_compare"])
+                    if not (test.run_as_script or test.compare_successful) and suite.locate_differences:
+                        locate_differences(suite, test, bench_file, output_file, diff)
 
-                                if test.particle_tolerance is not None:
-                                    command += " --rel_tol {}".format(test.particle_tolerance)
+                    if test.compareParticles:
+                        particles_successful = compare_particles(suite, test, bench_file, output_file)
+                        test.compare_successful = test.compare_successful and particles_successful
 
-                                if test.particle_abs_tolerance is not None:
-                                    command += " --abs_tol {}".format(test.particle_abs_tolerance)
+                    if test.comparison is not None or test.particle_comparisons:
+                        save_comparison(test)
 
-                                command += " {} {} {}".format(bench_file, output_file, ptype)
+                else:
+                    suite.log.warn("unable to do a comparison")
 
-                                sout, _, ierr = test_util.run(command,
-                                                              outfile=test.comparison_outfile, store_command=True)
+                    with open(test.comparison_outfile, 'w') as cf:
+                        cf.write("WARNING: run did not produce any output\n")
+                        cf.write("         unable to do a comparison\n")
 
-                                test.compare_successful = test.compare_successful and not ierr
+            suite.log.outdent()
 
-                    else:
-                        suite.log.warn("unable to do a comparison")
+            if not test.diffDir == "":
+                if not test.restartTest:
+                    diff_dir_bench = bench_dir + '/' + test.name + '_' + test.diffDir
+                    if test.benchmark_version:
+                        diff_dir_bench = suite.get_benchmark_store().resolve(
+                            f"{test.name}_{test.diffDir}", test.benchmark_version) or ""
+                else:
+                    diff_dir_bench = orig_diff_dir
 
-                        with open(test.comparison_outfile, 'w') as cf:
-                            cf.write("WARNING: run did not produce any output\n")
-                            cf.write("         unable to do a comparison\n")
+                suite.log.log("doing the diff...")
+                suite.log.log(f"diff dir: {test.diffDir}")
 
-                suite.log.outdent()
+                command = "diff {} -r {} {}".format(
+                    test.diffOpts, diff_dir_bench, test.diffDir)
 
-                if not test.diffDir == "":
-                    if not test.restartTest:
-                        diff_dir_bench = bench_dir + '/' + test.name + '_' + test.diffDir
-                    else:
-                        diff_dir_bench = orig_diff_dir
+                outfile = test.comparison_outfile
+                sout, serr, diff_status = test_util.run(command, outfile=outfile, store_command=True)
 
-                    suite.log.log("doing the diff...")
-                    suite.log.log(f"diff dir: {test.diffDir}")
+                if diff_status == 0:
+                    diff_successful = True
+                    with open(test.comparison_outfile, 'a') as cf:
+                        cf.write("\ndiff was SUCCESSFUL\n")
+                else:
+                    diff_successful = False
 
-                    command = "diff {} -r {} {}".format(
-                        test.diffOpts, diff_dir_bench, test.diffDir)
+                test.compare_successful = test.compare_successful and diff_successful
 
-                    outfile = test.comparison_outfile
-                    sout, serr, diff_status = test_util.run(command, outfile=outfile, store_command=True)
+        elif test.doComparison:   # make_benchmarks
 
-                    if diff_status == 0:
-                        diff_successful = True
-                        with open(test.comparison_outfile, 'a') as cf:
-                            cf.write("\ndiff was SUCCESSFUL\n")
-                    else:
-                        diff_successful = False
+            if not compare_file == "":
 
-                    test.compare_successful = test.compare_successful and diff_successful
+                if not output_file == compare_file:
+                    source_file = output_file
+                else:
+                    source_file = compare_file
 
-            elif test.doComparison:   # make_benchmarks
+                suite.log.log(f"storing output of {test.name} as the new benchmark...")
+                suite.log.indent()
+                suite.log.warn(f"new benchmark file: {compare_file}")
+                suite.log.outdent()
 
-                if not compare_file == "":
+                store_benchmark(suite, test, source_file, compare_file)
 
-                    if not output_file == compare_file:
-                        source_file = output_file
-                    else:
-                        source_file = compare_file
+                with open(f"{test.name}.status", 'w') as cf:
+                    cf.write(f"benchmarks updated.  New file:  {compare_file}\n")
 
-                    suite.log.log(f"storing output of {test.name} as the new benchmark...")
-                    suite.log.indent()
-                    suite.log.warn(f"new benchmark file: {compare_file}")
-                    suite.log.outdent()
+            else:
+                with open(f"{test.name}.status", 'w') as cf:
+                    cf.write("benchmarks failed")
 
-                    if test.run_as_script:
-                        bench_path = os.path.join(bench_dir, compare_file)
-                        try:
-                            os.remove(bench_path)
-                        except:
-                            pass
-                        shutil.copy(source_file, bench_path)
+                # copy what we can
+                shutil.copy(test.outfile, suite.full_web_dir)
+                if os.path.isfile(test.errfile):
+                    shutil.copy(test.errfile, suite.full_web_dir)
+                    test.has_stderr = True
+                suite.copy_backtrace(test)
+                error_msg = "ERROR: runtime failure during benchmark creation"
+                report_test(suite, test, test_list, args, failure_msg=error_msg)
 
-                    else:
-                        try:
-                            shutil.rmtree(f"{bench_dir}/{compare_file}")
-                        except:
-                            pass
 
-                        shutil.copytree(source_file, f"{bench_dir}/{compare_file}")
+            if not test.diffDir == "":
+                store_benchmark(suite, test, test.diffDir, f"{test.name}_{test.diffDir}")
+                suite.log.log(f"new diffDir: {test.name}_{test.diffDir}")
+
+        else:  # don't do a pltfile comparison
+            test.compare_successful = True
+
+    elif (test.ignore_return_code == 1 or test.return_code == 0):   # selfTest
+
+        if args.make_benchmarks is None:
+
+            suite.log.log(f"looking for selfTest success string: {test.stSuccessString} ...")
+
+            try:
+                of = open(test.outfile)
+            except OSError:
+                suite.log.warn("no output file found")
+                out_lines = ['']
+            else:
+                out_lines = of.readlines()
 
-                    with open(f"{test.name}.status", 'w') as cf:
-                        cf.write(f"benchmarks updated.  New file:  {compare_file}\n")
+                # successful comparison is indicated by presence
+                # of success string
+                for line in out_lines:
+                    if line.find(test.stSuccessString) >= 0:
+                        test.compare_successful = True
+                        break
 
+                of.close()
+
+            with open(test.comparison_outfile, 'w') as cf:
+                if test.compare_successful:
+                    cf.write("SELF TEST SUCCESSFUL\n")
                 else:
-                    with open(f"{test.name}.status", 'w') as cf:
-                        cf.write("benchmarks failed")
-
-                    # copy what we can
-                    shutil.copy(test.outfile, suite.full_web_dir)
-                    if os.path.isfile(test.errfile):
-                        shutil.copy(test.errfile, suite.full_web_dir)
-                        test.has_stderr = True
-                    suite.copy_backtrace(test)
-                    error_msg = "ERROR: runtime failure during benchmark creation"
-                    report.report_single_test(suite, test, test_list, failure_msg=error_msg)
-
-
-                if not test.diffDir == "":
-                    diff_dir_bench = f"{bench_dir}/{test.name}_{test.diffDir}"
-                    if os.path.isdir(diff_dir_bench):
-                        shutil.rmtree(diff_dir_bench)
-                        shutil.copytree(test.diffDir, diff_dir_bench)
-                    else:
-                        if os.path.isdir(test.diffDir):
-                            shutil.copytree(test.diffDir, diff_dir_bench)
-                        else:
-                            shutil.copy(test.diffDir, diff_dir_bench)
-                    suite.log.log(f"new diffDir: {test.name}_{test.diffDir}")
+                    cf.write("SELF TEST FAILED\n")
 
-            else:  # don't do a pltfile comparison
-                test.compare_successful = True
 
-        elif (test.ignore_return_code == 1 or test.return_code == 0):   # selfTest
+    record_progress(suite, test, "compared")
 
+    #----------------------------------------------------------------------
+    # do any requested visualization (2- and 3-d only) and analysis
+    #----------------------------------------------------------------------
+    if (test.ignore_return_code == 1 or test.return_code == 0) and not test.selfTest:
+        if output_file != "":
             if args.make_benchmarks is None:
 
-                suite.log.log(f"looking for selfTest success string: {test.stSuccessString} ...")
+                # get any parameters for the summary table
+                job_info_file = f"{output_file}/job_info"
+                if os.path.isfile(job_info_file):
+                    test.has_jobinfo = 1
 
                 try:
-                    of = open(test.outfile)
-                except OSError:
-                    suite.log.warn("no output file found")
-                    out_lines = ['']
+                    jif = open(job_info_file)
+                except:
+                    suite.log.warn("unable to open the job_info file")
                 else:
-                    out_lines = of.readlines()
+                    job_file_lines = jif.readlines()
+                    jif.close()
+
+                    if suite.summary_job_info_field1 != "":
+                        for l in job_file_lines:
+                            if l.startswith(suite.summary_job_info_field1.strip()) and l.find(":") >= 0:
+                                _tmp = l.split(":")[1]
+                                idx = _tmp.rfind("/") + 1
+                                test.job_info_field1 = _tmp[idx:]
+                                break
+
+                    if suite.summary_job_info_field2 != "":
+                        for l in job_file_lines:
+                            if l.startswith(suite.summary_job_info_field2.strip()) and l.find(":") >= 0:
+                                _tmp = l.split(":")[1]
+                                idx = _tmp.rfind("/") + 1
+                                test.job_info_field2 = _tmp[idx:]
+                                break
+
+                    if suite.summary_job_info_field3 != "":
+                        for l in job_file_lines:
+                            if l.startswith(suite.summary_job_info_field3.strip()) and l.find(":") >= 0:
+                                _tmp = l.split(":")[1]
+                                idx = _tmp.rfind("/") + 1
+                                test.job_info_field3 = _tmp[idx:]
+                                break
+
+                # visualization
+                if test.doVis:
+
+                    if test.dim == 1:
+                        suite.log.log(f"Visualization not supported for dim = {test.dim}")
+                    else:
+                        suite.log.log("doing the visualization...")
+                        tool = suite.tools["fsnapshot"]
+                        test_util.run('{} --palette {}/Palette --variable "{}" "{}"'.format(
+                            tool, suite.f_compare_tool_dir, test.visVar, output_file))
+
+                        # convert the .ppm files into .png files
+                        ppm_file = test_util.get_recent_filename(output_dir, "", ".ppm")
+                        if not ppm_file is None:
+                            png_file = ppm_file.replace(".ppm", ".png")
+                            from PIL import Image
+                            with Image.open(ppm_file) as im:
+                                im.save(png_file)
+                            test.png_file = png_file
+
+                # analysis
+                if not test.analysisRoutine == "":
+
+                    suite.log.log("doing the analysis...")
+                    analysis_start_time = time.time()
+                    if not test.extra_build_dir == "":
+                        tool = f"{suite.repos[test.extra_build_dir].dir}/{test.analysisRoutine}"
+                    else:
+                        tool = f"{suite.source_dir}/{test.analysisRoutine}"
+
+                    shutil.copy(tool, os.getcwd())
 
-                    # successful comparison is indicated by presence
-                    # of success string
-                    for line in out_lines:
-                        if line.find(test.stSuccessString) >= 0:
-                            test.compare_successful = True
-                            break
+                    if test.analysisMainArgs == "":
+                        option = ""
+                    else:
+                        option = eval(f"suite.{test.analysisMainArgs}")
 
-                    of.close()
+                    cmd_name = os.path.basename(test.analysisRoutine)
+                    cmd_string = f"./{cmd_name} {option} {output_file}"
+                    outfile = f"{test.name}.analysis.out"
+                    _, _, rc = test_util.run(cmd_string, outfile=outfile, store_command=True)
 
-                with open(test.comparison_outfile, 'w') as cf:
-                    if test.compare_successful:
-                        cf.write("SELF TEST SUCCESSFUL\n")
+                    if rc == 0:
+                        analysis_successful = True
                     else:
-                        cf.write("SELF TEST FAILED\n")
+                        analysis_successful = False
+                        suite.log.warn("analysis failed...")
 
+                        # Print analysis error message (useful for CI tests)
+                        if suite.verbose > 0:
+                            with open(outfile) as f:
+                                print(f.read())
 
-        #----------------------------------------------------------------------
-        # do any requested visualization (2- and 3-d only) and analysis
-        #----------------------------------------------------------------------
-        if (test.ignore_return_code == 1 or test.return_code == 0) and not test.selfTest:
-            if output_file != "":
-                if args.make_benchmarks is None:
+                    analysis_time = time.time() - analysis_start_time
+                    suite.log.log(f"Analysis time: {analysis_time:.3f} s")
 
-                    # get any parameters for the summary table
-                    job_info_file = f"{output_file}/job_info"
-                    if os.path.isfile(job_info_file):
-                        test.has_jobinfo = 1
+                    test.analysis_successful = analysis_successful
 
-                    try:
-                        jif = open(job_info_file)
-                    except:
-                        suite.log.warn("unable to open the job_info file")
-                    else:
-                        job_file_lines = jif.readlines()
-                        jif.close()
-
-                        if suite.summary_job_info_field1 != "":
-                            for l in job_file_lines:
-                                if l.startswith(suite.summary_job_info_field1.strip()) and l.find(":") >= 0:
-                                    _tmp = l.split(":")[1]
-                                    idx = _tmp.rfind("/") + 1
-                                    test.job_info_field1 = _tmp[idx:]
-                                    break
-
-                        if suite.summary_job_info_field2 != "":
-                            for l in job_file_lines:
-                                if l.startswith(suite.summary_job_info_field2.strip()) and l.find(":") >= 0:
-                                    _tmp = l.split(":")[1]
-                                    idx = _tmp.rfind("/") + 1
-                                    test.job_info_field2 = _tmp[idx:]
-                                    break
-
-                        if suite.summary_job_info_field3 != "":
-                            for l in job_file_lines:
-                                if l.startswith(suite.summary_job_info_field3.strip()) and l.find(":") >= 0:
-                                    _tmp = l.split(":")[1]
-                                    idx = _tmp.rfind("/") + 1
-                                    test.job_info_field3 = _tmp[idx:]
-                                    break
-
-                    # visualization
-                    if test.doVis:
-
-                        if test.dim == 1:
-                            suite.log.log(f"Visualization not supported for dim = {test.dim}")
-                        else:
-                            suite.log.log("doing the visualization...")
-                            tool = suite.tools["fsnapshot"]
-                            test_util.run('{} --palette {}/Palette --variable "{}" "{}"'.format(
-                                tool, suite.f_compare_tool_dir, test.visVar, output_file))
-
-                            # convert the .ppm files into .png files
-                            ppm_file = test_util.get_recent_filename(output_dir, "", ".ppm")
-                            if not ppm_file is None:
-                                png_file = ppm_file.replace(".ppm", ".png")
-                                from PIL import Image
-                                with Image.open(ppm_file) as im:
-                                    im.save(png_file)
-                                test.png_file = png_file
-
-                    # analysis
-                    if not test.analysisRoutine == "":
-
-                        suite.log.log("doing the analysis...")
-                        analysis_start_time = time.time()
-                        if not test.extra_build_dir == "":
-                            tool = f"{suite.repos[test.extra_build_dir].dir}/{test.analysisRoutine}"
-                        else:
-                            tool = f"{suite.source_dir}/{test.analysisRoutine}"
+        else:
+            if test.doVis or test.analysisRoutine != "":
+                suite.log.warn("no output file.  Skipping visualization")
+
+    #----------------------------------------------------------------------
+    # move the output files into the web directory
+    #----------------------------------------------------------------------
+    # were any Backtrace files output (indicating a crash)
+    suite.copy_backtrace(test)
+
+    if args.make_benchmarks is None:
+        shutil.copy(test.outfile, suite.full_web_dir)
+        if os.path.isfile(test.errfile):
+            shutil.copy(test.errfile, suite.full_web_dir)
+            test.has_stderr = True
+        if test.doComparison:
+            try:
+                shutil.copy(test.comparison_outfile, suite.full_web_dir)
+            except FileNotFoundError:
+                pass
+        if test.comparison is not None or test.particle_comparisons:
+            shutil.copy(f"{test.name}.compare.json", suite.full_web_dir)
+        if test.has_diff_locations:
+            shutil.copy(f"{test.name}.diff.npz", suite.full_web_dir)
+        try:
+            shutil.copy(f"{test.name}.analysis.out", suite.full_web_dir)
+        except:
+            pass
 
-                        shutil.copy(tool, os.getcwd())
+        if test.inputFile:
+            shutil.copy(test.inputFile, "{}/{}.{}".format(
+                suite.full_web_dir, test.name, test.inputFile))
 
-                        if test.analysisMainArgs == "":
-                            option = ""
-                        else:
-                            option = eval(f"suite.{test.analysisMainArgs}")
+        if test.has_jobinfo:
+            shutil.copy(job_info_file, "{}/{}.job_info".format(
+                suite.full_web_dir, test.name))
 
-                        cmd_name = os.path.basename(test.analysisRoutine)
-                        cmd_string = f"./{cmd_name} {option} {output_file}"
-                        outfile = f"{test.name}.analysis.out"
-                        _, _, rc = test_util.run(cmd_string, outfile=outfile, store_command=True)
+        if suite.sourceTree == "C_Src" and test.probinFile != "":
+            shutil.copy(test.probinFile, "{}/{}.{}".format(
+                suite.full_web_dir, test.name, test.probinFile))
 
-                        if rc == 0:
-                            analysis_successful = True
-                        else:
-                            analysis_successful = False
-                            suite.log.warn("analysis failed...")
+        for af in test.auxFiles:
 
-                            # Print analysis error message (useful for CI tests)
-                            if suite.verbose > 0:
-                                with open(outfile) as f:
-                                    print(f.read())
+            # strip out any sub-directory under build dir for the aux file
+            # when copying
+            shutil.copy(os.path.basename(af),
+                        "{}/{}.{}".format(suite.full_web_dir,
+                                          test.name, os.path.basename(af)))
 
-                        analysis_time = time.time() - analysis_start_time
-                        suite.log.log(f"Analysis time: {analysis_time:.3f} s")
+        if not test.png_file is None:
+            try:
+                shutil.copy(test.png_file, suite.full_web_dir)
+            except OSError:
+                # visualization was not successful.  Reset image
+                test.png_file = None
 
-                        test.analysis_successful = analysis_successful
+        if not test.analysisRoutine == "":
+            try:
+                shutil.copy(test.analysisOutputImage, suite.full_web_dir)
+            except OSError:
+                suite.log.warn("unable to copy analysis image")
+                # analysis was not successful.  Reset the output image
+                test.analysisOutputImage = ""
 
-            else:
-                if test.doVis or test.analysisRoutine != "":
-                    suite.log.warn("no output file.  Skipping visualization")
+    elif test.ignore_return_code == 1 or test.return_code == 0:
+        if test.doComparison:
+            shutil.copy(f"{test.name}.status", suite.full_web_dir)
 
-        #----------------------------------------------------------------------
-        # if the test ran and passed, add its runtime to the dictionary
-        #----------------------------------------------------------------------
 
-        if (test.ignore_return_code == 1 or test.return_code == 0) and test.record_runtime(suite):
-            test_dict = runtimes.setdefault(test.name, suite.timing_default)
-            test_dict["runtimes"].insert(0, test.wall_time)
-            test_dict["dates"].insert(0, suite.test_dir.rstrip("/"))
+    #----------------------------------------------------------------------
+    # archive (or delete) the output
+    #----------------------------------------------------------------------
+    suite.log.log("archiving the output...")
+    match_count = 0
+    archived_file_list = []
+    for pfile in os.listdir(output_dir):
 
-        #----------------------------------------------------------------------
-        # move the output files into the web directory
-        #----------------------------------------------------------------------
-        # were any Backtrace files output (indicating a crash)
-        suite.copy_backtrace(test)
+        if (os.path.isdir(pfile) and
+            re.match(f"{test.name}.*_(plt|chk)[0-9]+", pfile)):
 
-        if args.make_benchmarks is None:
-            shutil.copy(test.outfile, suite.full_web_dir)
-            if os.path.isfile(test.errfile):
-                shutil.copy(test.errfile, suite.full_web_dir)
-                test.has_stderr = True
-            if test.doComparison:
+            match_count += 1
+
+            if suite.purge_output == 1 and not pfile == output_file:
+
+                # delete the plt/chk file
                 try:
-                    shutil.copy(test.comparison_outfile, suite.full_web_dir)
-                except FileNotFoundError:
-                    pass
-            try:
-                shutil.copy(f"{test.name}.analysis.out", suite.full_web_dir)
-            except:
-                pass
+                    shutil.rmtree(pfile)
+                except:
+                    suite.log.warn(f"unable to remove {pfile}")
 
-            if test.inputFile:
-                shutil.copy(test.inputFile, "{}/{}.{}".format(
-                    suite.full_web_dir, test.name, test.inputFile))
+            elif suite.archive_output == 1:
+                # tar (or zip) it up
+                try:
+                    archived_file_list.append(plotfile.archive_plotfile(pfile, suite.archive_format))
 
-            if test.has_jobinfo:
-                shutil.copy(job_info_file, "{}/{}.job_info".format(
-                    suite.full_web_dir, test.name))
+                except:
+                    suite.log.warn(f"unable to archive output file {pfile}")
 
-            if suite.sourceTree == "C_Src" and test.probinFile != "":
-                shutil.copy(test.probinFile, "{}/{}.{}".format(
-                    suite.full_web_dir, test.name, test.probinFile))
+                else:
+                    try:
+                        shutil.rmtree(pfile)
+                    except OSError:
+                        suite.log.warn(f"unable to remove {pfile}")
 
-            for af in test.auxFiles:
+    if suite.fail_on_no_output and match_count == 0:
+        suite.log.fail("ERROR: test output could not be found!")
+
+    record_progress(suite, test, "archived")
+
+
+    #----------------------------------------------------------------------
+    # write the report for this test
+    #----------------------------------------------------------------------
+    if args.make_benchmarks is None:
+        suite.log.log("creating problem test report ...")
+        report_test(suite, test, test_list, args)
+
+    #----------------------------------------------------------------------
+    # if test ran and passed, remove test directory if requested
+    #----------------------------------------------------------------------
+    test_successful = (test.return_code == 0 and test.analysis_successful and test.compare_successful)
+    if (test.ignore_return_code == 1 or test_successful):
+        if args.clean_testdir:
+            # remove subdirectories
+            suite.log.log("removing subdirectories from test directory...")
+            for file_name in os.listdir(output_dir):
+                file_path = os.path.join(output_dir, file_name)
+                if os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+
+            # remove archived plotfiles
+            suite.log.log("removing compressed plotfiles from test directory...")
+            for file_name in archived_file_list:
+                file_path = os.path.join(output_dir, file_name)
+                os.remove(file_path)
+
+            # switch to the full test directory
+            os.chdir(suite.full_test_dir)
+        if args.delete_exe:
+            suite.log.log("removing executable from test directory...")
+            os.remove(executable)
+
+
+def run_parallel(suite, run_order, test_list, args, runtimes, bench_dir):
+    """ process the tests of test_list, in run_order, args.jobs at a
+        time, each in a process of its own, and collect their results """
+
+    def work(test, built):
+        process_test(suite, test, test_list, args, runtimes, bench_dir, built)
+        counters = None
+        if args.make_benchmarks is not None:
+            store = suite.get_benchmark_store()
+            counters = (store.bytes_written, store.bytes_reflinked, store.bytes_reused)
+        return scheduler.picklable_state(test), counters
+
+    crashed = []
+    processed = set()
+    failed, broken_builds = [], {}
+
+    def done(test, result):
+        processed.add(test.name)
+
+        if result is None:
+            crashed.append(test.name)
+            failed.append(test.name)
+            if args.fail_fast > 0 and len(failed) >= args.fail_fast:
+                runner.cancel()
+            return
+
+        state, counters = result
+        test.__dict__.update(state)
+        record_progress(suite, test, "reported")
+        if counters is not None:
+            store = suite.get_benchmark_store()
+            store.bytes_written += counters[0]
+            store.bytes_reflinked += counters[1]
+            store.bytes_reused += counters[2]
+        record_runtime(suite, test, runtimes)
+
+        check_failure(suite, test, failed, broken_builds)
+        if args.fail_fast > 0 and len(failed) >= args.fail_fast:
+            runner.cancel()
+
+    def skip(test):
+        return get_skip_reason(suite, args, test, failed, broken_builds) != ""
+
+    # a child only reports what it added to the store
+    if args.make_benchmarks is not None:
+        store = suite.get_benchmark_store()
+        store.bytes_written = store.bytes_reflinked = store.bytes_reused = 0
 
-                # strip out any sub-directory under build dir for the aux file
-                # when copying
-                shutil.copy(os.path.basename(af),
-                            "{}/{}.{}".format(suite.full_web_dir,
-                                              test.name, os.path.basename(af)))
+    suite.log.skip()
+    suite.log.bold(f"processing the tests, {args.jobs} at a time...")
+    # in throughput mode, the processes run one test after the other
+    if args.throughput:
+        runner = scheduler.WorkerPool(args.jobs, suite.log, suite.get_core_set(args.jobs))
+    else:
+        runner = scheduler.Scheduler(args.jobs, suite.log, suite.get_core_set(args.jobs))
+    runner.run(run_order, work, lambda t: get_build_key(suite, t), done, skip=skip)
+    os.chdir(suite.testTopDir)
 
-            if not test.png_file is None:
-                try:
-                    shutil.copy(test.png_file, suite.full_web_dir)
-                except OSError:
-                    # visualization was not successful.  Reset image
-                    test.png_file = None
+    # a test whose process died still needs a result in the report
+    for test in run_order:
+        if test.name in crashed and get_status(suite, test) == "":
+            report.report_single_test(suite, test, test_list,
+                                      failure_msg="ERROR: processing the test failed")
 
-            if not test.analysisRoutine == "":
-                try:
-                    shutil.copy(test.analysisOutputImage, suite.full_web_dir)
-                except OSError:
-                    suite.log.warn("unable to copy analysis image")
-                    # analysis was not successful.  Reset the output image
-                    test.analysisOutputImage = ""
+    # what was skipped or cancelled
+    for test in run_order:
+        if test.name not in processed:
+            reason = get_skip_reason(suite, args, test, failed, broken_builds)
+            skip_test(suite, test, reason or "cancelled")
 
-        elif test.ignore_return_code == 1 or test.return_code == 0:
-            if test.doComparison:
-                shutil.copy(f"{test.name}.status", suite.full_web_dir)
+def test_suite(argv):
+    """
+    the main test suite driver
+    """
 
+    # parse the commandline arguments
+    args = test_util.get_args(arg_string=argv)
+
+    # read in the test information
+    suite, test_list = params.load_params(args)
 
-        #----------------------------------------------------------------------
-        # archive (or delete) the output
-        #----------------------------------------------------------------------
-        suite.log.log("archiving the output...")
-        match_count = 0
-        archived_file_list = []
-        for pfile in os.listdir(output_dir):
+    active_test_list = [t.name for t in test_list]
+    defined_tests = test_list
 
-            if (os.path.isdir(pfile) and
-                re.match(f"{test.name}.*_(plt|chk)[0-9]+", pfile)):
+    test_list = suite.get_tests_to_run(test_list)
 
-                match_count += 1
+    suite.log.skip()
+    suite.log.bold("running tests: ")
+    suite.log.indent()
+    for obj in test_list:
+        suite.log.log(obj.name)
+    suite.log.outdent()
 
-                if suite.purge_output == 1 and not pfile == output_file:
+    if not args.complete_report_from_crash == "":
 
-                    # delete the plt/chk file
-                    try:
-                        shutil.rmtree(pfile)
-                    except:
-                        suite.log.warn(f"unable to remove {pfile}")
+        # make sure the web directory from the crash run exists
+        suite.full_web_dir = "{}/{}/".format(
+            suite.webTopDir, args.complete_report_from_crash)
+        if not os.path.isdir(suite.full_web_dir):
+            suite.log.fail("Crash directory does not exist")
 
-                elif suite.archive_output == 1:
-                    # tar it up
-                    try:
-                        tarfilename = f"{pfile}.tgz"
-                        tar = tarfile.open(tarfilename, "w:gz")
-                        tar.add(f"{pfile}")
-                        tar.close()
-                        archived_file_list.append(tarfilename)
+        suite.test_dir = args.complete_report_from_crash
 
-                    except:
-                        suite.log.warn(f"unable to tar output file {pfile}")
+        # find all the tests that completed in that web directory
+        tests, test_file, crash_update_time, made_benchmarks = recover_crashed_run(
+            suite, args.complete_report_from_crash, defined_tests)
 
-                    else:
-                        try:
-                            shutil.rmtree(pfile)
-                        except OSError:
-                            suite.log.warn(f"unable to remove {pfile}")
+        # create the report for this test run
+        num_failed = report.report_this_test_run(suite, "" if made_benchmarks else None,
+                                                 "recreated report after crash of suite",
+                                                 crash_update_time, tests, test_file)
 
-        if suite.fail_on_no_output and match_count == 0:
-            suite.log.fail("ERROR: test output could not be found!")
+        # create the suite report
+        suite.log.bold("creating suite report...")
+        report.report_all_runs(suite, active_test_list)
+        suite.log.close_log()
+        sys.exit("done")
 
 
-        #----------------------------------------------------------------------
-        # write the report for this test
-        #----------------------------------------------------------------------
-        if args.make_benchmarks is None:
-            suite.log.log("creating problem test report ...")
-            report.report_single_test(suite, test, test_list)
-
-        #----------------------------------------------------------------------
-        # if test ran and passed, remove test directory if requested
-        #----------------------------------------------------------------------
-        test_successful = (test.return_code == 0 and test.analysis_successful and test.compare_successful)
-        if (test.ignore_return_code == 1 or test_successful):
-            if args.clean_testdir:
-                # remove subdirectories
-                suite.log.log("removing subdirectories from test directory...")
-                for file_name in os.listdir(output_dir):
-                    file_path = os.path.join(output_dir, file_name)
-                    if os.path.isdir(file_path):
-                        shutil.rmtree(file_path)
-
-                # remove archived plotfiles
-                suite.log.log("removing compressed plotfiles from test directory...")
-                for file_name in archived_file_list:
-                    file_path = os.path.join(output_dir, file_name)
-                    os.remove(file_path)
-
-                # switch to the full test directory
-                os.chdir(suite.full_test_dir)
-            if args.delete_exe:
-                suite.log.log("removing executable from test directory...")
-                os.remove(executable)
+    #--------------------------------------------------------------------------
+    # check bench dir and create output directories
+    #--------------------------------------------------------------------------
+    all_compile = all([t.compileTest == 1 for t in test_list])
+
+    if not all_compile:
+        bench_dir = suite.get_bench_dir()
+
+    if args.list_benchmark_versions or args.rollback_benchmarks is not None:
+        benchmark_versions(suite, test_list, args.rollback_benchmarks)
+        suite.log.close_log()
+        sys.exit("done")
+
+    if not args.copy_benchmarks is None:
+        last_run = suite.get_last_run()
+
+    if args.resume:
+        test_list, resume_update_time, progress = resume_run(suite, args.resume, test_list)
+    else:
+        suite.make_test_dirs()
+
+    if suite.slack_post:
+        if args.note == "" and suite.repos["source"].pr_wanted is not None:
+            note = "testing PR-{}".format(suite.repos["source"].pr_wanted)
+        else:
+            note = args.note
+
+        msg = "> {} ({}) test suite {}, id: {}\n> {}".format(
+            suite.suiteName, suite.sub_title, "resumed" if args.resume else "started",
+            suite.test_dir, note)
+        suite.slack_post_it(msg)
+
+    if not args.copy_benchmarks is None:
+        old_full_test_dir = suite.testTopDir + suite.suiteName + "-tests/" + last_run
+        copy_benchmarks(old_full_test_dir, suite.full_web_dir, test_list,
+                        suite.get_benchmark_store(), suite.benchmarkVersionsKept, suite.log)
+
+        # here, args.copy_benchmarks plays the role of make_benchmarks
+        num_failed = report.report_this_test_run(suite, args.copy_benchmarks,
+                                                 "copy_benchmarks used -- no new tests run",
+                                                 "",
+                                                 test_list, args.input_file[0])
+        report.report_all_runs(suite, active_test_list)
+
+        if suite.slack_post:
+            msg = f"> copied benchmarks\n> {args.copy_benchmarks}"
+            suite.slack_post_it(msg)
+
+        sys.exit("done")
+
+
+    #--------------------------------------------------------------------------
+    # figure out what needs updating and do the git updates, save the
+    # current hash / HEAD, and make a ChangeLog
+    # --------------------------------------------------------------------------
+    now = time.localtime(time.time())
+    update_time = time.strftime("%Y-%m-%d %H:%M:%S %Z", now)
+    if args.resume:
+        update_time = resume_update_time
+
+    no_update = args.no_update.lower()
+    if not args.copy_benchmarks is None:
+        no_update = "all"
+
+    # the default is to update everything, unless we specified a hash
+    # when constructing the Repo object
+    if no_update == "none":
+        pass
+
+    elif no_update == "all":
+        for k in suite.repos:
+            suite.repos[k].update = False
+
+    else:
+        nouplist = [k.strip() for k in no_update.split(",")]
+
+        for repo in suite.repos.keys():
+            if repo.lower() in nouplist:
+                suite.repos[repo].update = False
+
+    os.chdir(suite.testTopDir)
+
+    for k in suite.repos:
+        suite.log.skip()
+        suite.log.bold(f"repo: {suite.repos[k].name}")
+        suite.log.indent()
+
+        if suite.repos[k].update or suite.repos[k].hash_wanted:
+            suite.repos[k].git_update()
+
+        suite.repos[k].save_head()
+
+        if suite.repos[k].update:
+            suite.repos[k].make_changelog()
+
+        suite.log.outdent()
+
+
+    # keep track if we are running on any branch that is not the suite
+    # default
+    branches = [suite.repos[r].get_branch_name() for r in suite.repos]
+    if not all(suite.default_branch == b for b in branches):
+        suite.log.warn("some git repos are not on the default branch")
+        bf = open(f"{suite.full_web_dir}/branch.status", "w")
+        bf.write("branch different than suite default")
+        bf.close()
+
+    #--------------------------------------------------------------------------
+    # build the tools and do a make clean, only once per build directory
+    #--------------------------------------------------------------------------
+    suite.ccache_setup()
+
+    suite.build_tools(test_list)
+
+    all_build_dirs = find_build_dirs(test_list)
+
+    # with the fingerprint policy, a build directory is only cleaned
+    # when a test is built there with a changed configuration
+    # (when resuming, the build directories hold what the run built)
+    if suite.realclean_policy != "always" or args.resume:
+        all_build_dirs = []
+    else:
+        suite.log.skip()
+        suite.log.bold("make clean in...")
+
+    for d, source_tree in all_build_dirs:
+
+        if not source_tree == "":
+            suite.log.log(f"{d} in {source_tree}")
+            os.chdir(suite.repos[source_tree].dir + d)
+            suite.make_realclean(repo=source_tree)
+        else:
+            suite.log.log(f"{d}")
+            os.chdir(suite.source_dir + d)
+            if suite.sourceTree in ["AMReX", "amrex"]:
+                suite.make_realclean(repo="AMReX")
+            else:
+                suite.make_realclean()
+
+    os.chdir(suite.testTopDir)
+
+
+    #--------------------------------------------------------------------------
+    # Setup Cmake if needed
+    #--------------------------------------------------------------------------
+    if suite.useCmake and not suite.isSuperbuild:
+        cmake_setup(suite)
 
 
     #--------------------------------------------------------------------------
-    # Clean Cmake build and install directories if needed
+    # Get execution times from previous runs
+    #--------------------------------------------------------------------------
+    runtimes = suite.get_wallclock_history()
+
+    #--------------------------------------------------------------------------
+    # journal the progress of the run, or pick up where it stopped
+    #--------------------------------------------------------------------------
+    pending = test_list
+    if args.resume:
+        pending = []
+        for test in test_list:
+            entry = progress.get(test.name, {})
+            if entry.get("stage") == "reported" and entry.get("state") is not None:
+                test.__dict__.update(entry["state"])
+                record_runtime(suite, test, runtimes)
+                continue
+
+            # start the test over
+            if os.path.isdir(suite.full_test_dir + test.name):
+                shutil.rmtree(suite.full_test_dir + test.name)
+            pending.append(test)
+    else:
+        suite.journal = journal.Journal(suite.full_test_dir)
+        suite.journal.start(suite, test_list, update_time)
+
+    #--------------------------------------------------------------------------
+    # main loop over tests
+    #--------------------------------------------------------------------------
+    run_order = plan_tests(suite, pending, runtimes, args)
+
+    if args.jobs > 1:
+        run_parallel(suite, run_order, test_list, args, runtimes, bench_dir)
+    else:
+        failed, broken_builds = [], {}
+        cores = suite.get_core_set(args.jobs)
+        for test in run_order:
+            reason = get_skip_reason(suite, args, test, failed, broken_builds)
+            if reason:
+                skip_test(suite, test, reason)
+                continue
+
+            if cores is not None:
+                cores.acquire(test)
+            process_test(suite, test, test_list, args, runtimes, bench_dir)
+            if cores is not None:
+                cores.release(test)
+            record_progress(suite, test, "reported")
+            record_runtime(suite, test, runtimes)
+            check_failure(suite, test, failed, broken_builds)
+
+
+    # the pages that were put off, in one pass
+    if args.throughput:
+        suite.log.skip()
+        suite.log.bold("writing the test pages...")
+        write_test_pages(suite, test_list)
+
+    #--------------------------------------------------------------------------
+    # Evict old Cmake build trees if they exceed the quota
     #--------------------------------------------------------------------------
     if suite.useCmake:
-        suite.cmake_clean("AMReX", suite.amrex_dir)
-        suite.cmake_clean(suite.suiteName, suite.source_dir)
+        suite.cmake_clean()
+
+    #--------------------------------------------------------------------------
+    # compiler cache statistics for this run
+    #--------------------------------------------------------------------------
+    suite.report_ccache()
+
+    #--------------------------------------------------------------------------
+    # drop the benchmark contents nothing refers to anymore
+    #--------------------------------------------------------------------------
+    if args.make_benchmarks is not None:
+        store = suite.get_benchmark_store()
+        store.prune()
+        suite.log.log(store.summary())
 
     #--------------------------------------------------------------------------
     # jsonify and save runtimes
@@ -1269,7 +1794,7 @@ def test_suite(argv):
     # parameter coverage
     #--------------------------------------------------------------------------
     if suite.reportCoverage:
-        determine_coverage(suite)
+        determine_coverage(suite, active_test_list)
 
     #--------------------------------------------------------------------------
     # write the report for this instance of the test suite
@@ -0,0 +1,139 @@
+"""Give each running test cores of its own.
+
+When tests run at the same time, their MPI ranks and OpenMP threads
+would otherwise all land on the same cores, slowing each other down and
+making the timings meaningless.  A CoreSet hands out disjoint sets of the
+CPUs the suite may use, numprocs * numthreads of them per test, keeping
+a test within one NUMA node when it fits in one, and using one hardware
+thread per core before doubling up on hyperthreads.  A test waits until
+enough cores are free."""
+
+import glob
+import os
+
+def parse_cpulist(cpulist):
+    """ the CPUs in a list like 0-3,8,10-11 """
+
+    cpus = []
+    for part in cpulist.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def format_cpulist(cpus):
+    """ the list form, 0-3,8,10-11, of the CPUs cpus """
+
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+def format_cpumask(cpus):
+    """ the hex mask of the CPUs cpus """
+
+    return hex(sum(1 << cpu for cpu in cpus))
+
+def rank_masks(cpus, nranks):
+    """ the hex masks of the CPUs of each of nranks MPI ranks, splitting
+        cpus evenly between them, separated by commas """
+
+    chunk = max(1, len(cpus) // max(1, nranks))
+    masks = []
+    for r in range(max(1, nranks)):
+        masks.append(format_cpumask(cpus[r*chunk:(r+1)*chunk] or cpus))
+    return ",".join(masks)
+
+def read_sys(path):
+    """ the contents of a sysfs file, or "" """
+
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def numa_nodes(cpus):
+    """ the CPUs of cpus grouped by NUMA node """
+
+    nodes = []
+    for node in sorted(glob.glob("/sys/devices/system/node/node[0-9]*")):
+        node_cpus = [c for c in parse_cpulist(read_sys(f"{node}/cpulist")) if c in cpus]
+        if node_cpus:
+            nodes.append(node_cpus)
+
+    seen = {c for node in nodes for c in node}
+    if len(seen) < len(cpus):
+        nodes.append([c for c in cpus if c not in seen])
+    return nodes
+
+def thread_index(cpu):
+    """ which hardware thread of its core cpu is: 0 for the first """
+
+    siblings = parse_cpulist(read_sys(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list"))
+    return siblings.index(cpu) if cpu in siblings else 0
+
+def cores_needed(test):
+    """ the number of cores test runs on """
+
+    n = 1
+    if test.useMPI:
+        n *= max(1, test.numprocs)
+    if test.useOMP:
+        n *= max(1, test.numthreads)
+    return n
+
+class CoreSet:
+    """ the CPUs the suite may run tests on, and which are in use """
+
+    def __init__(self, cpus=None):
+
+        if cpus is None:
+            cpus = os.sched_getaffinity(0)
+
+        order = {c: (thread_index(c), c) for c in cpus}
+        self.nodes = [sorted(node, key=order.get) for node in numa_nodes(set(cpus))]
+        self.free = set(cpus)
+
+    def size(self):
+        """ the number of CPUs in the set """
+
+        return sum(len(node) for node in self.nodes)
+
+    def needed(self, test):
+        """ the cores test gets -- all of them, if it needs more """
+
+        return min(cores_needed(test), self.size())
+
+    def fits(self, test):
+        """ are there enough free cores to start test? """
+
+        return len(self.free) >= self.needed(test)
+
+    def acquire(self, test):
+        """ take the cores for test, and store them in test.cpus: from the
+            fullest NUMA node that still has room for all of them, or
+            else from the emptiest nodes first """
+
+        n = self.needed(test)
+        free = [[c for c in node if c in self.free] for node in self.nodes]
+
+        room = [node for node in free if len(node) >= n]
+        if room:
+            cpus = min(room, key=len)[:n]
+        else:
+            cpus = []
+            for node in sorted(free, key=len, reverse=True):
+                cpus.extend(node[:n - len(cpus)])
+
+        self.free -= set(cpus)
+        test.cpus = sorted(cpus)
+
+    def release(self, test):
+        """ give the cores of test back """
+
+        self.free |= set(test.cpus)
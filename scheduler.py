@@ -0,0 +1,438 @@
+"""Run the tests of the suite in parallel.
+
+Processing a test changes directory and writes files relative to it, so
+each test is processed in a forked process of its own.  The child sends
+the state of its Test object back to the suite when it is done.  Tests
+that build in the same directory are never built at the same time, but
+once a test has what it needs from its build directory, the next test
+there can be built while the first one runs.
+
+In throughput mode, a WorkerPool keeps the processes instead, each one
+running the tests it is sent one after the other."""
+
+import os
+import pickle
+import select
+import signal
+import struct
+import sys
+
+FRAME = struct.Struct("<Q")
+
+def receive(f):
+    """ read a message written by send from the file f, or None at the
+        end of it """
+
+    data = f.read(FRAME.size)
+    if len(data) < FRAME.size:
+        return None
+    (n,) = FRAME.unpack(data)
+    return pickle.loads(f.read(n))
+
+def send(fd, message):
+    """ write message to the pipe fd, as a length-prefixed pickle """
+
+    data = pickle.dumps(message)
+    data = FRAME.pack(len(data)) + data
+    while data:
+        n = os.write(fd, data)
+        data = data[n:]
+
+def picklable_state(obj):
+    """ the attributes of obj that can be sent to another process """
+
+    state = {}
+    for key, value in obj.__dict__.items():
+        try:
+            pickle.dumps(value)
+        except Exception:
+            continue
+        state[key] = value
+    return state
+
+def order_lpt(tests, expected, group):
+    """ order tests longest expected time first (LPT), so the long tests
+        don't start last and leave the other processes idle at the end.
+        Tests with the same group(test) -- they share an executable --
+        are kept together, longest first, so they follow the one build
+        of it.  Groups go in order of their longest test """
+
+    groups = {}
+    for test in tests:
+        groups.setdefault(group(test), []).append(test)
+
+    for g in groups.values():
+        g.sort(key=lambda t: -expected[t.name])
+
+    return [t for g in sorted(groups.values(), key=lambda g: -expected[g[0].name])
+            for t in g]
+
+def predict_makespan(tests, run_time, build_time, key, jobs):
+    """ the time to process tests in order, jobs at a time, when a test
+        waits for the builds before it in its build directory, key(test) """
+
+    slots = [0.0] * max(1, jobs)
+    dir_free = {}
+
+    for test in tests:
+        i = slots.index(min(slots))
+        start = max(slots[i], dir_free.get(key(test), 0.0))
+        dir_free[key(test)] = start + build_time[test.name]
+        slots[i] = start + build_time[test.name] + run_time[test.name]
+
+    return max(slots)
+
+class Child:
+    """ a forked process working on one test """
+
+    def __init__(self, test, pid, fd, key):
+
+        self.test = test
+        self.pid = pid
+        self.fd = fd
+        self.key = key      # the build directory, while it is held
+
+        self.buffer = b""
+        self.result = None
+        self.error = None
+
+    def messages(self):
+        """ the complete messages in the buffer, removing them """
+
+        while len(self.buffer) >= FRAME.size:
+            (n,) = FRAME.unpack_from(self.buffer)
+            if len(self.buffer) < FRAME.size + n:
+                break
+            yield pickle.loads(self.buffer[FRAME.size:FRAME.size+n])
+            self.buffer = self.buffer[FRAME.size+n:]
+
+class Scheduler:
+    """ run work(test, built) for each test, jobs at a time, in forked
+        processes.  work calls built() once test is done with its build
+        directory, and returns what is passed on to done(test, result)
+        in the suite's process -- result is None if the child failed """
+
+    def __init__(self, jobs, log, resources=None):
+
+        self.jobs = max(1, jobs)
+        self.log = log
+        self.resources = resources     # the cores, if tests get their own
+
+        self.children = {}     # by pipe fd
+        self.busy = set()      # build directories in use
+        self.cancelled = False
+
+    def start(self, test, key, work):
+        """ fork a child to run work on test """
+
+        self.log.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        if self.resources is not None:
+            self.resources.acquire(test)
+
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+
+        if pid == 0:
+            # a process group of its own, so that cancelling the test
+            # also stops what it runs
+            os.setpgid(0, 0)
+            os.close(rfd)
+            status = 1
+            try:
+                self.log.set_prefix(f"{test.name}: ")
+                sys.stdout.reconfigure(line_buffering=True)
+                result = work(test, lambda: send(wfd, ("built", None)))
+                send(wfd, ("done", result))
+                status = 0
+            except BaseException as err:
+                send(wfd, ("error", str(err) or type(err).__name__))
+            finally:
+                self.log.flush()
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        try:
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+
+        os.close(wfd)
+        self.busy.add(key)
+        self.children[rfd] = Child(test, pid, rfd, key)
+
+    def release(self, child):
+        """ the build directory of child can be used by the next test """
+
+        if child.key is not None:
+            self.busy.discard(child.key)
+            child.key = None
+
+    def receive(self, child, kind, value, done):
+        """ handle a message from child """
+
+        if kind == "built":
+            self.release(child)
+        elif kind == "done":
+            child.result = value
+        else:
+            child.error = value
+
+    def finish(self, child, done):
+        """ reap child and hand its result on """
+
+        os.close(child.fd)
+        del self.children[child.fd]
+        _, status = os.waitpid(child.pid, 0)
+        self.release(child)
+        if self.resources is not None:
+            self.resources.release(child.test)
+
+        if child.error is None and status != 0:
+            child.error = f"exit status {status}"
+        if child.error is not None:
+            self.log.testfail(f"{child.test.name} failed: {child.error}")
+
+        done(child.test, child.result if child.error is None else None)
+
+    def cancel(self):
+        """ start no more tests, and stop the ones running -- done is
+            not called for them """
+
+        self.cancelled = True
+
+    def kill(self):
+        """ terminate the children, and everything they started """
+
+        for child in list(self.children.values()):
+            try:
+                os.killpg(child.pid, signal.SIGTERM)
+            except OSError:
+                pass
+            try:
+                os.waitpid(child.pid, 0)
+            except OSError:
+                pass
+            os.close(child.fd)
+            if self.resources is not None:
+                self.resources.release(child.test)
+
+        self.children = {}
+        self.busy = set()
+
+    def run(self, tests, work, key, done, skip=None):
+        """ process tests in order, except that a test waits while
+            another one is building in its directory, key(test).  Tests
+            for which skip(test) is true when their turn comes are not
+            started.  done may call cancel() to stop everything """
+
+        pending = list(tests)
+
+        try:
+            while (pending and not self.cancelled) or self.children:
+
+                # start what we can
+                while len(self.children) < self.jobs and not self.cancelled:
+                    if skip is not None:
+                        pending = [t for t in pending if not skip(t)]
+                    ready = [t for t in pending if key(t) not in self.busy and
+                             (self.resources is None or self.resources.fits(t))]
+                    if not ready:
+                        break
+                    test = ready[0]
+                    pending.remove(test)
+                    self.start(test, key(test), work)
+
+                readable, _, _ = select.select(list(self.children), [], [])
+
+                for fd in readable:
+                    child = self.children[fd]
+                    data = os.read(fd, 65536)
+
+                    if not data:
+                        self.finish(child, done)
+                        continue
+
+                    child.buffer += data
+                    for kind, value in child.messages():
+                        self.receive(child, kind, value, done)
+
+                if self.cancelled:
+                    self.kill()
+
+        finally:
+            # if the suite itself is interrupted, don't leave the
+            # children running
+            self.kill()
+
+class Worker:
+    """ a long-lived process of a WorkerPool """
+
+    def __init__(self, pid, fd, cmd):
+
+        self.pid = pid
+        self.fd = fd        # what the worker sends back
+        self.cmd = cmd      # where its tests are sent
+
+class WorkerPool(Scheduler):
+    """ a Scheduler whose processes outlive their test: up to jobs
+        workers run the tests they are sent back to back, so a short
+        test doesn't pay for starting a process of its own.  A test is
+        sent as its index in the list of tests the workers were forked
+        with, together with its current state """
+
+    def __init__(self, jobs, log, resources=None):
+
+        super().__init__(jobs, log, resources)
+
+        self.tests = []
+        self.work = None
+        self.workers = {}      # by pipe fd
+        self.idle = []
+
+    def run(self, tests, work, key, done, skip=None):
+
+        self.tests = list(tests)
+        self.work = work
+        super().run(tests, work, key, done, skip=skip)
+
+    def serve(self, cmd, wfd):
+        """ the loop of a worker: run the tests sent on cmd until it is
+            closed """
+
+        sys.stdout.reconfigure(line_buffering=True)
+        with os.fdopen(cmd, "rb") as f:
+            while True:
+                message = receive(f)
+                if message is None:
+                    break
+
+                index, state = message
+                test = self.tests[index]
+                test.__dict__.update(state)
+
+                self.log.set_prefix(f"{test.name}: ")
+                try:
+                    result = self.work(test, lambda: send(wfd, ("built", None)))
+                    send(wfd, ("done", result))
+                except (Exception, SystemExit) as err:
+                    send(wfd, ("error", str(err) or type(err).__name__))
+                self.log.flush()
+                sys.stdout.flush()
+                sys.stderr.flush()
+
+    def fork_worker(self):
+        """ start a worker """
+
+        self.log.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        rfd, wfd = os.pipe()
+        crfd, cwfd = os.pipe()
+        pid = os.fork()
+
+        if pid == 0:
+            os.setpgid(0, 0)
+            os.close(rfd)
+            os.close(cwfd)
+            for worker in self.workers.values():
+                os.close(worker.fd)
+                os.close(worker.cmd)
+            status = 1
+            try:
+                self.serve(crfd, wfd)
+                status = 0
+            finally:
+                self.log.flush()
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        try:
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+
+        os.close(wfd)
+        os.close(crfd)
+        worker = Worker(pid, rfd, cwfd)
+        self.workers[rfd] = worker
+        return worker
+
+    def start(self, test, key, work):
+        """ send test to an idle worker, or a new one """
+
+        if self.resources is not None:
+            self.resources.acquire(test)
+
+        message = (self.tests.index(test), picklable_state(test))
+        while True:
+            worker = self.idle.pop() if self.idle else self.fork_worker()
+            try:
+                send(worker.cmd, message)
+                break
+            except OSError:
+                # it died while idle
+                self.log.warn(f"worker {worker.pid} is gone, starting another one")
+                del self.workers[worker.fd]
+                os.close(worker.cmd)
+                os.close(worker.fd)
+                try:
+                    os.waitpid(worker.pid, 0)
+                except OSError:
+                    pass
+
+        self.busy.add(key)
+        self.children[worker.fd] = Child(test, worker.pid, worker.fd, key)
+
+    def receive(self, child, kind, value, done):
+        """ a worker is free again once its test is done """
+
+        super().receive(child, kind, value, done)
+
+        if kind in ("done", "error"):
+            del self.children[child.fd]
+            self.release(child)
+            if self.resources is not None:
+                self.resources.release(child.test)
+            self.idle.append(self.workers[child.fd])
+
+            if child.error is not None:
+                self.log.testfail(f"{child.test.name} failed: {child.error}")
+            done(child.test, child.result if child.error is None else None)
+
+    def finish(self, child, done):
+        """ the worker of child died in the middle of its test """
+
+        worker = self.workers.pop(child.fd)
+        os.close(worker.cmd)
+        super().finish(child, done)
+
+    def kill(self):
+        """ stop the workers: the idle ones by closing their command
+            pipe, the busy ones with their tests """
+
+        for worker in self.workers.values():
+            os.close(worker.cmd)
+            if worker.fd in self.children:
+                try:
+                    os.killpg(worker.pid, signal.SIGTERM)
+                except OSError:
+                    pass
+            try:
+                os.waitpid(worker.pid, 0)
+            except OSError:
+                pass
+            os.close(worker.fd)
+
+            if self.resources is not None and worker.fd in self.children:
+                self.resources.release(self.children[worker.fd].test)
+
+        self.workers = {}
+        self.idle = []
+        self.children = {}
+        self.busy = set()
@@ -1,10 +1,18 @@
 import datetime
+import fcntl
+import hashlib
 import json
 import os
 import glob
 from pathlib import Path
+import shlex
 import shutil
 import sys
+import benchmark_store
+import comparison
+import plotfile
+import resources
+import test_coverage as coverage
 import test_util
 import tempfile as tf
 
@@ -34,6 +42,16 @@ except:
     except:
         DO_TIMINGS_PLOTS = False
 
+# make variables that AMReX's GNU make encodes in the object directory
+# name -- builds differing only in these don't clobber each other's objects
+OBJDIR_VARIABLES = ["DIM", "COMP", "DEBUG", "PRECISION", "USE_MPI", "USE_OMP",
+                    "USE_ACC", "USE_CUDA", "USE_HIP", "USE_SYCL",
+                    "PROFILE", "TINY_PROFILE", "TRACE_PROFILE", "COMM_PROFILE"]
+
+# the compilers behind AMReX's COMP names, used to fingerprint builds
+COMP_EXECUTABLES = {"gnu": "g++", "gcc": "g++", "llvm": "clang++", "intel": "icpc",
+                    "intel-llvm": "icpx", "pgi": "pgc++", "nvhpc": "nvc++", "cray": "CC"}
+
 class Test:
 
     def __init__(self, name):
@@ -87,6 +105,8 @@ class Test:
         self._doComparison = True
         self._tolerance = None
         self._abs_tolerance = None
+        self._tolerance_map = None
+        self.benchmark_version = ""
         self._particle_tolerance = None
         self._particle_abs_tolerance = None
 
@@ -115,11 +135,16 @@ class Test:
         self.wall_time = 0   # set automatically, not by users
         self.build_time = 0  # set automatically, not by users
 
-        self.nlevels = None  # set but running fboxinfo on the output
+        self.nlevels = None  # set from the output's plotfile header
+        self.plotfile_header = None  # filled automatically
 
         self.comp_string = None  # set automatically
         self.run_command = None  # set automatically
 
+        self.cpus = []  # set automatically, the cores the test runs on
+        self.failure_msg = None  # set automatically
+        self.page_pending = False  # set automatically, the page is written later
+
         self.job_info_field1 = ""
         self.job_info_field2 = ""
         self.job_info_field3 = ""
@@ -130,6 +155,10 @@ class Test:
 
         self.has_stderr = False # filled automatically
 
+        self.comparison = None  # the PlotfileDiff, filled automatically
+        self.particle_comparisons = []  # ParticleDiffs, filled automatically
+        self.has_diff_locations = False  # filled automatically
+
         self.compile_successful = False  # filled automatically
         self.compare_successful = False  # filled automatically
         self.analysis_successful = False # filled automatically
@@ -182,7 +211,7 @@ class Test:
                 (os.path.isdir(d) and
                  d.startswith(f"{self.name}_plt") and d[-1].isdigit()) or \
                 (os.path.isfile(d) and
-                 d.startswith(f"{self.name}_plt") and d.endswith(".tgz"))]
+                 d.startswith(f"{self.name}_plt") and d.endswith(plotfile.ARCHIVE_EXTENSIONS))]
 
         if len(plts) == 0:
             self.log.warn("test did not produce any output")
@@ -307,6 +336,33 @@ class Test:
 
         self._abs_tolerance = value
 
+    def get_tolerance_map(self):
+        """ Returns the test's per-variable tolerances, unless a global
+            tolerance was set, which then applies to every variable.
+        """
+
+        if Test.global_tolerance is None and Test.global_abs_tolerance is None:
+            return self._tolerance_map
+        return None
+
+    def set_tolerance_map(self, value):
+        """ Compiles the test's tolerance map from its INI string.  Raises
+            ValueError if it can't be parsed.
+        """
+
+        self._tolerance_map = comparison.ToleranceMap(value)
+
+    def tolerances_for(self, variables, nlevels):
+        """ Returns the relative and absolute tolerances for a comparison
+            of the given variables and number of levels -- either scalars
+            or variable x level arrays.
+        """
+
+        tolerance_map = self.get_tolerance_map()
+        if tolerance_map is None:
+            return self.tolerance, self.abs_tolerance
+        return tolerance_map.lookup(variables, nlevels, self.tolerance, self.abs_tolerance)
+
     def get_particle_tolerance(self):
         """ Returns the global particle tolerance if one was set,
             and the test-specific one otherwise.
@@ -384,6 +440,7 @@ class Test:
     doComparison = property(get_do_comparison, set_do_comparison)
     tolerance = property(get_tolerance, set_tolerance)
     abs_tolerance = property(get_abs_tolerance, set_abs_tolerance)
+    tolerance_map = property(get_tolerance_map, set_tolerance_map)
     particle_tolerance = property(get_particle_tolerance, set_particle_tolerance)
     particle_abs_tolerance = property(get_particle_abs_tolerance, set_particle_abs_tolerance)
     check_performance = property(get_check_performance, set_check_performance)
@@ -440,11 +497,42 @@ class Suite:
         self.MPIcommand = ""
         self.MPIhost = ""
 
+        # none: leave the placement of the tests to the OS.  auto: give
+        # each test cores of its own when they run concurrently (--jobs).
+        # always: also when they run one at a time
+        self.core_binding = "auto"
+
         self.COMP = ""  # e.g., g++
 
-        self.ftools = ["fcompare", "fboxinfo", "fsnapshot"]
+        # fingerprint: only realclean a build directory when the build
+        # configuration changed since it was last built.  always: realclean
+        # before every test
+        self.realclean_policy = "fingerprint"
+        self._build_fingerprints = None
+        self._compiler_version = None
+
+        # compiler cache -- the cache directory is owned by the suite, so
+        # we can size-cap it and zero its statistics at the start of a run
+        self.useCcache = 0
+        self.ccache = "ccache"
+        self.ccacheDir = ""   # default: testTopDir/suiteName-ccache/
+        self.ccacheMaxSize = "10G"
+        self.ccache_stats = None  # set automatically
+
+        self.journal = None  # set automatically, the progress of this run
+
+        self.ftools = ["fcompare", "fsnapshot"]
         self.extra_tools = ""
 
+        # plotfile comparisons: "fcompare" or "builtin" (the suite's own
+        # memory-mapped differ, see comparison.py)
+        self.compare_tool = "fcompare"
+        self.compare_chunk_size = 64   # MB streamed at a time by the builtin differ
+        self.compare_jobs = 1   # processes used by the builtin differ
+        self.locate_differences = 1
+
+        self.benchmarkVersionsKept = 10   # per benchmark, 0 keeps them all
+
         self.add_to_c_make_command = ""
 
         self.summary_job_info_field1 = ""
@@ -478,8 +566,10 @@ class Suite:
         # this will be automatically filled
         self.extra_src_comp_string = ""
 
-        # archive output upon completion
+        # archive output upon completion, as a gzipped tarball ("tgz") or
+        # an indexed zip file ("zip")
         self.archive_output = 1
+        self.archive_format = "tgz"
 
         # delete all plot/checkfiles but the plotfile used for comparison upon
         # completion
@@ -497,6 +587,15 @@ class Suite:
         # For setting a specific version of cmake
         self.cmake = "cmake"
 
+        # CMake build trees are kept across runs, and the least recently
+        # used ones are removed once they take more than cmakeBuildQuota GB
+        self.cmakeBuildRoot = ""   # default: testTopDir/suiteName-cmake-builds/
+        self.cmakeBuildQuota = 50
+        self._cmake_targets = {}
+
+        # the BenchmarkStore, created when benchmarks are written
+        self._benchmark_store = None
+
         # do we fail if there is no output?
         self.fail_on_no_output = 0
 
@@ -597,11 +696,70 @@ class Suite:
 
             test_list = new_test_list
 
+        if self.args.fast_subset:
+            test_list = self.get_fast_subset(test_list)
+
         if len(test_list) == 0:
             self.log.fail("No valid tests defined")
 
         return test_list
 
+    def get_expected_times(self, test_list, runtimes):
+        """ the expected run and build times of each test in test_list,
+            by name: the average of its last few runs in the timing
+            history, or the median over the tests for one without any """
+
+        def expected(field):
+            times = {}
+            for t in test_list:
+                history = runtimes.get(t.name, {}).get(field, [])[:5]
+                if history:
+                    times[t.name] = max(sum(history) / len(history), 1.e-3)
+
+            known = sorted(times.values())
+            default = known[len(known) // 2] if known else 1.0
+            for t in test_list:
+                times.setdefault(t.name, default)
+            return times
+
+        return expected("runtimes"), expected("build_times")
+
+    def get_fast_subset(self, test_list):
+        """ the tests of test_list that together override every runtime
+            parameter that any of them overrides, favoring the fast ones
+            (see test_coverage.fast_subset).  This uses the coverage index
+            of past runs and their wall times.  Tests the index doesn't
+            know about are always kept """
+
+        index = coverage.load_index(os.path.join(self.webTopDir, coverage.INDEX_FILE))
+        if not index["tests"]:
+            self.log.warn("no coverage index yet, run the suite with --with_coverage first")
+            return test_list
+
+        weights, _ = self.get_expected_times(test_list, self.get_wallclock_history())
+
+        test_params = {}
+        for t in test_list:
+            if t.name in index["tests"]:
+                params = index["tests"][t.name]["parameters"]
+                test_params[t.name] = {p for p, (_, overridden) in params.items() if overridden}
+
+        subset = set(coverage.fast_subset(test_params, weights))
+        new_list = [t for t in test_list if t.name in subset or t.name not in test_params]
+
+        full_time = sum(weights[t.name] for t in test_list)
+        subset_time = sum(weights[t.name] for t in new_list)
+
+        self.log.skip()
+        self.log.bold("fast subset of the tests...")
+        self.log.indent()
+        self.log.log(f"{len(new_list)} of {len(test_list)} tests, about {subset_time:.0f} s " +
+                     f"of the {full_time:.0f} s the full list takes")
+        self.log.log("to run them again: --tests '{}'".format(" ".join(t.name for t in new_list)))
+        self.log.outdent()
+
+        return new_list
+
     def get_bench_dir(self):
         bench_dir = self.testTopDir + self.suiteName + "-benchmarks/"
         if not os.path.isdir(bench_dir):
@@ -611,6 +769,14 @@ class Suite:
                 self.log.fail(f"ERROR: benchmark directory, {bench_dir}, does not exist")
         return bench_dir
 
+    def get_benchmark_store(self):
+        """ returns the content-addressed store that the benchmarks are
+            written through """
+
+        if self._benchmark_store is None:
+            self._benchmark_store = benchmark_store.BenchmarkStore(self.get_bench_dir(), self.log)
+        return self._benchmark_store
+
     def get_wallclock_file(self):
         """ returns the path to the json file storing past runtimes for each test """
 
@@ -666,6 +832,24 @@ class Suite:
         self.full_test_dir = full_test_dir
         self.full_web_dir = full_web_dir
 
+    def use_test_dirs(self, test_dir):
+        """ use the output and web directories of the earlier run
+            test_dir, to carry on with it """
+
+        test_dir = test_dir.rstrip("/") + "/"
+        full_test_dir = self.testTopDir + self.suiteName + "-tests/" + test_dir
+        full_web_dir = f"{self.webTopDir}/{test_dir}/"
+
+        if not (os.path.isdir(full_test_dir) and os.path.isdir(full_web_dir)):
+            self.log.fail(f"ERROR: the run {test_dir} does not exist")
+
+        self.log.skip()
+        self.log.bold("testing directory is: " + test_dir)
+
+        self.test_dir = test_dir
+        self.full_test_dir = full_test_dir
+        self.full_web_dir = full_web_dir
+
     def get_run_history(self, active_test_list=None, check_activity=True):
         """ return the list of output directories run over the
             history of the suite and a separate list of the tests
@@ -678,8 +862,8 @@ class Suite:
         for f in os.listdir(self.webTopDir):
 
             f_path = os.path.join(self.webTopDir, f)
-            # look for a directory of the form 20* (this will work up until 2099
-            if f.startswith("20") and os.path.isdir(f_path):
+            # look for a run directory, named by its date
+            if test_util.is_run_dir(f) and os.path.isdir(f_path):
 
                 # look for the status file
                 status_file = f_path + '/' + f + '.status'
@@ -693,8 +877,8 @@ class Suite:
         for d in valid_dirs:
 
             for f in os.listdir(self.webTopDir + d):
-                if f.endswith(".status") and not (f.startswith("20") or f == "branch.status"):
-                    index = f.rfind(".status")
+                index = f.rfind(".status")
+                if f.endswith(".status") and not (test_util.is_run_dir(f[0:index]) or f == "branch.status"):
                     test_name = f[0:index]
 
                     if all_tests.count(test_name) == 0:
@@ -875,10 +1059,9 @@ class Suite:
 
         outdir = self.testTopDir + self.suiteName + "-tests/"
 
-        # this will work through 2099
         if os.path.isdir(outdir):
             dirs = [d for d in os.listdir(outdir) if (os.path.isdir(outdir + d) and
-                                                      d.startswith("20"))]
+                                                      test_util.is_run_dir(d))]
             dirs.sort()
 
             return dirs[-1]
@@ -926,6 +1109,124 @@ class Suite:
 
         test_util.run(cmd)
 
+    def get_build_opts(self, test):
+        """ return the make variables that define the build of test """
+
+        build_opts = ""
+        build_opts += f"DEBUG={c_flag(test.debug)} "
+        build_opts += f"USE_ACC={c_flag(test.acc)} "
+        build_opts += f"USE_MPI={c_flag(test.useMPI)} "
+        build_opts += f"USE_OMP={c_flag(test.useOMP)} "
+        build_opts += f"DIM={test.dim} "
+
+        if not test.extra_build_dir == "":
+            build_opts += self.repos[test.extra_build_dir].comp_string + " "
+
+        if "source" in self.repos:
+            if not self.repos["source"].comp_string is None:
+                build_opts += self.repos["source"].comp_string + " "
+
+        if not test.addToCompileString == "":
+            build_opts += test.addToCompileString + " "
+
+        return build_opts
+
+    def get_compiler_version(self):
+        """ return the version string of the compiler behind COMP, so that
+            a compiler upgrade changes the build fingerprints """
+
+        if self._compiler_version is None:
+            self._compiler_version = self.COMP
+            exe = COMP_EXECUTABLES.get(self.COMP.lower(), self.COMP)
+            if exe and shutil.which(exe) is not None:
+                stdout, _, rc = test_util.run(f"{exe} --version")
+                if rc == 0 and stdout.strip():
+                    self._compiler_version = stdout.splitlines()[0]
+
+        return self._compiler_version
+
+    def get_build_fingerprint(self, test):
+        """ return the (config, fingerprint) pair for building test.
+            config holds the make variables that end up in the object
+            directory name; fingerprint is a hash of everything else
+            that affects the build: the remaining make variables, the
+            compiler and the git hashes of all the repos """
+
+        c_make_additions = self.add_to_c_make_command
+        if test.ignoreGlobalMakeAdditions:
+            c_make_additions = ""
+
+        # later definitions win, as they do on the make command line
+        make_vars = {}
+        for word in shlex.split(f"{self.extra_src_comp_string} {self.get_build_opts(test)} " +
+                                f"{c_make_additions}"):
+            name, _, value = word.partition("=")
+            make_vars[name] = value
+        make_vars["COMP"] = self.COMP
+
+        config = {k: v for k, v in make_vars.items() if k in OBJDIR_VARIABLES}
+        build_info = {"make": {k: v for k, v in make_vars.items() if k not in OBJDIR_VARIABLES},
+                      "compiler": self.get_compiler_version(),
+                      "repos": {k: str(r.hash_current).strip() for k, r in self.repos.items()}}
+
+        fingerprint = hashlib.sha256(json.dumps(build_info, sort_keys=True).encode()).hexdigest()
+
+        return json.dumps(config, sort_keys=True), fingerprint
+
+    def get_build_fingerprints_file(self):
+        """ returns the path to the json file storing the configuration
+            each build directory was last built with """
+
+        return self.testTopDir + self.suiteName + "-build-fingerprints.json"
+
+    def get_build_fingerprints(self, reload=False):
+        """ return the dictionary of build directory -> {config: fingerprint}.
+            With reload, read it again, as tests run in parallel update it """
+
+        if self._build_fingerprints is None or reload:
+            try:
+                with open(self.get_build_fingerprints_file()) as f:
+                    self._build_fingerprints = json.load(f)
+            except (OSError, ValueError, JSONDecodeError):
+                self._build_fingerprints = {}
+
+        return self._build_fingerprints
+
+    def needs_realclean(self, test, bdir):
+        """ do we need a make realclean in bdir before building test?  Only
+            if this build configuration was last built there with a
+            different fingerprint -- otherwise make's dependency tracking
+            and the per-configuration object directories are enough.  A
+            configuration never built in bdir has no objects there yet,
+            so it is just built, leaving those of the others alone """
+
+        if self.realclean_policy == "always":
+            return True
+
+        config, fingerprint = self.get_build_fingerprint(test)
+        fingerprints = self.get_build_fingerprints(reload=True)
+        stored = fingerprints.get(bdir, {}).get(config)
+        return stored is not None and stored != fingerprint
+
+    def record_build(self, test, bdir, realcleaned=False):
+        """ store the fingerprint test was built with in bdir, next to
+            those of the other configurations built there.  A realclean
+            wiped the objects of every configuration in bdir, so then
+            forget about the others: they are rebuilt from scratch anyway,
+            and a stale fingerprint would only realclean bdir again """
+
+        config, fingerprint = self.get_build_fingerprint(test)
+
+        def update(fingerprints):
+            if realcleaned:
+                fingerprints[bdir] = {}
+            fingerprints.setdefault(bdir, {})[config] = fingerprint
+
+        try:
+            self._build_fingerprints = update_json(self.get_build_fingerprints_file(), update)
+        except OSError:
+            self.log.warn("unable to store the build fingerprints")
+
     def build_c(self, test=None, opts="", target="", outfile=None, c_make_additions=None):
 
         build_opts = ""
@@ -933,33 +1234,25 @@ class Suite:
             c_make_additions = self.add_to_c_make_command
 
         if test is not None:
-            build_opts += f"DEBUG={c_flag(test.debug)} "
-            build_opts += f"USE_ACC={c_flag(test.acc)} "
-            build_opts += f"USE_MPI={c_flag(test.useMPI)} "
-            build_opts += f"USE_OMP={c_flag(test.useOMP)} "
-            build_opts += f"DIM={test.dim} "
-
-            if not test.extra_build_dir == "":
-                build_opts += self.repos[test.extra_build_dir].comp_string + " "
-
-            if "source" in self.repos:
-                if not self.repos["source"].comp_string is None:
-                    build_opts += self.repos["source"].comp_string + " "
-
-            if not test.addToCompileString == "":
-                build_opts += test.addToCompileString + " "
+            build_opts += self.get_build_opts(test)
 
             if test.ignoreGlobalMakeAdditions:
                 c_make_additions = ""
 
         all_opts = f"{self.extra_src_comp_string} {build_opts} {opts}"
 
+        # AMReX's GNU make prefixes every compile line with $(CCACHE)
+        # when USE_CCACHE=TRUE
+        if self.useCcache:
+            all_opts += f" USE_CCACHE=TRUE CCACHE={self.ccache}"
+
         comp_string = "{} -j{} AMREX_HOME={} {} COMP={} {} {}".format(
             self.MAKE, self.numMakeJobs, self.amrex_dir,
             all_opts, self.COMP, c_make_additions, target)
 
         self.log.log(comp_string)
-        stdout, stderr, rc = test_util.run(comp_string, outfile=outfile)
+        stdout, stderr, rc = test_util.run(comp_string, outfile=outfile,
+                                           env=self.ccache_env())
 
         # make returns 0 if everything was good
         if not rc == 0:
@@ -967,15 +1260,34 @@ class Suite:
 
         return comp_string, rc
 
+    def get_core_set(self, jobs):
+        """ the CoreSet to give each running test cores of its own from,
+            or None if the tests aren't bound to cores """
+
+        if self.core_binding == "always" or (self.core_binding == "auto" and jobs > 1):
+            cores = resources.CoreSet()
+            self.log.log(f"binding tests to cores: {cores.size()} CPUs in " +
+                         f"{len(cores.nodes)} NUMA nodes")
+            return cores
+        return None
+
     def run_test(self, test, base_command):
         test_env = None
         if test.useOMP:
             test_env = dict(os.environ, OMP_NUM_THREADS=f"{test.numthreads}")
 
+        # keep the threads on the cores of the test
+        if test.cpus and test.useOMP:
+            test_env.setdefault("OMP_PLACES", "threads")
+            test_env.setdefault("OMP_PROC_BIND", "close")
+
         if test.useMPI and not test.run_as_script:
+            cpus = test.cpus or sorted(os.sched_getaffinity(0))
             test_run_command = self.MPIcommand
             test_run_command = test_run_command.replace("@host@", self.MPIhost)
             test_run_command = test_run_command.replace("@nprocs@", f"{test.numprocs}")
+            test_run_command = test_run_command.replace("@cpuset@", resources.format_cpulist(cpus))
+            test_run_command = test_run_command.replace("@binding@", resources.rank_masks(cpus, test.numprocs))
             test_run_command = test_run_command.replace("@command@", base_command)
         else:
             test_run_command = base_command
@@ -986,9 +1298,20 @@ class Suite:
         else: errfile = test.errfile
 
         self.log.log(test_run_command)
-        sout, serr, ierr = test_util.run(test_run_command, stdin=True,
-                                         outfile=outfile, errfile=errfile,
-                                         env=test_env)
+
+        # what the test starts inherits the affinity
+        affinity = None
+        if test.cpus:
+            affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, test.cpus)
+
+        try:
+            sout, serr, ierr = test_util.run(test_run_command, stdin=True,
+                                             outfile=outfile, errfile=errfile,
+                                             env=test_env)
+        finally:
+            if affinity is not None:
+                os.sched_setaffinity(0, affinity)
         test.run_command = test_run_command
         test.return_code = ierr
 
@@ -1034,7 +1357,6 @@ class Suite:
         if ("fextract" in self.extra_tools): ftools.append("fextract")
         if ("fextrema" in self.extra_tools): ftools.append("fextrema")
         if ("ftime" in self.extra_tools): ftools.append("ftime")
-        if any([t for t in test_list if t.tolerance is not None or t.abs_tolerance is not None]): ftools.append("fvarnames")
 
         for t in ftools:
             self.log.log(f"building {t}...")
@@ -1133,25 +1455,142 @@ class Suite:
         Test.global_particle_abs_tolerance = args.particle_abs_tolerance
         Test.performance_params = args.check_performance
 
+    #######################################################
+    #        Compiler cache utilities                     #
+    #######################################################
+    def ccache_env(self, env=None):
+        """ return the environment to build with -- this points ccache
+            at the suite-managed cache.  If we are not using ccache and
+            no env was given, return None to inherit the environment """
+
+        if not self.useCcache:
+            return env
+
+        if env is None:
+            env = dict(os.environ)
+        env["CCACHE_DIR"] = self.ccacheDir
+        env["CCACHE_MAXSIZE"] = str(self.ccacheMaxSize)
+        return env
+
+    def ccache_setup(self):
+        """ create the suite's compiler cache, apply the size cap, and
+            zero the statistics so we can report on this run only """
+
+        if not self.useCcache:
+            return
+
+        if shutil.which(self.ccache) is None:
+            self.log.warn(f"{self.ccache} not found, building without a compiler cache")
+            self.useCcache = 0
+            return
+
+        if self.ccacheDir == "":
+            self.ccacheDir = self.testTopDir + self.suiteName + "-ccache/"
+        os.makedirs(self.ccacheDir, exist_ok=True)
+
+        self.log.skip()
+        self.log.bold(f"using compiler cache in {self.ccacheDir}")
+
+        # the max size is stored in the cache's own config, and ccache
+        # evicts the least recently used entries once it is exceeded
+        env = self.ccache_env()
+        test_util.run(f"{self.ccache} --max-size={self.ccacheMaxSize}", env=env)
+        test_util.run(f"{self.ccache} --zero-stats", env=env)
+
+    def get_ccache_stats(self):
+        """ enforce the cache size cap and return a dictionary with the
+            hit / miss statistics accumulated during this run """
+
+        if not self.useCcache:
+            return None
+
+        env = self.ccache_env()
+        test_util.run(f"{self.ccache} --cleanup", env=env)
+
+        # --print-stats gives tab-separated key / value pairs
+        stdout, _, rc = test_util.run(f"{self.ccache} --print-stats", env=env)
+        if rc != 0:
+            self.log.warn("unable to get compiler cache statistics")
+            return None
+
+        raw = {}
+        for line in stdout.splitlines():
+            fields = line.split("\t")
+            if len(fields) == 2:
+                try: raw[fields[0]] = int(fields[1])
+                except ValueError: pass
+
+        hits = raw.get("direct_cache_hit", 0) + raw.get("preprocessed_cache_hit", 0)
+        misses = raw.get("cache_miss", 0)
+        cache_size = 1024 * raw.get("cache_size_kibibyte", 0)
+        files = raw.get("files_in_cache", 0)
+
+        try: hit_rate = hits / (hits + misses)
+        except ZeroDivisionError: hit_rate = 0.0
+
+        # ccache doesn't track the bytes it served, so estimate them
+        # from the mean size of a cached file
+        if files > 0:
+            saved_bytes = int(hits * cache_size / files)
+        else:
+            saved_bytes = 0
+
+        return {"hits": hits, "misses": misses, "hit_rate": hit_rate,
+                "saved_bytes": saved_bytes, "cache_size": cache_size}
+
+    def report_ccache(self):
+        """ log the compiler cache statistics for this run """
+
+        self.ccache_stats = self.get_ccache_stats()
+        if self.ccache_stats is None:
+            return
+
+        stats = self.ccache_stats
+        self.log.skip()
+        self.log.bold("compiler cache statistics:")
+        self.log.indent()
+        self.log.log(f"hits: {stats['hits']}, misses: {stats['misses']} " +
+                     f"(hit rate: {100 * stats['hit_rate']:.1f}%)")
+        self.log.log(f"approx. data served from cache: {stats['saved_bytes'] / 1024**2:.1f} MB")
+        self.log.log(f"cache size: {stats['cache_size'] / 1024**2:.1f} MB " +
+                     f"(max: {self.ccacheMaxSize})")
+        self.log.outdent()
+
     #######################################################
     #        CMake utilities                              #
     #######################################################
+    def get_cmake_build_root(self):
+        """ return the directory holding the persistent CMake build trees """
+
+        if self.cmakeBuildRoot == "":
+            self.cmakeBuildRoot = self.testTopDir + self.suiteName + "-cmake-builds/"
+        os.makedirs(self.cmakeBuildRoot, exist_ok=True)
+        return self.cmakeBuildRoot
+
+    def touch_cmake_tree(self, builddir, name, configOpts):
+        """ mark a build tree as used now, and by this run, for the LRU
+            eviction.  The mark is kept in the index rather than in the
+            suite, as tests run in parallel configure trees in processes
+            of their own """
+
+        def update(index):
+            index[builddir] = {"name": name, "configOpts": configOpts,
+                               "last_used": datetime.datetime.now().timestamp(),
+                               "run": self.full_test_dir}
+
+        update_json(os.path.join(self.get_cmake_build_root(), "index.json"), update)
+
     def cmake_config( self, name, path, configOpts="",  install = 0, env =
                       None, test = None):
-        "Generate CMake configuration"
+        """ Generate CMake configuration.  Build trees are kept across tests
+            and runs, keyed by everything that goes into the configuration,
+            so an existing tree is reused and built incrementally """
 
         self.log.outdent()
         self.log.skip()
         self.log.bold("configuring " + name +  " build...")
         self.log.indent()
 
-        # Setup dir names
-        builddir   = path + 'builddir'
-        if install:
-            installdir = path + 'installdir'
-        else:
-            installdir = None
-
         # Define enviroment
         ENV = {}
         ENV =  dict(os.environ) # Copy of current enviroment
@@ -1160,17 +1599,45 @@ class Suite:
 
         if env is not None: ENV.update(env)
 
-        # remove build and installation directories if present and re-make them
-        if os.path.isdir(builddir):
-            shutil.rmtree(builddir)
+        extra_opts = ''
+        if install == 0 and name == 'AMReX':
+            extra_opts += ' -DAMReX_INSTALL=OFF'
+
+        if test is not None and test.dim > 0:
+            extra_opts += ' -DAMReX_SPACEDIM='+str(test.dim)
+
+        if self.useCcache:
+            for lang in ["C", "CXX", "CUDA"]:
+                extra_opts += f' -DCMAKE_{lang}_COMPILER_LAUNCHER={self.ccache}'
+
+        cmd_opts = configOpts + extra_opts
+
+        # Setup dir names -- one build tree per configuration
+        key = json.dumps({"path": path, "opts": cmd_opts.split(), "install": bool(install),
+                          "COMP": self.COMP, "env": env}, sort_keys=True)
+        key = hashlib.sha256(key.encode()).hexdigest()[:12]
+        project = os.path.basename(os.path.normpath(path))
+
+        builddir = os.path.join(self.get_cmake_build_root(), f"{project}-{key}")
+        if install:
+            installdir = builddir + '-install'
+        else:
+            installdir = None
+
+        self.touch_cmake_tree(builddir, name, cmd_opts)
+        self.write_cmake_query(builddir)
+
+        if os.path.isfile(os.path.join(builddir, "CMakeCache.txt")):
+            # cmake --build re-runs the configure step itself if any of
+            # the CMake inputs changed
+            self.log.log("reusing build tree " + builddir)
+            return builddir, installdir
+
         self.log.log("mkdir " + builddir)
-        os.mkdir(builddir)
 
         if install:
-            if os.path.isdir(installdir):
-                shutil.rmtree(installdir)
             self.log.log("mkdir " + installdir)
-            os.mkdir(installdir)
+            os.makedirs(installdir, exist_ok=True)
 
         # Logfile
         coutfile = f'{self.full_test_dir}{name}.cmake.log'
@@ -1179,18 +1646,16 @@ class Suite:
         cmd = f'{self.cmake} {configOpts} -S {path} -B {builddir} '
         if install:
             cmd += '-DCMAKE_INSTALL_PREFIX:PATH='+installdir
-        else:
-            if name == 'AMReX':
-                cmd += '-DAMReX_INSTALL=OFF'
+        cmd += extra_opts
 
-        if test.dim > 0:
-            cmd += '-DAMReX_SPACEDIM='+str(test.dim)
-                
         self.log.log(cmd)
         stdout, stderr, rc = test_util.run(cmd, outfile=coutfile, env=ENV)
 
         # Check exit condition
         if not rc == 0:
+            # don't leave a half-configured tree around to be reused
+            shutil.rmtree(builddir, ignore_errors=True)
+
             errstr  = "\n \nERROR! CMake configuration failed for " + name + " \n"
             errstr += "Check " + coutfile + " for more information."
             self.log.fail(errstr)
@@ -1205,24 +1670,125 @@ class Suite:
         return builddir, installdir
 
 
-    def cmake_clean( self, name, path ):
-        "Clean CMake build and install directories"
+    def write_cmake_query(self, builddir):
+        """ ask CMake to describe the build system through its File API,
+            so we can look up where the targets end up """
+
+        query_dir = os.path.join(builddir, ".cmake", "api", "v1", "query")
+        os.makedirs(query_dir, exist_ok=True)
+        Path(query_dir, "codemodel-v2").touch()
+
+    def get_cmake_targets(self, builddir):
+        """ return a dictionary of target name -> (type, artifact paths)
+            from the CMake File API codemodel reply for builddir, or None
+            if there is no reply (CMake older than 3.14).  The targets are
+            cached per build tree until CMake writes a new reply """
+
+        reply_dir = os.path.join(builddir, ".cmake", "api", "v1", "reply")
+        try:
+            # the newest index file is the current reply
+            indices = sorted(f for f in os.listdir(reply_dir)
+                             if f.startswith("index-") and f.endswith(".json"))
+        except OSError:
+            indices = []
+
+        if not indices:
+            return None
+
+        cached = self._cmake_targets.get(builddir)
+        if cached is not None and cached[0] == indices[-1]:
+            return cached[1]
+
+        targets = {}
+        try:
+            with open(os.path.join(reply_dir, indices[-1])) as f:
+                index = json.load(f)
+            codemodel_file = index["reply"]["codemodel-v2"]["jsonFile"]
+            with open(os.path.join(reply_dir, codemodel_file)) as f:
+                codemodel = json.load(f)
+
+            for config in codemodel["configurations"]:
+                for target in config["targets"]:
+                    with open(os.path.join(reply_dir, target["jsonFile"])) as f:
+                        target_info = json.load(f)
+                    artifacts = [os.path.join(builddir, a["path"])
+                                 for a in target_info.get("artifacts", [])]
+                    targets[target["name"]] = (target_info["type"], artifacts)
+
+        except (OSError, KeyError, ValueError, JSONDecodeError):
+            self.log.warn(f"unable to read the CMake File API reply in {builddir}")
+            return None
+
+        self._cmake_targets[builddir] = (indices[-1], targets)
+        return targets
+
+    def find_cmake_executable(self, target, builddir):
+        """ return the path to the executable built for target, looked up
+            in the CMake File API reply.  If target is not known, fall back
+            to the most recently built executable.  Without a reply, or
+            targets read from an earlier one, return None """
+
+        targets = self.get_cmake_targets(builddir)
+
+        if targets is None:
+            # cmake_config asks for the File API before configuring, so
+            # only a tree configured before that, or by a CMake without the
+            # API, has no reply.  Rather than configure again for every
+            # test, use the targets last read for the tree, or let the
+            # caller search the tree
+            cached = self._cmake_targets.get(builddir)
+            if cached is None:
+                return None
+            targets = cached[1]
+
+        if target in targets:
+            candidates = targets[target][1]
+        else:
+            candidates = [a for ttype, artifacts in targets.values()
+                          if ttype == "EXECUTABLE" for a in artifacts]
+
+        candidates = [c for c in candidates if os.path.isfile(c)]
+        if not candidates:
+            return None
+
+        return max(candidates, key=os.path.getmtime)
+
+    def cmake_clean( self ):
+        """ Evict the least recently used CMake build trees until the
+            total size is within cmakeBuildQuota (in GB).  Trees used by
+            the current run are kept """
 
         self.log.outdent()
         self.log.skip()
-        self.log.bold("cleaning " + name +  " CMake directories...")
+        self.log.bold("checking the CMake build trees quota...")
         self.log.indent()
 
-        # Setup dir names
-        builddir   = path + 'builddir'
-        installdir = path + 'installdir'
+        quota = float(self.cmakeBuildQuota) * 1024**3
+
+        def update(index):
+            # forget about trees that were removed by hand
+            for d in [d for d in index if not os.path.isdir(d)]:
+                del index[d]
+
+            sizes = {d: get_dir_size(d) + get_dir_size(d + "-install") for d in index}
+            total = sum(sizes.values())
+
+            for d in sorted(index, key=lambda d: index[d]["last_used"]):
+                if total <= quota:
+                    break
+                if index[d].get("run") == self.full_test_dir:
+                    continue
+
+                self.log.log(f"removing build tree {d} ({index[d]['name']})")
+                shutil.rmtree(d, ignore_errors=True)
+                shutil.rmtree(d + "-install", ignore_errors=True)
+                total -= sizes[d]
+                del index[d]
 
-        # remove build and installation directories if present
-        if os.path.isdir(builddir):
-            shutil.rmtree(builddir)
+            if total > quota:
+                self.log.warn("CMake build trees used by this run exceed cmakeBuildQuota")
 
-        if os.path.isdir(installdir):
-            shutil.rmtree(installdir)
+        update_json(os.path.join(self.get_cmake_build_root(), "index.json"), update)
 
         return
 
@@ -1237,16 +1803,14 @@ class Suite:
         # Set enviroment
         ENV =  dict(os.environ) # Copy of current enviroment
         if env is not None: ENV.update(env)
+        ENV = self.ccache_env(ENV)
 
         if outfile is not None:
             coutfile = outfile
         else:
             coutfile = f'{self.full_test_dir}{name}.{target}.make.log'
 
-        if self.source_build_dir == "":
-            self.source_build_dir = path
-
-        cmd = f'{self.cmake} --build {self.source_build_dir} -j {self.numMakeJobs} -- {opts} {target}'
+        cmd = f'{self.cmake} --build {path} -j {self.numMakeJobs} -- {opts} {target}'
         self.log.log(cmd)
         stdout, stderr, rc = test_util.run(cmd, outfile=coutfile, cwd=path, env=ENV )
 
@@ -1270,19 +1834,19 @@ class Suite:
         # super-builds always need a configure now, all other builds might
         # add additional CMake config options and re-configure on existing configured
         # build directory, if additional build cmakeSetupOpts are set
+        build_dir = self.source_build_dir
         if self.isSuperbuild or test.cmakeSetupOpts != "":
-            builddir, installdir = self.cmake_config(
+            build_dir, installdir = self.cmake_config(
                 name=test.name,
                 path=self.source_dir,
                 configOpts=self.amrex_cmake_opts + " " +
                            self.source_cmake_opts + " " +
                            test.cmakeSetupOpts, test=test)
-            self.source_build_dir = builddir
 
         # compile
         rc, comp_string = self.cmake_build( name    = test.name,
                                             target  = test.target,
-                                            path    = self.source_build_dir,
+                                            path    = build_dir,
                                             opts    = opts,
                                             env     = env,
                                             outfile = outfile)
@@ -1296,54 +1860,108 @@ class Suite:
         # pick it up
         elif not test.run_as_script:
             # Find location of executable
-            path_to_exe = None
-
-            # search by target name
-            for root, dirnames, filenames in os.walk(self.source_build_dir):
-                if test.target in filenames:
-                    path_to_exe = os.path.join(root, test.target)
-                    break
-
-            # fallback: pick first executable in CMake output directory
-            if path_to_exe is None:
-                path_to_bin = None
-                cmake_output_dir = "CMAKE_RUNTIME_OUTPUT_DIRECTORY:PATH="
-                cmake_cache = os.path.join(self.source_build_dir, "CMakeCache.txt")
-                with open(cmake_cache) as cc:
-                    for ln in cc.readlines():
-                        if ln.startswith(cmake_output_dir):
-                            path_to_bin = ln[len(cmake_output_dir):].strip()
-                            break
-
-                if path_to_bin is None:
-                    if not test.customRunCmd:
-                        self.log.warn("build successful but binary directory not found")
-                        rc = 1
-                else:
-                    # Find location of executable
-                    for root, dirnames, filenames in os.walk(path_to_bin):
-                        for f in filenames:
-                            f_path = os.path.join(root, f)
-                            if os.access(f_path, os.X_OK):
-                                if not Path(f_path).is_symlink():
-                                    path_to_exe = f_path
-                                    break
-                        if path_to_exe is not None:
-                            break
+            path_to_exe = self.find_cmake_executable(test.target, build_dir)
+
+            # fallback for trees without a File API reply
+            if path_to_exe is None and self.get_cmake_targets(build_dir) is None:
+
+                # search by target name
+                for root, dirnames, filenames in os.walk(build_dir):
+                    if test.target in filenames:
+                        path_to_exe = os.path.join(root, test.target)
+                        break
+
+                # fallback: pick first executable in CMake output directory
+                if path_to_exe is None:
+                    path_to_bin = None
+                    cmake_output_dir = "CMAKE_RUNTIME_OUTPUT_DIRECTORY:PATH="
+                    cmake_cache = os.path.join(build_dir, "CMakeCache.txt")
+                    with open(cmake_cache) as cc:
+                        for ln in cc.readlines():
+                            if ln.startswith(cmake_output_dir):
+                                path_to_bin = ln[len(cmake_output_dir):].strip()
+                                break
+
+                    if path_to_bin is None:
+                        if not test.customRunCmd:
+                            self.log.warn("build successful but binary directory not found")
+                            rc = 1
+                    else:
+                        # Find location of executable
+                        for root, dirnames, filenames in os.walk(path_to_bin):
+                            for f in filenames:
+                                f_path = os.path.join(root, f)
+                                if os.access(f_path, os.X_OK):
+                                    if not Path(f_path).is_symlink():
+                                        path_to_exe = f_path
+                                        break
+                            if path_to_exe is not None:
+                                break
 
             if path_to_exe is None:
                 if not test.customRunCmd:
                     self.log.warn("build successful but executable not found")
                     rc = 1
             else:
-                # Copy and rename executable to test dir
-                shutil.move(f"{path_to_exe}",
+                # Copy and rename executable to test dir -- we leave the
+                # original, so the next incremental build has nothing to relink
+                shutil.copy(f"{path_to_exe}",
                             f"{self.source_dir}/{test.buildDir}/{test.name}.ex")
 
         return comp_string, rc
 
 
 
+def update_json(path, update):
+    """ read the dictionary stored as JSON in path, pass it to update to
+        change in place, and store it again.  Tests built at the same time
+        update the same files, so this holds a lock on path, and the file
+        is replaced rather than rewritten, so a reader never sees it half
+        written.  Returns the updated dictionary """
+
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError, JSONDecodeError):
+            data = {}
+
+        update(data)
+
+        fd, tmp = tf.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    return data
+
+def get_dir_size(path):
+    """ return the disk usage of everything under path, in bytes """
+
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += get_dir_size(entry.path)
+            else:
+                total += entry.stat(follow_symlinks=False).st_blocks * 512
+        except OSError:
+            pass
+
+    return total
+
 def f_flag(opt, test_not=False):
     """ convert a test parameter into t if true for the Fortran build system """
     if test_not:
@@ -35,12 +35,15 @@ As for the form of the tests, the produce plot files should be compressed in a
 
 The basic function of the script is as follows:
  1) All of the test directories are recorded
- 2) These directories are checked for a file with the extension ".tgz"
- 3) If the file is present, the job_info file is extracted
- 4) The parameters are then read from each job_info file
+ 2) For each test, the copy of its job_info in the web directory is used
+    if there is one, otherwise the test directory is checked for a file
+    with the extension ".tgz" (or ".zip")
+ 3) If the file is present, its job_info file is located
+ 4) The parameters are then read from each job_info file, straight out
+    of the archive, with the files read in parallel
  5) The parameters that occured with a [*] are recorded as covered and the
     others are recorded as not_covered. All duplicates are removed
- 6) The problem specific parameters (only used in one simulation) are recorded
+ 6) The problem specific parameters (only used in one test) are recorded
  7) The coverage fractions are calculated
  8) The coverage reports are constructed with the list of parameters that were
     not covered, the fraction of total parameters that were covered, and the
@@ -51,6 +54,12 @@ Output: Two ".out" files, one that includes any problem specific parameters
  parameters. The are titled "Coverage.out" and "Coverage-NoSpecific.out",
  respectively.
 
+When run by the suite, the parameters of each test, with their values, are
+ also kept in a persistent index (coverage_index.json in the web directory).
+ Each run only reads the tests that ran and updates their entries, so the
+ coverage of the whole suite is known even when only some of the tests ran.
+ The index also records the coverage of each run, for the trend.
+
 MAESTRO: There should be ~260 total parameters, this includes the problem
          specific parameters.
 
@@ -65,53 +74,173 @@ DEVELOPMENT: Add feature for user to specify the test directory on command line
 '''
 
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
 import re as re
 import sys
-import tarfile
+
+import plotfile
 
 SPEC_FILE = "coverage.out"
 NONSPEC_FILE = "coverage_nonspecific.out"
+INDEX_FILE = "coverage_index.json"
+HISTORY_FILE = "coverage.html"
+
+# fewer job_info files than this are read serially, and more by at most
+# MAX_READ_JOBS threads
+SERIAL_READ_FILES = 16
+MAX_READ_JOBS = 4
+
+def main(cwd=None, job_info_dir=None, jobs=None):
+
+    # Change directories if necessary
+    if cwd is not None:
+        old_dir = os.getcwd()
+        os.chdir(cwd)
+
+    try:
+        # Gets the paths of the files of interest
+        file_paths = get_files(job_info_dir)
+        if not file_paths: return (None,) * 4
+
+        results = [split_parameters(params)
+                   for params in read_all_parameters(file_paths, jobs)]
+        return write_coverage(results)
+
+    finally:
+        # Return to original directory
+        if cwd is not None: os.chdir(old_dir)
+
+def update_index(index_file, run, cwd=None, job_info_dir=None,
+                 active_tests=None, jobs=None):
+    # Updates the persistent coverage index with the parameters of the
+    # tests that ran in cwd -- the other tests keep the parameters they
+    # were last run with -- and writes the coverage reports for the
+    # whole suite from it.  The index also keeps the coverage of each
+    # run, for the trend
 
-def main(cwd=None):
 
     # Change directories if necessary
     if cwd is not None:
         old_dir = os.getcwd()
         os.chdir(cwd)
 
-    # Gets the paths of the files of interest
-    file_paths = get_files()
-    if not file_paths: return (None,) * 4
-
-    # Initialize lists
-    covered = []
-    no_cover = []
-    ignore = []
-    ignore_master = []
-    covered_no_specific = []
-    no_cover_no_specific = []
-    all_params = []
-    All = []
-
-    for i in range(0, len(file_paths)):
-        
-        covered_temp, no_cover_temp, All = list_parameters(file_paths[i],
-                                                           All)
-
-        if i == 0: no_cover = no_cover_temp   # Initializing no_cover
-        if i == 0: covered = covered_temp     # Initializing covered
-
-        covered, no_cover, ignore, ignore_master, all_params = build_master(
-            covered_temp, no_cover_temp, covered,
-            no_cover, ignore, ignore_master, all_params)
-
-    All = remove_duplicates(All)
-    # build_master needs to be executed one more time than the number of cycles
-    # in the loop to complete the ignore list
-    covered, no_cover, ignore, ignore_master, all_params = build_master(
-        covered_temp, no_cover_temp, covered, no_cover,
-        ignore, ignore_master, all_params)
+    try:
+        index = load_index(index_file)
+
+        test_files = get_test_files(job_info_dir)
+        tests = list(test_files)
+        for test, params in zip(tests, read_all_parameters(list(test_files.values()), jobs)):
+            index["tests"][test] = {"run": run, "parameters": params}
+
+        # Forgets about tests that were removed from the suite
+        if active_tests is not None:
+            index["tests"] = {test: v for test, v in index["tests"].items()
+                              if test in active_tests}
+
+        if not index["tests"]: return (None,) * 4
+
+        results = [split_parameters(v["parameters"]) for v in index["tests"].values()]
+        fractions = write_coverage(results)
+
+        index["runs"] = [r for r in index["runs"] if r["run"] != run]
+        index["runs"].append({"run": run, "tests_read": len(tests),
+                              "covered": fractions[0], "total": fractions[1],
+                              "covered_nonspecific": fractions[2],
+                              "total_nonspecific": fractions[3]})
+        save_index(index, index_file)
+
+        return fractions
+
+    finally:
+        # Return to original directory
+        if cwd is not None: os.chdir(old_dir)
+
+def load_index(index_file):
+    # Reads the coverage index: for each test, the parameters (name ->
+    # [value, overridden]) it was last run with, and the coverage of
+    # every run
+
+
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    index.setdefault("tests", {})
+    index.setdefault("runs", [])
+    return index
+
+def save_index(index, index_file):
+    # Writes the coverage index, replacing the old one in one step
+
+
+    tmp = f"{index_file}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, index_file)
+
+def parameter_users(index, param):
+    # Returns the tests that override param, with their values, and the
+    # tests that run with its default
+
+
+    overridden = {}
+    default = []
+    for test, v in sorted(index["tests"].items()):
+        if param in v["parameters"]:
+            value, is_overridden = v["parameters"][param]
+            if is_overridden:
+                overridden[test] = value
+            else:
+                default.append(test)
+    return overridden, default
+
+def fast_subset(test_params, weights):
+    # Picks a subset of the tests that still overrides every parameter
+    # any of them overrides.  This is a weighted set cover, solved with
+    # the greedy algorithm: repeatedly take the test with the lowest
+    # weight per parameter it adds.  test_params maps each test to the
+    # set of parameters it overrides, weights each test to its cost,
+    # e.g. its wall time
+
+
+    uncovered = set().union(*test_params.values())
+    subset = []
+
+    while uncovered:
+        best = min((t for t in test_params if test_params[t] & uncovered),
+                   key=lambda t: (weights[t] / len(test_params[t] & uncovered), t))
+        subset.append(best)
+        uncovered -= test_params[best]
+
+    return subset
+
+def read_all_parameters(file_paths, jobs=None):
+    # Reads the parameters of every job_info file.  The files are small,
+    # so a handful are read serially, and many by a few threads that
+    # overlap the reads -- starting processes would cost more than the
+    # parsing
+
+
+    if jobs is None:
+        jobs = MAX_READ_JOBS
+    jobs = min(jobs, MAX_READ_JOBS, len(file_paths))
+
+    if jobs > 1 and len(file_paths) >= SERIAL_READ_FILES:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(read_parameters, file_paths))
+    return [read_parameters(f) for f in file_paths]
+
+def write_coverage(results):
+    # Writes the coverage reports from the (covered, no_cover) parameters
+    # of every test, and returns the coverage fractions and totals
+
+
+    covered, no_cover, specific = build_master(results)
 
     covered_Frac, no_cover_Frac = get_frac(covered,no_cover)
     output_coverage(SPEC_FILE, covered, no_cover, covered_Frac,
@@ -119,17 +248,12 @@ def main(cwd=None):
 
     covered_no_specific, no_cover_no_specific = remove_specific_params(covered,
                                                                        no_cover,
-                                                                       ignore)
+                                                                       specific)
     covered_no_specificFrac, no_cover_no_specificFrac = get_frac(
         covered_no_specific, no_cover_no_specific)
     output_coverage(NONSPEC_FILE, covered_no_specific,
                     no_cover_no_specific, covered_no_specificFrac,
-                    no_cover_no_specificFrac, specific = ignore)
-
-    clean(file_paths)
-
-    # Return to original directory
-    if cwd is not None: os.chdir(old_dir)
+                    no_cover_no_specificFrac, specific = specific)
 
     total = len(covered) + len(no_cover)
     total_nonspecific = len(covered_no_specific) + len(no_cover_no_specific)
@@ -157,129 +281,92 @@ def get_start_line(lines, fname):
 
     return start_line
 
-def list_parameters(data_file, All):
-    # This routine finds the parameters that have been covered by the test suite
-    # and those that haven't been covered by the test suite and outputs two
-    # lists, one for each type of parameter, covered and no_cover
+def read_parameters(data_file):
+    # This routine reads the runtime parameters of a test, and outputs a
+    # dictionary of parameter name -> [value, overridden], where
+    # overridden marks the parameters set to a value different from the
+    # default ([*])
 
 
-    covered = []      # List to store the names of the covered parameters
-    no_cover = []     # List to store the names of the non-covered parameters
+    params = {}
 
-    with open(data_file) as file:
+    with plotfile.open_file(data_file) as file:
 
         lines = list(file)
         start_line = get_start_line(lines, data_file)
 
         for line in lines[start_line:]:
 
-            if r'[*]' in line:
+            overridden = r'[*]' in line
+            line = line.replace("[*]", "").strip()
 
-                # Singles out the covered parameters and writes their names
-                parameter = re.split(r' +', line.replace("[*]", "").strip())
-                if not parameter: continue
+            parameter = re.split(r' +', line)
+            if not parameter[0]: continue
+            if not overridden and parameter[0] == "Restart": continue
 
-                covered.append(parameter[0])
-                continue
+            value = line.partition("=")[2].strip()
+            params[parameter[0]] = [value, overridden]
 
-            # Takes the rest of the parameters (not covered) and writes their names
-            parameter = re.split(r' +', line.strip())
-            if parameter and parameter[0] != "Restart":
-                no_cover.append(parameter[0])
-
-    All = covered + no_cover + All
-    return covered, no_cover, All
-
-
-def build_master(covered_temp, no_cover_temp, covered, no_cover, ignore,
-                 ignore_master, all_params):
-    # Updates the master list of covered and not covered variables.
-
-
-    # Handles the set of no_cover parameters for a test
-    for i in range(0, len(no_cover_temp)):
-
-        if no_cover_temp[i] in ignore:
-            ignore.remove(no_cover_temp[i])
-        elif no_cover_temp[i] not in ignore_master:
-            ignore.append(no_cover_temp[i])
-            ignore_master.append(no_cover_temp[i])
-        else:
-            pass
-
-        if no_cover_temp[i] not in (no_cover or covered):
-            no_cover.append(no_cover_temp[i])
-        else:
-            pass
-
-        if no_cover_temp[i] not in all_params:
-            all_params.append(no_cover_temp[i])
-        else:
-            pass
-
-    # Handles the set of covered parameters for a test
-    for i in range(0, len(covered_temp)):
-
-        if covered_temp[i] in ignore:
-            ignore.remove(covered_temp[i])
-        elif covered_temp[i] not in ignore_master:
-            ignore.append(covered_temp[i])
-            ignore_master.append(covered_temp[i])
-        else:
-            pass
-
-        if covered_temp[i] in covered:
-            pass
-        else:
-            # Adds newly covered parameters
-            covered.append(covered_temp[i])
-
-        if covered_temp[i] in (no_cover or covered):
-            # Removes newly covered parameters
-            no_cover.remove(covered_temp[i])
-        else:
-            pass
-
-        if covered_temp[i] not in all_params:
-            all_params.append(covered_temp[i])
-
-    # Deals with potential duplicates
-    for i in range(0, len(covered)):
-        if covered[i] in no_cover:
-            no_cover.remove(covered[i])
-        else:
-            pass
-
-    # Removal of empty lines
-    try:
-        covered.remove("\n")
-    except ValueError:
-        pass
-    try:
-        no_cover.remove("\n")
-    except ValueError:
-        pass
+    return params
+
+
+def split_parameters(params):
+    # Splits the parameters read by read_parameters into the covered and
+    # non-covered ones
+
+
+    covered = {name for name, (_, overridden) in params.items() if overridden}
+    return covered, set(params) - covered
+
+
+def list_parameters(data_file):
+    # This routine finds the parameters that have been covered by the test suite
+    # and those that haven't been covered by the test suite and outputs two
+    # sets, one for each type of parameter, covered and no_cover
+
+
+    return split_parameters(read_parameters(data_file))
+
+
+def build_master(results):
+    # Combines the (covered, no_cover) parameters of every test.  A
+    # parameter is covered if any test covers it, and problem specific
+    # if only one test has it at all
 
-    return covered, no_cover, ignore, ignore_master, all_params
 
+    covered = set()
+    no_cover = set()
+    tests_using = Counter()
 
-def remove_specific_params(covered, no_cover, ignore):
+    for covered_temp, no_cover_temp in results:
+        covered |= covered_temp
+        no_cover |= no_cover_temp
+        tests_using.update(covered_temp | no_cover_temp)
+
+    no_cover -= covered
+    specific = {param for param, n in tests_using.items() if n == 1}
+
+    return sorted(covered), sorted(no_cover), sorted(specific)
+
+
+def remove_specific_params(covered, no_cover, specific):
     # Determines the parameters that are specific to some of the
     # tests in the suite.
 
 
-    ignore = set(ignore)
+    specific = set(specific)
 
-    covered_temp = [param for param in covered if param not in ignore]
-    no_cover_temp = [param for param in no_cover if param not in ignore]
+    covered_temp = [param for param in covered if param not in specific]
+    no_cover_temp = [param for param in no_cover if param not in specific]
 
     return covered_temp, no_cover_temp
 
 
-def get_files():
-    # Returns the absolute paths of all maestro-overview.out files.
-    # The argunemnt is the name of the file that we are interested
-    # in reading.
+def get_test_files(job_info_dir=None):
+    # Returns the path of the job_info file of each test, by test name.
+    # The suite copies each test's job_info to the web directory as
+    # <test>.job_info, so if job_info_dir is given, those copies are used
+    # rather than reading the archived plotfiles
 
 
     # Determines current working directory, which should be the directory
@@ -287,31 +374,34 @@ def get_files():
     data = os.getcwd()
 
     # Determines tests in the most recent test
-    dirs = filter(lambda d: os.path.isdir(d), os.listdir(data))
-    dirs = [os.path.join(data, d) for d in dirs]
-
-    file_paths = []
-
-    # Gets the job_info files from .tgz files
-    for dir in dirs:
-        for file in os.listdir(dir):
-            # Finds the tar files and extracts only job_info file
-            if file.endswith(".tgz"):
-                tmp = os.path.join(dir, file)
-                file_name = os.path.join(data,
-                                         os.path.splitext(file)[0])
-                # Extracts the job_info file
-                tarfile.open(tmp).extract(os.path.splitext(file)[0]
-                                          +"/job_info")
-                file_name = file_name+"/job_info"
-
-                file_here = os.path.join(dir, file_name)
-                file_paths.append(file_here)
-
-    # List of directories with file_name (e.g. job_info)
+    dirs = sorted(d for d in os.listdir(data) if os.path.isdir(d))
+
+    file_paths = {}
+
+    for test in dirs:
+        if job_info_dir is not None:
+            copy = os.path.join(job_info_dir, f"{test}.job_info")
+            if os.path.isfile(copy):
+                file_paths[test] = copy
+                continue
+
+        # Gets the job_info file in the last .tgz (or .zip) file, which is
+        # read from the archive without extracting it
+        archives = sorted(f for f in os.listdir(os.path.join(data, test))
+                          if f.endswith((".tgz", ".zip")))
+        if archives:
+            file_paths[test] = os.path.join(data, test, archives[-1], "job_info")
+
     return file_paths
 
 
+def get_files(job_info_dir=None):
+    # Returns the paths of the job_info file of each test
+
+
+    return list(get_test_files(job_info_dir).values())
+
+
 def get_frac(covered, no_cover):
     # Determines the percentage of the parameters that were covered
     # by the test suite
@@ -360,24 +450,5 @@ def output_coverage(output_name, covered, no_cover, covered_frac,
                 .format(len(specific)))
 
 
-def remove_duplicates(all_params):
-    # Removes all of the duplicate parameters and provides it as a set
-    # and gives its length
-
-
-    return list(set(all_params)), len(list(set(all_params)))
-
-def clean(file_paths):
-    # Removes all of the files and directories created to produce the
-    # coverage reports, but it will not delete the coverage reports
-
-
-    for i in range(0,len(file_paths)):
-
-        os.remove(file_paths[i])
-        directory = file_paths[i].replace("/job_info","")
-        os.rmdir(directory)
-
-
 if __name__ == '__main__':
     main()
@@ -1,5 +1,8 @@
+import json
 import os
 
+import comparison
+
 import test_coverage as coverage
 
 CSS_CONTENTS = \
@@ -63,6 +66,7 @@ td.failed {background-color: red; color: yellow; opacity: 0.8;}
 td.compfailed {background-color: purple; color: yellow; opacity: 0.8;}
 td.crashed {background-color: black; color: yellow; opacity: 0.8;}
 td.benchmade {background-color: orange; opacity: 0.8;}
+td.skipped {background-color: #cccccc; opacity: 0.8;}
 td.date {background-color: #666666; color: white; opacity: 0.8; font-weight: bold;}
 
 .maintable tr:hover {background-color: blue;}
@@ -122,6 +126,7 @@ div.verticaltext {text-align: center;
 #summary td.benchmade {background-color: orange;}
 #summary td.compfailed {background-color: purple; color: yellow;}
 #summary td.crashed {background-color: black; color: yellow;}
+#summary td.skipped {background-color: #cccccc;}
 
 div.small {font-size: 75%;}
 
@@ -196,10 +201,17 @@ r"""
 """
 
 def create_css(table_height=16):
-    """ write the css file for the webpages """
+    """ write the css file for the webpages, unless it is there already """
 
     css = CSS_CONTENTS.replace("@TABLEHEIGHT@", f"{table_height}em")
 
+    try:
+        with open("tests.css") as cf:
+            if cf.read() == css:
+                return
+    except OSError:
+        pass
+
     with open("tests.css", 'w') as cf:
         cf.write(css)
 
@@ -307,23 +319,79 @@ class HTMLTable:
                 self.hf.write("</div>\n")
 
 
+def write_comparison_table(hf, test, diff):
+    """ write the plotfile comparison errors of a test as an HTML table,
+        highlighting the entries that fail the test's tolerances """
+
+    for msg in diff.errors:
+        hf.write(f"<p>{msg}</p>\n")
+
+    ht = HTMLTable(hf, columns=3, divs=["summary", "compare"])
+    ht.start_table()
+    ht.header(["variable name", "absolute error", "relative error"])
+    ht.header([" ", "(||A - B||)", "(||A - B||/||A||)"])
+
+    failed = diff.failures(*test.tolerances_for(diff.variables, diff.nlevels))
+    rel_err = diff.rel_err
+
+    for lev in range(diff.nlevels):
+        ht.print_single_row(f"level = {lev}")
+
+        for iv, var in enumerate(diff.variables):
+            if diff.has_nan[iv, lev]:
+                ht.print_row([var, ("&lt; NaN present &gt;", "colspan='2'")])
+            else:
+                ht.print_row([var, diff.abs_err[iv, lev], rel_err[iv, lev]],
+                             highlight=failed[iv, lev])
+
+        for var in diff.missing:
+            ht.print_row([var, ("&lt; variable not present &gt;", "colspan='2'")])
+
+    ht.end_table()
+
+def write_particle_table(hf, test, pdiff):
+    """ write the per-component errors of one particle type as an HTML
+        table, highlighting the components that fail """
+
+    hf.write(f"<p>particle type: {pdiff.ptype}</p>\n")
+    for msg in pdiff.errors:
+        hf.write(f"<p>{msg}</p>\n")
+
+    ht = HTMLTable(hf, columns=3, divs=["summary", "compare"])
+    ht.start_table()
+    ht.header(["component", "absolute error", "relative error"])
+
+    failed = pdiff.failures(test.particle_tolerance, test.particle_abs_tolerance)
+    rel_err = pdiff.rel_err
+
+    for i, comp in enumerate(pdiff.components):
+        if pdiff.has_nan[i]:
+            ht.print_row([comp, ("&lt; NaN present &gt;", "colspan='2'")])
+        else:
+            ht.print_row([comp, pdiff.abs_err[i], rel_err[i]], highlight=failed[i])
+
+    ht.end_table()
+
 def get_particle_compare_command(diff_lines):
     for line in diff_lines:
         if line.find('particle_compare') > 0:
             return line
 
 
-def report_single_test(suite, test, tests, failure_msg=None):
+def report_single_test(suite, test, tests, failure_msg=None, status=True, page=True):
     """ generate a single problem's test result page.  If
         failure_msg is set to a string, then it is assumed
         that the test did not complete.  The string will
-        be reported on the test page as the error. """
+        be reported on the test page as the error.  status
+        and page select whether the status file and the
+        page are written, so the pages can be written
+        later, all together """
 
     # for navigation
     tnames = [t.name for t in tests]
     current_index = tnames.index(test.name)
 
-    if not failure_msg is None:
+    if not failure_msg is None and status:
         suite.log.testfail("aborting test")
         suite.log.testfail(failure_msg)
 
@@ -354,41 +422,53 @@ def report_single_test(suite, test, tests, failure_msg=None):
                     diff_lines = cf.readlines()
                     cf.close()
 
+                # the structured plotfile comparison results -- these are
+                # also stored in the web directory
+                if (test.comparison is None and not test.particle_comparisons and
+                        os.path.isfile(f"{test.name}.compare.json")):
+                    with open(f"{test.name}.compare.json") as jf:
+                        results = json.load(jf)
+                    if results["mesh"] is not None:
+                        test.comparison = comparison.PlotfileDiff.from_dict(results["mesh"])
+                    test.particle_comparisons = [comparison.ParticleDiff.from_dict(p)
+                                                 for p in results["particles"]]
+
             # last check: did we produce any backtrace files?
             if test.crashed:
                 compare_successful = False
 
-        # write out the status file for this problem, with either
-        # PASSED, PASSED SLOWLY, COMPILE FAILED, or FAILED
-        status_file = f"{test.name}.status"
-        with open(status_file, 'w') as sf:
-            if (compile_successful and
-                (test.compileTest or ((not test.compileTest) and
-                                      compare_successful and analysis_successful))):
-                string = "PASSED\n"
-                if test.check_performance:
-                    meets_threshold, _, _ = test.measure_performance()
-                    if not (meets_threshold is None or meets_threshold):
-                        string = "PASSED SLOWLY\n"
-                sf.write(string)
-                suite.log.success(f"{test.name} PASSED")
-            elif not compile_successful:
-                sf.write("COMPILE FAILED\n")
-                suite.log.testfail(f"{test.name} COMPILE FAILED")
-            elif test.crashed:
-                sf.write("CRASHED\n")
-                if len(test.backtrace) > 0:
-                    if suite.verbose > 0:
-                        for btf in test.backtrace:
-                            suite.log.warn(f"+++ Next backtrace: {btf} +++")
-                            suite.log.warn(open(btf).read())
-                            suite.log.warn(f"+++ End of backtrace: {btf} +++\n")
-                    suite.log.testfail(f"{test.name} CRASHED (backtraces produced)")
+        if status:
+            # write out the status file for this problem, with either
+            # PASSED, PASSED SLOWLY, COMPILE FAILED, or FAILED
+            status_file = f"{test.name}.status"
+            with open(status_file, 'w') as sf:
+                if (compile_successful and
+                    (test.compileTest or ((not test.compileTest) and
+                                          compare_successful and analysis_successful))):
+                    string = "PASSED\n"
+                    if test.check_performance:
+                        meets_threshold, _, _ = test.measure_performance()
+                        if not (meets_threshold is None or meets_threshold):
+                            string = "PASSED SLOWLY\n"
+                    sf.write(string)
+                    suite.log.success(f"{test.name} PASSED")
+                elif not compile_successful:
+                    sf.write("COMPILE FAILED\n")
+                    suite.log.testfail(f"{test.name} COMPILE FAILED")
+                elif test.crashed:
+                    sf.write("CRASHED\n")
+                    if len(test.backtrace) > 0:
+                        if suite.verbose > 0:
+                            for btf in test.backtrace:
+                                suite.log.warn(f"+++ Next backtrace: {btf} +++")
+                                suite.log.warn(open(btf).read())
+                                suite.log.warn(f"+++ End of backtrace: {btf} +++\n")
+                        suite.log.testfail(f"{test.name} CRASHED (backtraces produced)")
+                    else:
+                        suite.log.testfail(f"{test.name} CRASHED (script failed)")
                 else:
-                    suite.log.testfail(f"{test.name} CRASHED (script failed)")
-            else:
-                sf.write("FAILED\n")
-                suite.log.testfail(f"{test.name} FAILED")
+                    sf.write("FAILED\n")
+                    suite.log.testfail(f"{test.name} FAILED")
 
     else:
         # we came in already admitting we failed...
@@ -397,10 +477,15 @@ def report_single_test(suite, test, tests, failure_msg=None):
         else:
             msg = "FAILED"
 
-        status_file = f"{test.name}.status"
-        with open(status_file, 'w') as sf:
-            sf.write(f"{msg}\n")
-        suite.log.testfail(f"{test.name} {msg}")
+        if status:
+            status_file = f"{test.name}.status"
+            with open(status_file, 'w') as sf:
+                sf.write(f"{msg}\n")
+            suite.log.testfail(f"{test.name} {msg}")
+
+    if not page:
+        os.chdir(current_dir)
+        return
 
 
     #--------------------------------------------------------------------------
@@ -550,6 +635,19 @@ def report_single_test(suite, test, tests, failure_msg=None):
             ll.item(f"<a href=\"{test.name}.job_info\">job_info</a>")
         ll.outdent()
 
+        # metadata of the output, read from the plotfile header
+        header = test.plotfile_header
+        if header is not None:
+            ll.item("Output plotfile:")
+            ll.indent()
+            ll.item(f"{test.compare_file_used}")
+            ll.item(f"Simulation time: {header.time}")
+            ll.item("Levels: {} (grids per level: {})".format(
+                header.nlevels, ", ".join(str(n) for n in header.ngrids)))
+            ll.item("Domain: {} to {}".format(*header.domains[0]))
+            ll.item("Variables ({}): {}".format(header.nvars, ", ".join(header.variables)))
+            ll.outdent()
+
 
         # were there backtrace files?
         if test.crashed:
@@ -568,6 +666,15 @@ def report_single_test(suite, test, tests, failure_msg=None):
                 ll.item("<h3 class=\"passed\">Successful</h3>")
             else:
                 ll.item("<h3 class=\"failed\">Failed</h3>")
+
+            if test.has_diff_locations:
+                diff_file = f"{test.name}.diff.npz"
+                ll.item("Largest differences (<a href=\"{}\">per-box errors</a>):".format(diff_file))
+                ll.indent()
+                for var, lev, (lo, hi), cell, err in comparison.load_locations(diff_file):
+                    ll.item("{}, level {}: {:.10g} at cell {} in box {} to {}".format(
+                        var, lev, err, cell, lo, hi))
+                ll.outdent()
             ll.outdent()
 
         if test.analysisRoutine != "":
@@ -598,6 +705,26 @@ def report_single_test(suite, test, tests, failure_msg=None):
         
         pcomp_line = get_particle_compare_command(diff_lines)
 
+        if test.comparison is not None:
+            # the comparison command
+            if diff_lines and (diff_lines[0].find("fcompare") > 1 or
+                               diff_lines[0].startswith("plotfile comparison:")):
+                hf.write("<tt>"+diff_lines[0]+"</tt>\n")
+
+            write_comparison_table(hf, test, test.comparison)
+
+        for pdiff in test.particle_comparisons:
+            write_particle_table(hf, test, pdiff)
+
+        if test.comparison is not None or test.particle_comparisons:
+            # only particle_compare's output and diffs are left to show
+            # from the text output
+            rest = [n for n, line in enumerate(diff_lines)
+                    if line == pcomp_line or line.strip().startswith("diff ")]
+            diff_lines = diff_lines[rest[0]:] if rest else []
+
+        table_started = False
+
         for line in diff_lines:
             if "number of boxes do not match" in line:
                 box_error = True
@@ -619,12 +746,13 @@ def report_single_test(suite, test, tests, failure_msg=None):
                 break
 
             if not in_diff_region:
-                if line.find("fcompare") > 1:
+                if not table_started and (line.find("fcompare") > 1 or line == pcomp_line):
                     hf.write("<tt>"+line+"</tt>\n")
-                    if pcomp_line:
+                    if pcomp_line and line != pcomp_line:
                         hf.write("<tt>"+pcomp_line+"</tt>\n")
 
                     ht.start_table()
+                    table_started = True
                     continue
 
                 if line.strip().startswith("diff "):
@@ -685,7 +813,7 @@ def report_single_test(suite, test, tests, failure_msg=None):
 
         if in_diff_region:
             hf.write("</pre>\n")
-        else:
+        elif table_started:
             ht.end_table()
 
         if box_error:
@@ -752,6 +880,7 @@ def report_this_test_run(suite, make_benchmarks, note, update_time,
     # keep track of the number of tests that passed and the number that failed
     num_failed = 0
     num_passed = 0
+    num_skipped = 0
 
 
     #--------------------------------------------------------------------------
@@ -786,6 +915,12 @@ def report_this_test_run(suite, make_benchmarks, note, update_time,
     if wall_time > 0:
         hf.write(f"<p><b>wall clock time for all tests:</b> {wall_time} s\n")
 
+    if suite.ccache_stats is not None:
+        stats = suite.ccache_stats
+        hf.write("<p><b>compiler cache:</b> {} hits, {} misses ({:.1f}% hit rate), ".format(
+            stats["hits"], stats["misses"], 100 * stats["hit_rate"]))
+        hf.write("approx. {:.1f} MB served from cache\n".format(stats["saved_bytes"] / 1024**2))
+
     # git info lists
     any_update = any([suite.repos[t].update for t in suite.repos])
 
@@ -848,7 +983,11 @@ def report_this_test_run(suite, make_benchmarks, note, update_time,
             status = None
             with open(status_file) as sf:
                 for line in sf:
-                    if line.find("PASSED") >= 0:
+                    if line.startswith("SKIPPED"):
+                        status = "skipped"
+                        td_class = "skipped"
+                        num_skipped += 1
+                    elif line.find("PASSED") >= 0:
                         status = "passed"
                         td_class = "passed-slowly" if "SLOWLY" in line else "passed"
                         num_passed += 1
@@ -869,7 +1008,11 @@ def report_this_test_run(suite, make_benchmarks, note, update_time,
                         break
 
             row_info = []
-            row_info.append(f"<a href=\"{test.name}.html\">{test.name}</a>")
+            if status == "skipped":
+                # it never ran, so it has no page
+                row_info.append(test.name)
+            else:
+                row_info.append(f"<a href=\"{test.name}.html\">{test.name}</a>")
             row_info.append(test.dim)
             row_info.append(f"<div class='small'>{test.compare_file_used}</div>")
 
@@ -951,8 +1094,13 @@ def report_this_test_run(suite, make_benchmarks, note, update_time,
 
             bench_file = "none"
 
+            skip_reason = None
+
             with open(benchStatusFile) as bf:
                 for line in bf:
+                    if line.startswith("SKIPPED"):
+                        skip_reason = line.partition(":")[2].strip()
+                        break
                     index = line.find("file:")
                     if index >= 0:
                         bench_file = line[index+5:]
@@ -960,7 +1108,10 @@ def report_this_test_run(suite, make_benchmarks, note, update_time,
 
             row_info = []
             row_info.append(f"{test.name}")
-            if bench_file != "none":
+            if skip_reason is not None:
+                row_info.append(("SKIPPED", "class='skipped'"))
+                row_info.append(skip_reason)
+            elif bench_file != "none":
                 row_info.append(("BENCHMARK UPDATED", "class='benchmade'"))
                 row_info.append(f"new benchmark file is {bench_file}")
             else:
@@ -971,6 +1122,9 @@ def report_this_test_run(suite, make_benchmarks, note, update_time,
 
     ht.end_table()
 
+    if num_skipped > 0:
+        hf.write(f"<p><b>The run stopped early:</b> {num_skipped} tests were skipped\n")
+
     # Test coverage
     if suite.reportCoverage:
         report_coverage(hf, suite)
@@ -1037,6 +1191,51 @@ def report_coverage(html_file, suite):
 
     ht.end_table()
 
+    html_file.write("<p><a href=\"../{}\">coverage history and the tests using each parameter</a></p>\n".format(
+        coverage.HISTORY_FILE))
+
+def report_coverage_history(suite, index):
+    """ write the page with the coverage of each run and, for every
+        runtime parameter, the tests that override it """
+
+    title = f"{suite.suiteName} parameter coverage"
+
+    with open(os.path.join(suite.webTopDir, coverage.HISTORY_FILE), "w") as hf:
+        hf.write(HTML_HEADER.replace("@TESTDIR@", suite.suiteName).replace("@TESTNAME@", "coverage"))
+        hf.write(f"<CENTER><H1><A HREF=\"index.html\">{suite.suiteName}</A> / coverage</H1></CENTER>\n")
+
+        # the trend, newest first
+        hf.write("<h3>coverage by run</h3>\n")
+        cols = ["run", "tests read", "coverage %", "# parameters",
+                "nonspecific coverage %", "# nonspecific"]
+        ht = HTMLTable(hf, len(cols), divs=["summary"])
+        ht.start_table()
+        ht.header(cols)
+        for r in reversed(index["runs"]):
+            ht.print_row([f"<a href=\"{r['run']}/index.html\">{r['run']}</a>",
+                          r["tests_read"], f"{100 * r['covered']:.2f}%", r["total"],
+                          f"{100 * r['covered_nonspecific']:.2f}%", r["total_nonspecific"]])
+        ht.end_table()
+
+        # what exercises each parameter
+        hf.write("<h3>tests using each parameter</h3>\n")
+        params = sorted({p for v in index["tests"].values() for p in v["parameters"]})
+        cols = ["parameter", "overridden by (value)", "default in"]
+        ht = HTMLTable(hf, len(cols), divs=["summary"])
+        ht.start_table()
+        ht.header(cols)
+        for param in params:
+            overridden, default = coverage.parameter_users(index, param)
+            if overridden:
+                tests = ", ".join(f"{t} ({v})" for t, v in overridden.items())
+                ht.print_row([param, tests, len(default)])
+            else:
+                ht.print_row([(param, "class='failed'"), "not covered", len(default)])
+        ht.end_table()
+
+        hf.write("</div></body>\n")
+        hf.write("</html>\n")
+
 def report_all_runs(suite, active_test_list, max_per_page=50):
 
     table_height = min(max(suite.lenTestName, 4), 18)
@@ -28,6 +28,12 @@ The "main" block specifies the global test suite parameters:
   isSuperbuild   = < 0: pre-build AMReX and source (default)
                      1: CMake downloads AMReX and needs separate configure & build >
 
+  cmakeBuildRoot = < directory for the CMake build trees, default is
+                     testTopDir/suiteName-cmake-builds/.  A build tree is kept
+                     for each configuration and rebuilt incrementally >
+  cmakeBuildQuota = < disk quota for the CMake build trees in GB -- the least
+                      recently used trees are removed past this, default is 50 >
+
   updateGitSubmodules = < 0: don't update submodules when changing git branches (default)
                        1: run `git submodule update --init` after changing git branches >
 
@@ -46,20 +52,67 @@ The "main" block specifies the global test suite parameters:
 
   archive_output = <0: leave all plotfiles in place;
                     1: tar plotfiles after compare (default) >
+  archive_format = < tgz: archive plotfiles as gzipped tarballs (default);
+                    zip: as zip files, which compress each file separately
+                    and index them, so the suite can read any one file of
+                    an archived plotfile (e.g. its Header or job_info)
+                    without decompressing the rest >
   purge_output = <0: leave all plotfiles in place;
                   1: delete plotfiles after compare >
 
+  compare_tool = < fcompare: compare plotfiles with AMReX's fcompare (default);
+                   builtin: use the suite's own differ, which streams the
+                   data through mmap and stops at the first failure >
+  compare_chunk_size = < MB of data the builtin differ reads at a time, default is 64 >
+  compare_jobs = < number of processes the builtin differ splits a comparison
+                   over, by level, variable, and range of boxes.  This is
+                   independent of how the tests themselves are run, default is 1 >
+  locate_differences = < 1: when a plotfile comparison fails, store where the
+                           data differs, box by box, in testname.diff.npz and
+                           list the largest differences on the test's page (default).
+                           This scans the whole data once the comparison fails; with
+                           0, a comparison stops at the first difference beyond the
+                           tolerances and its error table is partial >
+
+  benchmarkVersionsKept = < how many versions of each benchmark to keep.  Every
+                            benchmark update is kept as a new version, named by
+                            its date and source hash, and the benchmark the tests
+                            compare to is a link to the current one (see
+                            --rollback_benchmarks).  0 keeps them all, default is 10 >
+
   MAKE = < name of make >
   numMakeJobs = < number of make jobs >
 
+  realclean_policy = < fingerprint: only do a make realclean in a build directory
+                         when the build configuration (make variables, compiler,
+                         repo hashes) changed since it was last built there (default);
+                       always: make realclean before building every test >
+
+  useCcache = < 1: compile through ccache, using a cache managed by the suite >
+  ccache = < ccache command, default is ccache >
+  ccacheDir = < location of the compiler cache, default is
+                testTopDir/suiteName-ccache/ >
+  ccacheMaxSize = < size cap of the compiler cache -- least recently used
+                    entries are evicted past this, default is 10G >
+
   MPIcommand = < MPI run command, with holders for host, # of proc, command >
 
      This should look something like:
 
           mpiexec -host @host@ -n @nprocs@ @command@ >
 
+     It can also use @cpuset@, the cores of the test as a list (0-3,8),
+     and @binding@, the hex masks of the cores of each rank separated
+     by commas, e.g. srun --cpu-bind=mask_cpu:@binding@ ...
+
   MPIhost = < host for MPI job -- depends on MPI implementation >
 
+  core_binding = < auto: when tests run concurrently (--jobs), give each one
+                     numprocs * numthreads cores of its own, within a NUMA
+                     node if it fits, waiting for them to be free (default);
+                   always: also when tests run one at a time;
+                   none: leave the placement to the OS >
+
   sendEmailWhenFail = < 1: send email when any tests fail >
 
   emailTo = < list of email addresses separated by commas, such as,
@@ -161,6 +214,20 @@ Each test is given its own block, with the general form:
   abs_tolerance = < floating point number representing the largest absolute
                     error permitted between the run output and the benchmark for
                     mesh data, default is 0.0 >
+  tolerance_map = < per-variable tolerances, overriding tolerance and abs_tolerance,
+                    as entries of the form glob[@level] rel=value abs=value,
+                    one per line or separated by semicolons.  Variables are
+                    matched by shell-style globs, @level restricts an entry
+                    to one level, and later entries win, e.g.
+
+                    tolerance_map = * rel=0.0
+                                    Temp@1 rel=1.e-6
+                                    X(*) rel=1.e-10 abs=1.e-14
+
+                    A global --tolerance or --abs_tolerance overrides this >
+  benchmark_version = < compare to this version of the test's benchmarks instead
+                        of the current one: a version id, its date (or a prefix
+                        of it), or the source hash it was made with >
   particle_tolerance = < same as tolerance, for particle comparisons >
   particle_abs_tolerance = < same as tolerance, for particle comparisons >
   outputFile = < explicit output file to compare with -- exactly as it will
@@ -207,6 +274,7 @@ class Log:
 
         self.current_indent = 0
         self.indent_str = ""
+        self.prefix = ""
 
         if output_file is not None:
             try:
@@ -225,7 +293,7 @@ class Log:
     def indent(self):
         """indent the log output by one stop"""
         self.current_indent += 1
-        self.indent_str = self.current_indent*"   "
+        self.indent_str = self.prefix + self.current_indent*"   "
 
     def flush(self):
         """ flush the output file (if it exists) """
@@ -236,7 +304,16 @@ class Log:
         """undo one level of indent"""
         self.current_indent -= 1
         self.current_indent = max(0, self.current_indent)
-        self.indent_str = self.current_indent*"   "
+        self.indent_str = self.prefix + self.current_indent*"   "
+
+    def set_prefix(self, prefix):
+        """start every line with prefix, to tell apart the output of tests
+        run at the same time.  The log file is then written a line at a
+        time, so lines from different processes don't get mixed up"""
+        self.prefix = prefix
+        self.indent_str = self.prefix + self.current_indent*"   "
+        if self.have_log:
+            self.of.reconfigure(line_buffering=True)
 
     def fail(self, string):
         """output a failure message to the log"""
@@ -324,6 +401,7 @@ class Log:
         """close the log"""
         if self.have_log:
             self.of.close()
+            self.have_log = False
 
 
 def get_args(arg_string=None):
@@ -341,6 +419,9 @@ def get_args(arg_string=None):
                              help="a space-separated list of tests to run")
     tests_group.add_argument("-d", type=int, default=-1,
                              help="restrict tests to a particular dimensionality")
+    tests_group.add_argument("--fast_subset", action="store_true",
+                             help="only run a subset of the tests that still overrides every runtime parameter" +
+                             " the full list does, picking fast tests (uses the coverage index and timings of past runs)")
     tests_group.add_argument("--redo_failed", action="store_true",
                              help="only run the tests that failed last time")
     tests_group.add_argument("--keyword", type=str, default=None,
@@ -365,9 +446,30 @@ def get_args(arg_string=None):
     bench_group.add_argument("--copy_benchmarks", type=str, default=None, metavar="comment",
                              help="use plotfiles from failed tests of the last run as new benchmarks." +
                              " No git pull is done and no new runs are performed (must provide a comment)")
+    bench_group.add_argument("--list_benchmark_versions", action="store_true",
+                             help="list the stored versions of the benchmarks of the tests and exit")
+    bench_group.add_argument("--rollback_benchmarks", type=str, default=None, metavar="version",
+                             help="make this version (id, date, or source hash) of the benchmarks of the tests" +
+                             " the current one, or 'previous' for the one before it, and exit")
 
     run_group = parser.add_argument_group("test running options",
                                           "options that control how the tests are run")
+    run_group.add_argument("-j", "--jobs", type=int, default=1, metavar="N",
+                           help="build and run up to N tests at once, each in a process of its own." +
+                           " Tests that build in the same directory are built one at a time")
+    run_group.add_argument("--test_order", type=str, default=None, choices=["name", "lpt"],
+                           help="order to run the tests in: by name, or longest expected time first (lpt)," +
+                           " keeping tests that share an executable together.  The default is lpt with --jobs")
+    run_group.add_argument("--throughput", action="store_true",
+                           help="cut the fixed cost of each test, for suites of many short ones:" +
+                           " with --jobs, keep one process per job running tests back to back," +
+                           " reuse executables built the same way, and write the test pages at the end")
+    run_group.add_argument("--fail_fast", type=int, default=0, metavar="N",
+                           help="stop once N tests have failed: the remaining tests are skipped" +
+                           " and the ones running are cancelled.  The report covers what ran")
+    run_group.add_argument("--skip_broken_builds", action="store_true",
+                           help="once a test fails to compile, skip the remaining tests that" +
+                           " build in the same directory")
     run_group.add_argument("--compile_only", action="store_true",
                            help="test only that the code compiles, without running anything")
     run_group.add_argument("--with_valgrind", action="store_true",
@@ -391,6 +493,9 @@ def get_args(arg_string=None):
                                help="a note on the resulting test webpages")
     suite_options.add_argument("--complete_report_from_crash", type=str, default="", metavar="testdir",
                                help="complete report generation from a crashed test suite run named testdir")
+    suite_options.add_argument("--resume", type=str, default="", metavar="testdir",
+                               help="carry on with the interrupted run named testdir, from its journal:" +
+                               " tests it finished are not run again")
     suite_options.add_argument("--log_file", type=str, default=None, metavar="logfile",
                                help="log file to write output to (in addition to stdout")
     suite_options.add_argument("--clean_testdir", action="store_true",
@@ -487,3 +592,13 @@ def get_recent_filename(fdir, base, extension):
         return files.pop()
     except:
         return None
+
+
+# the directories of the runs of a suite are named by date, with a run
+# number after the first run of the day: 2024-05-01, 2024-05-01-002, ...
+RUN_DIR_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}(-\d{3})?$")
+
+def is_run_dir(name):
+    """ is name that of the directory of a run of the suite? """
+
+    return RUN_DIR_PATTERN.match(name.rstrip("/")) is not None
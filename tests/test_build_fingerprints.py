@@ -0,0 +1,44 @@
+"""tests that share a build directory but not a build configuration must
+not make realclean each other's objects"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import suite
+import test_util
+
+def make_suite(tmp_path, fingerprints):
+    """ a suite whose tests build with the (config, fingerprint) given
+        for their name in fingerprints """
+
+    mysuite = suite.Suite(test_util.get_args(arg_string=["tests.ini"]))
+    mysuite.testTopDir = str(tmp_path) + "/"
+    mysuite.get_build_fingerprint = lambda test: fingerprints[test.name]
+    return mysuite
+
+def test_new_configuration_is_built_without_realclean(tmp_path):
+    mysuite = make_suite(tmp_path, {"dim2": ('{"DIM": "2"}', "a"),
+                                    "dim3": ('{"DIM": "3"}', "a")})
+    dim2, dim3 = suite.Test("dim2"), suite.Test("dim3")
+
+    assert not mysuite.needs_realclean(dim2, "bdir")
+    mysuite.record_build(dim2, "bdir")
+
+    assert not mysuite.needs_realclean(dim3, "bdir")
+    mysuite.record_build(dim3, "bdir")
+
+    # both configurations are remembered, so neither cleans the other
+    assert not mysuite.needs_realclean(dim2, "bdir")
+    assert not mysuite.needs_realclean(dim3, "bdir")
+
+def test_changed_configuration_is_realcleaned(tmp_path):
+    fingerprints = {"dim2": ('{"DIM": "2"}', "a")}
+    mysuite = make_suite(tmp_path, fingerprints)
+    dim2 = suite.Test("dim2")
+
+    mysuite.record_build(dim2, "bdir")
+    fingerprints["dim2"] = ('{"DIM": "2"}', "b")
+
+    assert mysuite.needs_realclean(dim2, "bdir")
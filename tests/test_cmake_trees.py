@@ -0,0 +1,60 @@
+"""the CMake build tree index is shared by the tests of a run, which
+configure trees in processes of their own"""
+
+import json
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import suite
+import test_util
+
+def make_suite(tmp_path):
+    """ a suite with its CMake build trees under tmp_path, and no room
+        for any of them """
+
+    mysuite = suite.Suite(test_util.get_args(arg_string=["tests.ini"]))
+    mysuite.log = test_util.Log()
+    mysuite.cmakeBuildRoot = str(tmp_path / "builds") + "/"
+    mysuite.full_test_dir = str(tmp_path / "run") + "/"
+    mysuite.cmakeBuildQuota = 0
+    return mysuite
+
+def make_tree(mysuite, name):
+    builddir = os.path.join(mysuite.get_cmake_build_root(), name)
+    os.makedirs(builddir)
+    with open(os.path.join(builddir, "CMakeCache.txt"), "w") as f:
+        f.write("x" * 4096)
+    return builddir
+
+def touch_trees(mysuite, builddirs):
+    for builddir in builddirs:
+        mysuite.touch_cmake_tree(builddir, os.path.basename(builddir), "")
+
+def test_trees_used_by_children_are_kept(tmp_path):
+    mysuite = make_suite(tmp_path)
+    used = [make_tree(mysuite, f"used-{i}") for i in range(8)]
+
+    old_suite = make_suite(tmp_path)
+    old_suite.full_test_dir = str(tmp_path / "old-run") + "/"
+    unused = make_tree(mysuite, "unused")
+    old_suite.touch_cmake_tree(unused, "unused", "")
+
+    # the trees are configured by tests running at the same time
+    context = multiprocessing.get_context("fork")
+    children = [context.Process(target=touch_trees, args=(mysuite, used[i::4]))
+                for i in range(4)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join()
+
+    with open(os.path.join(mysuite.get_cmake_build_root(), "index.json")) as f:
+        assert set(json.load(f)) == set(used) | {unused}
+
+    mysuite.cmake_clean()
+
+    assert all(os.path.isdir(d) for d in used)
+    assert not os.path.isdir(unused)
@@ -0,0 +1,53 @@
+"""the throughput mode's executable cache must tell apart the tests that
+build different executables"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import regtest
+import suite
+import test_util
+
+def make_suite(tmp_path):
+    """ a suite using CMake, with all of its tests in one build tree """
+
+    mysuite = suite.Suite(test_util.get_args(arg_string=["tests.ini"]))
+    mysuite.useCmake = 1
+    mysuite.source_build_dir = str(tmp_path / "build")
+    mysuite.full_test_dir = str(tmp_path / "run") + "/"
+    return mysuite
+
+def make_test(name, target, cmake_opts=""):
+    test = suite.Test(name)
+    test.target = target
+    test.cmakeSetupOpts = cmake_opts
+    return test
+
+def test_cmake_targets_are_cached_apart(tmp_path):
+    mysuite = make_suite(tmp_path)
+
+    first = make_test("first", "exe_a")
+    second = make_test("second", "exe_b")
+
+    assert regtest.get_executable_cache(mysuite, first) != \
+        regtest.get_executable_cache(mysuite, second)
+
+def test_cmake_configure_options_are_cached_apart(tmp_path):
+    mysuite = make_suite(tmp_path)
+
+    first = make_test("first", "exe_a")
+    second = make_test("second", "exe_a", cmake_opts="-DFOO=ON")
+
+    assert regtest.get_executable_cache(mysuite, first) != \
+        regtest.get_executable_cache(mysuite, second)
+
+def test_same_cmake_build_is_shared(tmp_path):
+    mysuite = make_suite(tmp_path)
+
+    first = make_test("first", "exe_a")
+    second = make_test("second", "exe_a")
+
+    assert regtest.get_executable_cache(mysuite, first) == \
+        regtest.get_executable_cache(mysuite, second)
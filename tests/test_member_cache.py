@@ -0,0 +1,32 @@
+"""the contents of archived plotfile members kept between variables must
+stay within MEMBER_CACHE_BYTES"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import comparison
+
+def test_least_recently_used_members_are_dropped(monkeypatch):
+    monkeypatch.setattr(comparison, "MEMBER_CACHE_BYTES", 100)
+    monkeypatch.setattr(comparison.plotfile, "read_file", lambda f: bytes(40))
+    comparison.drop_members()
+
+    comparison.get_map("a.tgz/Cell_D_00000")
+    comparison.get_map("a.tgz/Cell_D_00001")
+    comparison.get_map("a.tgz/Cell_D_00000")
+    comparison.get_map("a.tgz/Cell_D_00002")
+
+    assert list(comparison._members) == ["a.tgz/Cell_D_00000", "a.tgz/Cell_D_00002"]
+    assert comparison._members_bytes == 80
+    comparison.drop_members()
+
+def test_members_larger_than_the_cache_are_not_kept(monkeypatch):
+    monkeypatch.setattr(comparison, "MEMBER_CACHE_BYTES", 100)
+    monkeypatch.setattr(comparison.plotfile, "read_file", lambda f: bytes(200))
+    comparison.drop_members()
+
+    assert len(comparison.get_map("a.tgz/Cell_D_00000")) == 200
+    assert not comparison._members
+    assert comparison._members_bytes == 0